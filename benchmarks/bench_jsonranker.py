@@ -0,0 +1,38 @@
+"""
+Scaling benchmark for sortpgscore.graphsortattribute.
+
+Run from the repository root:
+    python benchmarks/bench_jsonranker.py
+"""
+import os
+import random
+import sys
+import time
+
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src import RoadmapGen as rmg
+
+def build_graph(size: int, seed: int = 0) -> nx.DiGraph:
+    rng = random.Random(seed)
+    graph = nx.DiGraph()
+    for node in range(size):
+        # Scores are rounded so that ties, which share a dense rank, are common
+        graph.add_node(node, title=f"Topic {node % (size // 2 + 1)}", pagerank=round(rng.random() / size, 8))
+        if node:
+            graph.add_edge(rng.randrange(node), node)
+    return graph
+
+def main():
+    titlesort = rmg.sortpgscore()
+    print(f"{'nodes':>8} {'seconds':>10} {'us/node':>10}")
+    for size in (1000, 2500, 5000, 10000, 20000):
+        graph = build_graph(size)
+        start = time.perf_counter()
+        titlesort.graphsortattribute(graph)
+        elapsed = time.perf_counter() - start
+        print(f"{size:>8} {elapsed:>10.4f} {elapsed / size * 1e6:>10.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Per-stage benchmark of the roadmap pipeline, fully offline.
+
+Every stage (generation, resources, PageRank, fixer, sort, merge, expand) runs over
+synthetic roadmaps of growing depth and branching, using FakeLLMClient and
+FakeSerperTransport instead of OpenAI and Serper. For each stage the wall time, the
+number of LLM/Serper calls and the peak traced memory are recorded and compared
+against a stored baseline.
+
+Run from the repository root:
+    python benchmarks/bench_pipeline.py                  # compare with benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --save-baseline  # record a new baseline
+    python benchmarks/bench_pipeline.py --llm-latency 0.05 --serper-latency 0.1
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import networkx as nx
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src import RoadmapGen as rmg
+from benchmarks.fakes import FakeLLMClient, FakeSerperTransport
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+# (depth, branching) of the synthetic roadmaps, from small to large
+SIZES = [(2, 3), (3, 3), (3, 5), (4, 4), (5, 4)]
+QUICK_SIZES = [(2, 3), (3, 3)]
+
+class StageResult:
+    def __init__(self, name: str, seconds: float, peak_bytes: int, llm_calls: int, serper_requests: int, serper_queries: int, nodes: int, edges: int):
+        self.name = name
+        self.seconds = seconds
+        self.peak_bytes = peak_bytes
+        self.llm_calls = llm_calls
+        self.serper_requests = serper_requests
+        self.serper_queries = serper_queries
+        self.nodes = nodes
+        self.edges = edges
+
+    def to_dict(self):
+        return dict(vars(self))
+
+def measure(name, fn, llm: FakeLLMClient, serper: FakeSerperTransport):
+    llm_before = llm.total_calls
+    requests_before, queries_before = serper.requests, serper.queries
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    graph = fn()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = StageResult(
+        name=name,
+        seconds=seconds,
+        peak_bytes=peak,
+        llm_calls=llm.total_calls - llm_before,
+        serper_requests=serper.requests - requests_before,
+        serper_queries=serper.queries - queries_before,
+        nodes=graph.number_of_nodes(),
+        edges=graph.number_of_edges(),
+    )
+    return graph, result
+
+def run_size(depth: int, branching: int, args) -> list:
+    # A vocabulary ten times the expected size keeps most topics distinct, like real roadmaps
+    expected_nodes = sum(branching ** level for level in range(depth + 1))
+    llm = FakeLLMClient(fan_out=branching, vocabulary=expected_nodes * 10, latency=args.llm_latency, variant_rate=0.1, seed=args.seed)
+    serper = FakeSerperTransport(latency=args.serper_latency)
+    http_client = serper.client()
+
+    canonicalizer = rmg.TopicCanonicalizer() if args.canonicalize else None
+    generator = rmg.Generator(client=llm, max_workers=args.workers, batch_size=args.batch_size, canonicalizer=canonicalizer)
+    websearch = rmg.ResourceFinder(SERPER_API_KEY="offline", http_client=http_client)
+    pagerank = rmg.ranker()
+    graphfix = rmg.GraphFixer()
+    titlesort = rmg.sortpgscore()
+    redundant_fixer = rmg.RedundantFunc(client=llm, max_workers=args.workers)
+    nodeexpander = rmg.NodeExpand(client=llm, SERPER_API_KEY="offline", max_workers=args.workers, http_client=http_client)
+
+    results = []
+    roadmap, result = measure("generate", lambda: generator.generate_roadmap(prompt="Learn Topic 0", depth=depth, retries=2), llm, serper)
+    results.append(result)
+
+    merged, result = measure("merge", lambda: redundant_fixer.remove_redundant_nodes(roadmap.copy(), retries=2), llm, serper)
+    results.append(result)
+
+    roadmap, result = measure("resources", lambda: websearch.serp_recommendation_graph(roadmap, SERPER_API_KEY="offline"), llm, serper)
+    results.append(result)
+
+    roadmap, result = measure("pagerank", lambda: pagerank.get_page_rank(roadmap), llm, serper)
+    results.append(result)
+
+    roadmap, result = measure("fixer", lambda: graphfix.fix_graph(roadmap), llm, serper)
+    results.append(result)
+
+    roadmap, result = measure("sort", lambda: titlesort.graphsortattribute(roadmap), llm, serper)
+    results.append(result)
+
+    # Expand the highest ranked leaf, as a user clicking on it would
+    leaves = [node for node in roadmap.nodes if roadmap.out_degree(node) == 0]
+    target = max(leaves, key=lambda node: roadmap.nodes[node].get('rank', 0))
+    _, result = measure("expand", lambda: nodeexpander.expand_target_node(target, graph=roadmap.copy(), depth=2, retries=2), llm, serper)
+    results.append(result)
+
+    http_client.close()
+    return results
+
+def compare(current: dict, baseline: dict, time_tolerance: float, min_seconds: float) -> list:
+    """Return human readable regressions of `current` against `baseline`."""
+    regressions = []
+    for size, stages in current.items():
+        for stage, result in stages.items():
+            reference = baseline.get(size, {}).get(stage)
+            if reference is None:
+                continue
+            label = f"{size} {stage}"
+            for counter in ("llm_calls", "serper_requests", "serper_queries"):
+                if result[counter] > reference[counter]:
+                    regressions.append(f"{label}: {counter} {reference[counter]} -> {result[counter]}")
+            if result["seconds"] > max(reference["seconds"] * time_tolerance, min_seconds):
+                regressions.append(f"{label}: {reference['seconds']:.4f}s -> {result['seconds']:.4f}s")
+            if result["peak_bytes"] > max(reference["peak_bytes"] * time_tolerance, 1 << 20):
+                regressions.append(f"{label}: peak memory {reference['peak_bytes']} -> {result['peak_bytes']} bytes")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="only run the small sizes")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent LLM calls per level")
+    parser.add_argument("--batch-size", type=int, default=1, help="sibling leaves expanded per LLM call")
+    parser.add_argument("--canonicalize", action="store_true", help="join near-duplicate topics while generating")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds every fake LLM call takes")
+    parser.add_argument("--serper-latency", type=float, default=0.0, help="seconds every fake Serper request takes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="allowed slowdown factor before a stage counts as a regression")
+    parser.add_argument("--min-seconds", type=float, default=0.05, help="stages faster than this never count as time regressions")
+    args = parser.parse_args()
+
+    current = {}
+    print(f"{'size':>8} {'stage':>10} {'nodes':>7} {'edges':>7} {'seconds':>9} {'peak KiB':>9} {'llm':>6} {'serper':>7} {'queries':>8}")
+    for depth, branching in (QUICK_SIZES if args.quick else SIZES):
+        size = f"d{depth}b{branching}"
+        current[size] = {}
+        for result in run_size(depth, branching, args):
+            current[size][result.name] = result.to_dict()
+            print(f"{size:>8} {result.name:>10} {result.nodes:>7} {result.edges:>7} {result.seconds:>9.4f} {result.peak_bytes / 1024:>9.0f} {result.llm_calls:>6} {result.serper_requests:>7} {result.serper_queries:>8}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare against, run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(current, baseline, args.tolerance, args.min_seconds)
+    if regressions:
+        print("Regressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("No regressions against the baseline")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""
+Deterministic offline stand-ins for the OpenAI/instructor client and Serper, used by the
+benchmarks and tests. They are not part of the RoadmapGen package.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from src.RoadmapGen import CandidateBlocker, MergedTopic, RedundantGroup, TopicInfo, TopicInfoBatch
+
+def _digest(*parts: Any) -> int:
+    return int(hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest(), 16)
+
+class FakeRateLimitError(Exception):
+    """Raised by FakeLLMClient for a throttled call, shaped like openai.RateLimitError."""
+
+    status_code = 429
+
+    def __init__(self, retry_after: float = 0.0):
+        super().__init__("Rate limit reached (fake)")
+        self.headers = {"retry-after": str(retry_after)}
+
+class _Completions:
+    def __init__(self, owner: "FakeLLMClient"):
+        self._owner = owner
+
+    def create(self, model: str, response_model, messages: List[Dict[str, str]], **kwargs):
+        return self._owner.respond(model, response_model, messages)
+
+class _Chat:
+    def __init__(self, owner: "FakeLLMClient"):
+        self.completions = _Completions(owner)
+
+class FakeLLMClient:
+    """
+    Deterministic offline stand-in for an `instructor.from_openai(OpenAI(...))` client.
+
+    Answers are derived from a hash of the prompt, so the same prompt always gets the
+    same answer and whole pipelines are reproducible without an API key.
+
+    Parameters:
+    fan_out (int): Number of prerequisite topics returned per expansion.
+    vocabulary (int): Size of the topic name pool; smaller pools give more shared topics.
+    latency (float): Seconds every call sleeps, to mimic a network round trip.
+    jitter (float): Extra per-call sleep up to this many seconds, derived from the prompt.
+    variant_rate (float): Share of topic names returned as a near-duplicate such as
+    "Basics of Topic 12", to exercise redundancy merging.
+    batch_miss_rate (float): Share of topics left out of batched (TopicInfoBatch) answers,
+    to exercise the one-by-one retries.
+    throttle_rate (float): Share of calls failing with a FakeRateLimitError, to exercise
+    the retries and backoff of a CallController.
+    seed (int): Changes every answer while keeping them deterministic.
+    """
+
+    def __init__(self, fan_out: int = 3, vocabulary: int = 100000, latency: float = 0.0, jitter: float = 0.0, variant_rate: float = 0.0, batch_miss_rate: float = 0.0, throttle_rate: float = 0.0, seed: int = 0):
+        self.fan_out = fan_out
+        self.vocabulary = vocabulary
+        self.latency = latency
+        self.jitter = jitter
+        self.variant_rate = variant_rate
+        self.batch_miss_rate = batch_miss_rate
+        self.throttle_rate = throttle_rate
+        self.throttled = 0
+        self.seed = seed
+        self.chat = _Chat(self)
+        self.calls: Dict[str, int] = {}
+        self._blocker = CandidateBlocker()
+        self._lock = threading.Lock()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def _sleep(self, prompt: str) -> None:
+        delay = self.latency
+        if self.jitter:
+            delay += self.jitter * (_digest(self.seed, 'jitter', prompt) % 1000) / 1000
+        if delay:
+            time.sleep(delay)
+
+    def _topic_name(self, parent: str, index: int) -> str:
+        number = _digest(self.seed, parent, index) % self.vocabulary
+        if self.variant_rate and _digest(self.seed, 'variant', parent, index) % 1000 < self.variant_rate * 1000:
+            return f"Basics of Topic {number}"
+        return f"Topic {number}"
+
+    def respond(self, model: str, response_model, messages: List[Dict[str, str]]):
+        prompt = messages[-1]['content']
+        with self._lock:
+            self.calls[response_model.__name__] = self.calls.get(response_model.__name__, 0) + 1
+            # Which calls are throttled depends on their order, so a retried prompt can get through
+            throttled = self.throttle_rate and _digest(self.seed, 'throttle', self.total_calls) % 1000 < self.throttle_rate * 1000
+            if throttled:
+                self.throttled += 1
+        if throttled:
+            raise FakeRateLimitError()
+        self._sleep(prompt)
+
+        if response_model is TopicInfo:
+            return self._topic_info(prompt)
+        if response_model is TopicInfoBatch:
+            return self._topic_info_batch(prompt)
+        if response_model is RedundantGroup:
+            return self._redundant_group(prompt)
+        if response_model is MergedTopic:
+            return self._merged_topic(prompt)
+        raise TypeError(f"FakeLLMClient cannot answer {response_model.__name__}")
+
+    def _topic_info(self, prompt: str) -> TopicInfo:
+        match = re.search(r"Current Topic: (.*)", prompt)
+        return self._expand(match.group(1).strip() if match else prompt.strip())
+
+    def _topic_info_batch(self, prompt: str) -> TopicInfoBatch:
+        # Every topic gets the answer it would get on its own, unless it is dropped
+        topics = [topic.strip() for topic in re.findall(r"Current Topic: (.*)", prompt)]
+        return TopicInfoBatch(topics=[
+            self._expand(topic) for topic in topics
+            if _digest(self.seed, 'miss', topic) % 1000 >= self.batch_miss_rate * 1000
+        ])
+
+    def _expand(self, topic: str) -> TopicInfo:
+        children = [self._topic_name(topic, index) for index in range(self.fan_out)]
+        return TopicInfo(
+            topic=topic,
+            description=f"What to know about {topic}",
+            prerequisite_topics=children,
+            description_prerequisite_topics=[f"What to know about {child}" for child in children],
+        )
+
+    def _titles(self, prompt: str) -> List[str]:
+        return [line.split('\t')[0] for line in prompt.splitlines() if line.strip()]
+
+    def _redundant_group(self, prompt: str) -> RedundantGroup:
+        # Topics with the same normalized tokens ("Topic 7", "Basics of Topic 7") are redundant
+        groups: Dict[frozenset, List[str]] = {}
+        for title in self._titles(prompt):
+            groups.setdefault(frozenset(self._blocker.tokens(title)), []).append(title)
+        return RedundantGroup(group=[group for group in groups.values() if len(group) > 1])
+
+    def _merged_topic(self, prompt: str) -> MergedTopic:
+        titles = sorted(self._titles(prompt), key=len)
+        return MergedTopic(topic=titles[0], description=f"What to know about {titles[0]}")
+
+class FakeSerperTransport(httpx.BaseTransport):
+    """
+    Offline stand-in for Serper's /search endpoint as an httpx transport.
+
+    Use it through `httpx.Client(transport=FakeSerperTransport())` or `client()`, e.g. as
+    the `http_client` of a ResourceFinder. Every query gets `results_per_query` organic
+    results derived from the query text. A share `throttle_rate` of requests is answered
+    with 429 and a Retry-After header instead.
+    """
+
+    def __init__(self, results_per_query: int = 5, latency: float = 0.0, per_query_latency: float = 0.0, throttle_rate: float = 0.0):
+        self.results_per_query = results_per_query
+        self.latency = latency
+        self.per_query_latency = per_query_latency
+        self.throttle_rate = throttle_rate
+        self.throttled = 0
+        self.requests = 0
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def client(self) -> httpx.Client:
+        return httpx.Client(transport=self)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path != "/search":
+            return httpx.Response(404, json={"message": "Not found"})
+
+        payload = json.loads(request.read())
+        queries = payload if isinstance(payload, list) else [payload]
+        with self._lock:
+            self.requests += 1
+            if self.throttle_rate and _digest('throttle', self.requests) % 1000 < self.throttle_rate * 1000:
+                self.throttled += 1
+                return httpx.Response(429, headers={"Retry-After": "0"}, json={"message": "Too many requests"})
+            self.queries += len(queries)
+
+        delay = self.latency + self.per_query_latency * len(queries)
+        if delay:
+            time.sleep(delay)
+
+        results = [
+            {
+                "searchParameters": {"q": query["q"]},
+                "organic": [
+                    {
+                        "title": f"{query['q']} result {position}",
+                        "link": f"https://example.com/{_digest(query['q'], position) % 10 ** 8}",
+                        "snippet": f"Result {position} for {query['q']}",
+                        "position": position,
+                    }
+                    for position in range(1, self.results_per_query + 1)
+                ],
+            }
+            for query in queries
+        ]
+        body = results if isinstance(payload, list) else results[0]
+        return httpx.Response(200, json=body)
@@ -1,18 +1,27 @@
 import os
 from dotenv import load_dotenv
 
+# Progress bars cost CPU and flood the logs when many requests run at once; tqdm reads this on import
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+import asyncio
 import json
+import re
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager, nullcontext
+from typing import List, Optional
 
-from fastapi import FastAPI, Depends, HTTPException, Security, Query, File, UploadFile
+from fastapi import FastAPI, Body, Depends, HTTPException, Security, Query, File, UploadFile, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.security.api_key import APIKeyHeader, APIKeyQuery
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 
-import networkx as nx
 from src import RoadmapGen as rmg
 
-import instructor
-from openai import OpenAI
-
 # Load environment variables from .env file
 load_dotenv()
 
@@ -38,6 +47,114 @@ API_KEY_NAME = "access_token"
 SERPER_API_KEY = os.getenv("SERPER_API_KEY")
 SERPER_API_KEY_NAME = "access_token"
 
+# Maximum number of concurrent LLM calls while expanding one roadmap level
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+
+# Model used to generate roadmaps
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+
+# Sibling leaves expanded by one LLM call; larger batches mean fewer requests and prompt tokens, smaller ones lower latency
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "1"))
+
+# Join near-duplicate prerequisites ("Basics of X" and "X") to one node while generating, so they are expanded once
+CANONICALIZER = rmg.TopicCanonicalizer(threshold=float(os.getenv("CANONICAL_THRESHOLD", "0.8"))) if os.getenv("CANONICALIZE_TOPICS", "0") == "1" else None
+
+# Serper results shared by every request and every worker on this host
+RESOURCE_CACHE = rmg.ResourceCache(
+    path=os.getenv("RESOURCE_CACHE_PATH", "cache/resources.sqlite3"),
+    ttl=float(os.getenv("RESOURCE_CACHE_TTL", str(7 * 24 * 3600))),
+    max_entries=int(os.getenv("RESOURCE_CACHE_MAX_ENTRIES", "50000")),
+)
+
+# LLM topic expansions reused across requests, kept on disk when TOPIC_MEMO_PATH is set
+TOPIC_MEMO_TTL = float(os.getenv("TOPIC_MEMO_TTL", str(24 * 3600)))
+if os.getenv("TOPIC_MEMO_PATH"):
+    TOPIC_MEMO = rmg.TopicMemo(store=rmg.SqliteCache(os.getenv("TOPIC_MEMO_PATH"), ttl=TOPIC_MEMO_TTL, table="topics"))
+else:
+    TOPIC_MEMO = rmg.TopicMemo(store=rmg.LRUCache(maxsize=4096, ttl=TOPIC_MEMO_TTL))
+
+# Encodes responses in the representation the client accepts and decodes uploads in any of them
+CODEC = rmg.GraphCodec()
+
+# Identical generations requested at the same time run once, and their result is reused for a short while
+FLIGHTS = rmg.SingleFlight(ttl=float(os.getenv("FLIGHT_RESULT_TTL", "30")))
+
+# Default limits of a generation, each unset (unlimited) unless configured; requests may pass their own
+GENERATION_DEADLINE = float(os.getenv("GENERATION_DEADLINE")) if os.getenv("GENERATION_DEADLINE") else None
+GENERATION_MAX_NODES = int(os.getenv("GENERATION_MAX_NODES")) if os.getenv("GENERATION_MAX_NODES") else None
+GENERATION_MAX_LLM_CALLS = int(os.getenv("GENERATION_MAX_LLM_CALLS")) if os.getenv("GENERATION_MAX_LLM_CALLS") else None
+
+# Versioned roadmaps kept server-side so follow-up operations can send a roadmap_id instead of the graph
+ROADMAP_STORE = rmg.RoadmapStore(
+    path=os.getenv("ROADMAP_STORE_PATH", "cache/roadmaps.sqlite3"),
+    memory_size=int(os.getenv("ROADMAP_STORE_MEMORY", "64")),
+    ttl=float(os.getenv("ROADMAP_STORE_TTL", str(7 * 24 * 3600))),
+    codec=CODEC,
+)
+
+# Progress of /graph/full and /graph/full/stream runs, so a failed or interrupted run resumes instead of starting over
+CHECKPOINTS = rmg.CheckpointStore(
+    path=os.getenv("CHECKPOINT_PATH", "cache/checkpoints.sqlite3"),
+    ttl=float(os.getenv("CHECKPOINT_TTL", str(24 * 3600))),
+    interval=float(os.getenv("CHECKPOINT_INTERVAL", "5")),
+    codec=CODEC,
+)
+
+# Send a Server-Timing header with the time spent per rmg stage on every response
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# Long-lived OpenAI/instructor and Serper clients shared across requests, keyed by API key
+CLIENTS = rmg.ClientRegistry(
+    max_clients=int(os.getenv("CLIENT_POOL_SIZE", "64")),
+    idle_timeout=float(os.getenv("CLIENT_IDLE_TIMEOUT", "600")),
+    # CALLS retries throttled and transient failures itself, with backoff shared by every request
+    openai_max_retries=0,
+)
+
+# Outbound LLM and Serper calls: per-provider and per-key rate limits (calls per second, unset means
+# unlimited), adaptive concurrency that backs off on 429s, per-call timeouts and jittered retries
+def _rates(**env) -> dict:
+    return {provider: float(os.getenv(name)) for provider, name in env.items() if os.getenv(name)}
+
+CALLS = rmg.CallController(
+    provider_rates=_rates(openai="OPENAI_RATE", serper="SERPER_RATE"),
+    key_rates=_rates(openai="OPENAI_KEY_RATE", serper="SERPER_KEY_RATE"),
+    max_concurrency=int(os.getenv("CALL_MAX_CONCURRENCY", "16")),
+    attempts=int(os.getenv("CALL_ATTEMPTS", "4")),
+    timeout=float(os.getenv("CALL_TIMEOUT", "60")),
+    max_delay=float(os.getenv("CALL_MAX_BACKOFF", "20")),
+    latency_target=float(os.getenv("CALL_LATENCY_TARGET")) if os.getenv("CALL_LATENCY_TARGET") else None,
+)
+
+# Gives a ResourceFinder using the shared cache and pooled Serper client for a key
+@contextmanager
+def resource_finder(serper_api_key: str):
+    with CLIENTS.serper(serper_api_key) as http_client:
+        yield rmg.ResourceFinder(SERPER_API_KEY=serper_api_key, cache=RESOURCE_CACHE, http_client=http_client, controller=CALLS.lane("serper", serper_api_key))
+
+# Background Serper lookups for roadmaps returned with lazy resources, best-ranked nodes first
+PREFETCHER = rmg.ResourcePrefetcher(
+    finder=resource_finder,
+    max_workers=int(os.getenv("PREFETCH_WORKERS", "2")),
+    max_topics=int(os.getenv("PREFETCH_MAX_TOPICS", "99")),
+)
+
+# Worker pool for LLM/Serper pipelines so they never run on the event loop
+JOB_RUNNER = rmg.JobRunner(
+    max_workers=int(os.getenv("JOB_WORKERS", "4")),
+    max_queue=int(os.getenv("JOB_QUEUE_SIZE", "16")),
+    retention=float(os.getenv("JOB_RETENTION", "3600")),
+)
+
+# Batch generation: results are written to BATCH_OUTPUT_DIR, LLM calls and Serper requests of
+# every batch on this worker share the optional per-second rate limits
+BATCH_OUTPUT_DIR = os.getenv("BATCH_OUTPUT_DIR", "cache/batches")
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "1000"))
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", "16"))
+BATCH_ROADMAPS = int(os.getenv("BATCH_ROADMAPS", "4"))
+BATCH_LLM_LIMITER = rmg.RateLimiter(float(os.getenv("BATCH_LLM_RATE")), name="batch_llm") if os.getenv("BATCH_LLM_RATE") else None
+BATCH_SERPER_LIMITER = rmg.RateLimiter(float(os.getenv("BATCH_SERPER_RATE")), name="batch_serper") if os.getenv("BATCH_SERPER_RATE") else None
+
 api_key_header = APIKeyHeader(name=API_KEY_NAME, auto_error=False)
 api_key_query = APIKeyQuery(name=API_KEY_NAME, auto_error=False)
 serper_api_key_header = APIKeyHeader(name=SERPER_API_KEY_NAME, auto_error=False)
@@ -74,6 +191,453 @@ async def get_serper_api_key(serper_api_key_header: str = Security(serper_api_ke
     else:
         raise HTTPException(status_code=403, detail="Could not validate Serper credentials")
 
+class RoadmapSource:
+    """
+    The roadmap an operation works on: an uploaded file, or a version of a stored roadmap.
+    
+    Either way the result is saved to the store as a new version, so the client can send
+    the returned roadmap_id on its next request instead of the graph.
+    """
+
+    def __init__(self, upload=None, roadmap_id: Optional[str] = None, version: Optional[int] = None):
+        self.upload = upload
+        self.roadmap_id = roadmap_id
+        self.version = version
+
+    def load(self):
+        if self.roadmap_id is None:
+            return CODEC.read_graph(self.upload)
+        graph, self.version = ROADMAP_STORE.get(self.roadmap_id, self.version)
+        return graph
+
+    def save(self, graph, operation: str) -> dict:
+        if self.roadmap_id is None:
+            roadmap_id, version = ROADMAP_STORE.create(graph, operation=operation)
+            return CODEC.to_data(graph, roadmap_id=roadmap_id, version=version)
+        version = ROADMAP_STORE.commit(self.roadmap_id, graph, base_version=self.version, operation=operation)
+        return CODEC.to_data(graph, **ROADMAP_STORE.meta(self.roadmap_id), roadmap_id=self.roadmap_id, version=version)
+
+def roadmap_source(
+    upload_file: Optional[UploadFile] = File(None, description="The roadmap file, if no roadmap_id is given"),
+    roadmap_id: Optional[str] = Query(None, description="ID of a stored roadmap to use instead of an upload"),
+    version: Optional[int] = Query(None, description="Version of the stored roadmap, the latest if omitted")
+) -> RoadmapSource:
+    """
+    Resolve the roadmap an endpoint works on from its upload_file or roadmap_id/version parameters.
+    
+    Raises:
+    HTTPException: 400 if neither is given.
+    """
+    if roadmap_id is None and upload_file is None:
+        raise HTTPException(status_code=400, detail="Send the roadmap as upload_file or refer to a stored one with roadmap_id")
+    return RoadmapSource(upload_file.file if roadmap_id is None else None, roadmap_id, version)
+
+class BudgetLimits:
+    """The generation limits of a request; the budget itself is only started when the work begins."""
+
+    def __init__(self, deadline: Optional[float], max_nodes: Optional[int], max_llm_calls: Optional[int]):
+        self.deadline = deadline if deadline is not None else GENERATION_DEADLINE
+        self.max_nodes = max_nodes if max_nodes is not None else GENERATION_MAX_NODES
+        self.max_llm_calls = max_llm_calls if max_llm_calls is not None else GENERATION_MAX_LLM_CALLS
+
+    def key(self) -> tuple:
+        return (self.deadline, self.max_nodes, self.max_llm_calls)
+
+    def start(self, cancel_event: Optional[threading.Event] = None) -> Optional[rmg.GenerationBudget]:
+        if self.key() == (None, None, None) and cancel_event is None:
+            return None
+        return rmg.GenerationBudget(deadline=self.deadline, max_nodes=self.max_nodes, max_llm_calls=self.max_llm_calls, cancel_event=cancel_event)
+
+def budget_limits(
+    deadline: Optional[float] = Query(None, gt=0, description="Seconds the generation may take before a partial roadmap is returned"),
+    max_nodes: Optional[int] = Query(None, ge=1, description="Maximum number of nodes in the generated roadmap"),
+    max_llm_calls: Optional[int] = Query(None, ge=1, description="Maximum number of LLM calls, retries included")
+) -> BudgetLimits:
+    return BudgetLimits(deadline, max_nodes, max_llm_calls)
+
+def checkpoint_token(pipeline: str, prompt: str, depth: int, lazy_resources: bool, limits_key: tuple = ()) -> str:
+    # Runs with other limits stop at other points, so they do not share a checkpoint
+    return CHECKPOINTS.token(pipeline, prompt, depth, LLM_MODEL, lazy_resources, *limits_key)
+
+# Blocking pipelines, run on JOB_RUNNER or the threadpool by the endpoints below
+
+def full_pipeline(openai_api_key: str, serper_api_key: str, prompt: str, depth: int, retries: int, budget: Optional[rmg.GenerationBudget] = None, lazy_resources: bool = False, resume_token: Optional[str] = None, limits_key: tuple = ()) -> dict:
+    if resume_token is not None:
+        # A resumed run takes its parameters from the checkpoint
+        checkpoint = CHECKPOINTS.load(resume_token, memo=TOPIC_MEMO)
+        prompt, depth, lazy_resources = checkpoint.meta["prompt"], checkpoint.meta["depth"], checkpoint.meta["lazy_resources"]
+    else:
+        # The same request made again after a failure or a restart picks up its checkpoint
+        resume_token = checkpoint_token("full", prompt, depth, lazy_resources, limits_key)
+        checkpoint = CHECKPOINTS.open(resume_token, {"prompt": prompt, "depth": depth, "lazy_resources": lazy_resources}, memo=TOPIC_MEMO)
+
+    try:
+        with CLIENTS.openai(openai_api_key) as client, resource_finder(serper_api_key) as websearch:
+            # Expansions go through the checkpoint, so those of an interrupted level are replayed
+            generator = rmg.Generator(client=client, max_workers=LLM_CONCURRENCY, memo=checkpoint, model=LLM_MODEL, batch_size=LLM_BATCH_SIZE, canonicalizer=CANONICALIZER, controller=CALLS.lane("openai", openai_api_key))
+            pagerank = rmg.ranker()
+            graphfix = rmg.GraphFixer()
+            titlesort = rmg.sortpgscore()
+
+            if checkpoint.stage == "generate":
+                for roadmap, _, _ in generator.iter_roadmap(prompt=prompt, depth=depth, retries=retries, budget=budget, start=checkpoint.start()):
+                    checkpoint.level_done(roadmap)
+                checkpoint.advance("resources")
+            cleaned_roadmap = checkpoint.graph
+
+            if not lazy_resources:
+                # Nodes enriched before an interruption keep their resources
+                pending = [node for node, data in cleaned_roadmap.nodes(data=True) if 'recommend_books' not in data]
+                cleaned_roadmap = websearch.serp_recommendation_graph(
+                    graph=cleaned_roadmap, SERPER_API_KEY=serper_api_key, budget=budget, nodes=pending,
+                    on_found=lambda _: checkpoint.save_every(CHECKPOINTS.interval)
+                )
+
+        # Ranked on a copy, so a failure before the roadmap is stored leaves the checkpoint intact
+        cleaned_roadmap = pagerank.get_page_rank(graph=cleaned_roadmap.copy(), budget=budget)
+        cleaned_roadmap = graphfix.fix_graph(cleaned_roadmap)
+        cleaned_roadmap = titlesort.graphsortattribute(cleaned_roadmap)
+
+        if lazy_resources:
+            # The ranked skeleton goes out now; resources come from GET /roadmaps/{id}/nodes/{node}/resources
+            for _, data in cleaned_roadmap.nodes(data=True):
+                data['resources_pending'] = True
+        roadmap_id, version = ROADMAP_STORE.create(cleaned_roadmap, meta={"prompt": prompt}, operation="full")
+    except Exception as e:
+        if checkpoint.level == 0:
+            # Nothing worth resuming, e.g. the root topic could not be generated
+            raise
+        checkpoint.save()
+        raise rmg.CheckpointedError(resume_token, e) from e
+    # Only a stored roadmap leaves nothing to resume
+    CHECKPOINTS.delete(resume_token)
+
+    if lazy_resources:
+        PREFETCHER.schedule(cleaned_roadmap, serper_api_key)
+    return CODEC.to_data(cleaned_roadmap, prompt=prompt, roadmap_id=roadmap_id, version=version)
+
+def full_pipeline_events(openai_api_key: str, serper_api_key: str, prompt: str, depth: int, retries: int, budget: Optional[rmg.GenerationBudget] = None, limits_key: tuple = ()):
+    """
+    Run the /graph/full pipeline and yield its progress as events.
+    
+    The run is checkpointed like /graph/full. When it fails after the root topic, or the
+    client goes away, the same request made again goes on from the checkpoint: what was
+    already done is replayed as one "level" event and its "resources" events.
+    
+    Yields:
+    dict: A "level" event per generated depth level, a "resources" event per node,
+    then a "ranks" event with the final tree and a closing "done" event with its roadmap_id.
+    When the budget ran out, "done" carries "partial" and the budget state.
+    """
+    resume_token = checkpoint_token("stream", prompt, depth, False, limits_key)
+    checkpoint = CHECKPOINTS.open(resume_token, {"prompt": prompt, "depth": depth, "lazy_resources": False}, memo=TOPIC_MEMO)
+
+    try:
+        with CLIENTS.openai(openai_api_key) as client, CLIENTS.serper(serper_api_key) as http_client:
+            generator = rmg.Generator(client=client, max_workers=LLM_CONCURRENCY, memo=checkpoint, model=LLM_MODEL, batch_size=LLM_BATCH_SIZE, canonicalizer=CANONICALIZER, controller=CALLS.lane("openai", openai_api_key))
+            websearch = rmg.ResourceFinder(SERPER_API_KEY=serper_api_key, cache=RESOURCE_CACHE, http_client=http_client, controller=CALLS.lane("serper", serper_api_key))
+
+            if checkpoint.resumed:
+                roadmap = checkpoint.graph
+                yield {
+                    "event": "level",
+                    "level": checkpoint.level,
+                    "resumed": True,
+                    "nodes": [{"id": node, **data} for node, data in roadmap.nodes(data=True)],
+                    "unexpanded": [node for node, flagged in roadmap.nodes(data='unexpanded') if flagged],
+                    "links": [{"source": source, "target": target} for source, target in roadmap.edges()],
+                }
+                for node, data in roadmap.nodes(data=True):
+                    if 'recommend_books' in data:
+                        yield {"event": "resources", "id": node, **{key: data[key] for key in ('recommend_books', 'recommend_videos', 'recommend_courses')}}
+
+            if checkpoint.stage == "generate":
+                for roadmap, new_nodes, new_edges in generator.iter_roadmap(prompt=prompt, depth=depth, retries=retries, budget=budget, start=checkpoint.start()):
+                    checkpoint.level_done(roadmap)
+                    yield {
+                        "event": "level",
+                        "level": checkpoint.level,
+                        "nodes": [{"id": node, **roadmap.nodes[node]} for node in new_nodes],
+                        "unexpanded": [node for node, flagged in roadmap.nodes(data='unexpanded') if flagged],
+                        "links": [{"source": source, "target": target} for source, target in new_edges],
+                    }
+                checkpoint.advance("resources")
+            roadmap = checkpoint.graph
+
+            pending = [node for node, data in roadmap.nodes(data=True) if 'recommend_books' not in data]
+            for node, recommendation in websearch.serp_recommendation_batch(pending, SERPER_API_KEY=serper_api_key, budget=budget):
+                roadmap.nodes[node].update(recommendation)
+                checkpoint.save_every(CHECKPOINTS.interval)
+                yield {"event": "resources", "id": node, **recommendation}
+
+        # Marked and ranked on a copy, so a failure before the roadmap is stored leaves the
+        # checkpoint intact and the nodes without resources are still looked up on resume
+        roadmap = roadmap.copy()
+        for node, data in roadmap.nodes(data=True):
+            if 'recommend_books' not in data:
+                data.update(recommend_books=[], recommend_videos=[], recommend_courses=[], resources_pending=True)
+                roadmap.graph['partial'] = True
+
+        pagerank = rmg.ranker()
+        graphfix = rmg.GraphFixer()
+        titlesort = rmg.sortpgscore()
+        cleaned_roadmap = pagerank.get_page_rank(graph=roadmap, budget=budget)
+        cleaned_roadmap = graphfix.fix_graph(cleaned_roadmap)
+        cleaned_roadmap = titlesort.graphsortattribute(cleaned_roadmap)
+
+        roadmap_id, version = ROADMAP_STORE.create(cleaned_roadmap, meta={"prompt": prompt}, operation="full")
+    except GeneratorExit:
+        # The client went away; keep what was done for when it asks again
+        if checkpoint.level > 0:
+            checkpoint.save()
+        raise
+    except Exception as e:
+        if checkpoint.level == 0:
+            raise
+        checkpoint.save()
+        raise rmg.CheckpointedError(resume_token, e) from e
+    # Only a stored roadmap leaves nothing to resume
+    CHECKPOINTS.delete(resume_token)
+
+    # Resources were already streamed per title, so the final tree only carries ranks
+    yield {
+        "event": "ranks",
+        "nodes": [
+            {"id": node, "title": data['title'], "pagerank": data.get('pagerank'), "rank": data.get('rank')}
+            for node, data in cleaned_roadmap.nodes(data=True)
+        ],
+        "links": [{"source": source, "target": target} for source, target in cleaned_roadmap.edges()],
+    }
+    done = {"event": "done", "prompt": prompt, "roadmap_id": roadmap_id, "version": version}
+    if cleaned_roadmap.graph.get('partial'):
+        done.update(partial=True)
+        if budget is not None:
+            done.update(budget=budget.to_dict())
+    yield done
+
+def graph_pipeline(openai_api_key: str, prompt: str, depth: int, retries: int, budget: Optional[rmg.GenerationBudget] = None) -> dict:
+    with CLIENTS.openai(openai_api_key) as client:
+        generator = rmg.Generator(client=client, max_workers=LLM_CONCURRENCY, memo=TOPIC_MEMO, model=LLM_MODEL, batch_size=LLM_BATCH_SIZE, canonicalizer=CANONICALIZER, controller=CALLS.lane("openai", openai_api_key))
+        roadmap = generator.generate_roadmap(prompt=prompt, depth=depth, retries=retries, budget=budget)
+
+    roadmap_id, version = ROADMAP_STORE.create(roadmap, meta={"prompt": prompt}, operation="graph")
+    return CODEC.to_data(roadmap, prompt=prompt, roadmap_id=roadmap_id, version=version)
+
+def expand_pipeline(openai_api_key: str, serper_api_key: str, source: RoadmapSource, depth: int, retries: int, target_node: str) -> dict:
+    graph = source.load()
+    with CLIENTS.openai(openai_api_key) as client, CLIENTS.serper(serper_api_key) as http_client:
+        nodeexpander = rmg.NodeExpand(client=client, SERPER_API_KEY=serper_api_key, max_workers=LLM_CONCURRENCY, cache=RESOURCE_CACHE, memo=TOPIC_MEMO, http_client=http_client, llm_controller=CALLS.lane("openai", openai_api_key), serper_controller=CALLS.lane("serper", serper_api_key))
+        expanded_roadmap = nodeexpander.expand_target_node(target_node, graph=graph, depth=depth, retries=retries)
+    return source.save(expanded_roadmap, "expand")
+
+def merge_pipeline(openai_api_key: str, source: RoadmapSource, retries: int) -> dict:
+    graph = source.load()
+    with CLIENTS.openai(openai_api_key) as client:
+        redundant_fixer = rmg.RedundantFunc(client=client, max_workers=LLM_CONCURRENCY, controller=CALLS.lane("openai", openai_api_key))
+        roadmap = redundant_fixer.remove_redundant_nodes(graph=graph, retries=retries)
+    return source.save(roadmap, "merge")
+
+def resources_pipeline(serper_api_key: str, source: RoadmapSource) -> dict:
+    graph = source.load()
+    with resource_finder(serper_api_key) as websearch:
+        roadmap = websearch.serp_recommendation_graph(graph=graph, SERPER_API_KEY=serper_api_key)
+    return source.save(roadmap, "resources")
+
+def batch_pipeline(openai_api_key: str, serper_api_key: Optional[str], prompts: List[str], depth: int, retries: int, output_path: str) -> dict:
+    # Without a Serper key the roadmaps are generated without resources
+    serper = CLIENTS.serper(serper_api_key) if serper_api_key else nullcontext()
+    with CLIENTS.openai(openai_api_key) as client, serper as http_client:
+        batch = rmg.BatchGenerator(
+            client=client,
+            SERPER_API_KEY=serper_api_key,
+            max_workers=BATCH_WORKERS,
+            max_roadmaps=BATCH_ROADMAPS,
+            llm_limiter=BATCH_LLM_LIMITER,
+            serper_limiter=BATCH_SERPER_LIMITER,
+            memo=TOPIC_MEMO,
+            cache=RESOURCE_CACHE,
+            http_client=http_client,
+            model=LLM_MODEL,
+            batch_size=LLM_BATCH_SIZE,
+            canonicalizer=CANONICALIZER,
+            llm_controller=CALLS.lane("openai", openai_api_key),
+            serper_controller=CALLS.lane("serper", serper_api_key) if serper_api_key else None,
+            codec=CODEC,
+            store=ROADMAP_STORE,
+        )
+        return batch.run(prompts, output_path, depth=depth, retries=retries, resources=serper_api_key is not None)
+
+def pagerank_pipeline(source: RoadmapSource) -> dict:
+    graph = source.load()
+    pagerank = rmg.ranker()
+    roadmap = pagerank.get_page_rank(graph=graph)
+    return source.save(roadmap, "pagerank")
+
+def tree_pipeline(source: RoadmapSource) -> dict:
+    graph = source.load()
+    graphfix = rmg.GraphFixer()
+    roadmap = graphfix.fix_graph(graph=graph)
+    return source.save(roadmap, "tree")
+
+def ranking_pipeline(source: RoadmapSource) -> dict:
+    graph = source.load()
+    titlesort = rmg.sortpgscore()
+    roadmap = titlesort.graphsortattribute(graph=graph)
+    return source.save(roadmap, "ranking")
+
+JOB_PIPELINES = {
+    "full": full_pipeline,
+    "graph": graph_pipeline,
+}
+
+async def graph_response(request: Request, data: dict) -> Response:
+    """
+    Encode node-link roadmap data in the representation the request asks for.
+    
+    The Accept header selects plain JSON (default), compact JSON or compact MessagePack,
+    and Accept-Encoding selects zstd or gzip compression. Encoding runs on the threadpool
+    since large roadmaps take a while to serialize and compress.
+    """
+    media_type, encoding = CODEC.negotiate(request.headers.get("accept"), request.headers.get("accept-encoding"))
+    body, encoding = await run_in_threadpool(CODEC.encode, data, media_type=media_type, encoding=encoding)
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type=media_type, headers=headers)
+
+def queue_full_error(e: rmg.JobQueueFull) -> HTTPException:
+    return HTTPException(status_code=429, detail=f"Server is busy, try again later ({e})", headers={"Retry-After": "30"})
+
+def with_budget(fn, limits: Optional[BudgetLimits]):
+    """Wrap a pipeline so its budget is started when it begins running, not while it waits in the queue."""
+    if limits is None:
+        return fn
+
+    def run(*args, **kwargs):
+        return fn(*args, budget=limits.start(), **kwargs)
+    return run
+
+async def run_on_pool(fn, *args, flight_key: Optional[str] = None, limits: Optional[BudgetLimits] = None, **kwargs):
+    """
+    Run a long LLM/Serper pipeline on the bounded job pool and wait for it without blocking the event loop.
+    
+    With a `flight_key`, a request arriving while the same key is running waits for that
+    run instead of starting its own, and shares its (read-only) result. With `limits`, the
+    pipeline gets a budget started when it begins running.
+    
+    Raises:
+    HTTPException: 429 if the pool and its queue are full.
+    """
+    fn = with_budget(fn, limits)
+    try:
+        if flight_key is None:
+            future = JOB_RUNNER.submit(fn, *args, **kwargs)
+        else:
+            future = FLIGHTS.submit(flight_key, lambda: JOB_RUNNER.submit(fn, *args, **kwargs))
+    except rmg.JobQueueFull as e:
+        raise queue_full_error(e)
+    return await asyncio.wrap_future(future)
+
+def stream_on_pool(events_fn, *args, sse: bool = False, limits: Optional[BudgetLimits] = None, **kwargs) -> StreamingResponse:
+    """
+    Run an event-producing pipeline on the bounded job pool and stream its events as they come.
+    
+    Events are sent as NDJSON lines, or as Server-Sent Events when `sse` is set. A failure
+    inside the pipeline is sent as a final "error" event. With `limits`, the pipeline gets
+    a budget started when it begins running.
+    
+    Raises:
+    HTTPException: 429 if the pool and its queue are full.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    # Set when the client goes away so the pipeline stops at the next event
+    stopped = threading.Event()
+    events_fn = with_budget(events_fn, limits)
+
+    def produce():
+        try:
+            for event in events_fn(*args, **kwargs):
+                if stopped.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+        except Exception as e:
+            error = {"event": "error", "detail": f"{type(e).__name__}: {e}"}
+            if isinstance(e, rmg.CheckpointedError):
+                error["resume_token"] = e.resume_token
+            loop.call_soon_threadsafe(queue.put_nowait, error)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    try:
+        JOB_RUNNER.submit(produce)
+    except rmg.JobQueueFull as e:
+        raise queue_full_error(e)
+
+    async def body():
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                if sse:
+                    yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+                else:
+                    yield json.dumps(event) + "\n"
+        finally:
+            stopped.set()
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(body(), media_type=media_type)
+
+@app.exception_handler(rmg.WireFormatError)
+async def wire_format_error(request: Request, e: rmg.WireFormatError):
+    return JSONResponse(status_code=400, content={"detail": str(e)})
+
+@app.exception_handler(rmg.BudgetExhausted)
+async def budget_exhausted(request: Request, e: rmg.BudgetExhausted):
+    # Only raised when not even the root topic could be generated within the limits
+    return JSONResponse(status_code=504 if e.args and e.args[0] == "deadline" else 503, content={"detail": f"Generation budget exhausted before any result: {e}"})
+
+@app.exception_handler(rmg.CheckpointedError)
+async def checkpointed_error(request: Request, e: rmg.CheckpointedError):
+    # The progress is saved, the client can resume once the cause (e.g. a provider outage) is over
+    return JSONResponse(status_code=503, content={"detail": f"Generation failed: {e}", "resume_token": e.resume_token})
+
+@app.exception_handler(rmg.CheckpointNotFound)
+async def checkpoint_not_found(request: Request, e: rmg.CheckpointNotFound):
+    return JSONResponse(status_code=404, content={"detail": f"Checkpoint not found or expired: {e.args[0]}"})
+
+@app.exception_handler(rmg.RoadmapNotFound)
+async def roadmap_not_found(request: Request, e: rmg.RoadmapNotFound):
+    return JSONResponse(status_code=404, content={"detail": f"Roadmap not found: {e.args[0]}"})
+
+rmg.METRICS.describe("rmg_http_request_seconds", "Time to build the response of each endpoint")
+
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """
+    Time every request and, with SERVER_TIMING=1, report its rmg stages as a Server-Timing header.
+    
+    Stage timings are collected through a context variable that follows the request onto
+    the job pool and the LLM worker threads. Streamed responses only report the stages
+    that finished before the first byte.
+    """
+    timings = rmg.start_request_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    rmg.METRICS.observe(
+        "rmg_http_request_seconds",
+        time.perf_counter() - start,
+        path=route.path if route is not None else "unmatched",
+        method=request.method,
+        status=response.status_code,
+    )
+    if SERVER_TIMING and timings.stages:
+        response.headers["Server-Timing"] = timings.server_timing()
+    return response
+
 # Add CORSMiddleware to the app with restricted methods
 
 @app.get("/")
@@ -82,13 +646,15 @@ def read_root():
 
 @app.get("/graph/full")
 async def get_graph_full(
+    request: Request,
     openai_api_key: str = Query(get_api_key),
     serper_api_key: str = Query(get_serper_api_key),
     prompt: str = Query(..., description="The prompt for the LLM"),
     depth: int = Query(3, description="The depth of the roadmap"),
-    retries: int = Query(2, description="The number of retries for the LLM call")
+    retries: int = Query(2, description="The number of retries for the LLM call"),
+    lazy_resources: bool = Query(False, description="Return the ranked roadmap without resources and prefetch them in the background"),
+    limits: BudgetLimits = Depends(budget_limits)
 ):
-    print('A request has been made')
     """
     Generate a full learning roadmap with all cleaning and ranking steps.
     
@@ -98,32 +664,81 @@ async def get_graph_full(
     prompt (str): The prompt for the LLM.
     depth (int): The depth of the roadmap.
     retries (int): The number of retries for the LLM call.
+    lazy_resources (bool): Skip the Serper lookups; nodes are flagged resources_pending and
+    their resources are prefetched best-ranked first for the per-node resources endpoint.
+    limits (BudgetLimits): Optional deadline, max_nodes and max_llm_calls.
     
     Returns:
-    dict: The cleaned and ranked learning roadmap.
+    dict: The cleaned and ranked learning roadmap, flagged partial if a limit was reached.
     """
-    client = instructor.from_openai(OpenAI(api_key=openai_api_key))
-    generator = rmg.Generator(client=client)
-    websearch = rmg.ResourceFinder(SERPER_API_KEY=serper_api_key)
-    pagerank = rmg.ranker()
-    graphfix = rmg.GraphFixer()
-    titlesort = rmg.sortpgscore()
+    # Runs of one checkpoint coalesce on its token, so a resume waits for a run still in progress
+    flight_key = FLIGHTS.key("checkpoint", checkpoint_token("full", prompt, depth, lazy_resources, limits.key()))
+    roadmap = await run_on_pool(full_pipeline, openai_api_key, serper_api_key, prompt, depth, retries, lazy_resources=lazy_resources, limits_key=limits.key(), limits=limits, flight_key=flight_key)
+    # Coalesced requests share one result, but each gets its own prompt back
+    return await graph_response(request, dict(roadmap, prompt=prompt))
 
-    roadmap = generator.generate_roadmap(prompt=prompt, depth=depth, retries=retries)
-    cleaned_roadmap = websearch.serp_recommendation_graph(graph=roadmap, SERPER_API_KEY=serper_api_key)
-    cleaned_roadmap = pagerank.get_page_rank(graph=cleaned_roadmap)
-    cleaned_roadmap = graphfix.fix_graph(cleaned_roadmap)
-    cleaned_roadmap = titlesort.graphsortattribute(cleaned_roadmap)
+@app.get("/graph/full/resume")
+async def resume_graph_full(
+    request: Request,
+    openai_api_key: str = Query(get_api_key),
+    serper_api_key: str = Query(get_serper_api_key),
+    resume_token: str = Query(..., description="The resume_token of a failed /graph/full, /graph/full/stream or full job"),
+    retries: int = Query(2, description="The number of retries for the LLM call"),
+    limits: BudgetLimits = Depends(budget_limits)
+):
+    """
+    Resume a failed or interrupted /graph/full run from its last checkpoint.
+    
+    The levels already generated and the nodes already enriched are kept; the prompt,
+    depth and lazy_resources of the original run are used.
+    
+    Parameters:
+    openai_api_key (str): OpenAI API key.
+    serper_api_key (str): Serper API key.
+    resume_token (str): The resume_token returned with the failure.
+    retries (int): The number of retries for the LLM call.
+    limits (BudgetLimits): Optional deadline, max_nodes and max_llm_calls for the rest of the run.
+    
+    Returns:
+    dict: The cleaned and ranked learning roadmap, as /graph/full returns it.
+    """
+    flight_key = FLIGHTS.key("checkpoint", resume_token)
+    roadmap = await run_on_pool(full_pipeline, openai_api_key, serper_api_key, None, None, retries, resume_token=resume_token, limits=limits, flight_key=flight_key)
+    return await graph_response(request, roadmap)
 
-    cleaned_roadmap = nx.node_link_data(cleaned_roadmap)
-    cleaned_roadmap['prompt'] = prompt
-    return cleaned_roadmap
+@app.get("/graph/full/stream")
+async def get_graph_full_stream(
+    request: Request,
+    openai_api_key: str = Query(get_api_key),
+    serper_api_key: str = Query(get_serper_api_key),
+    prompt: str = Query(..., description="The prompt for the LLM"),
+    depth: int = Query(3, description="The depth of the roadmap"),
+    retries: int = Query(2, description="The number of retries for the LLM call"),
+    limits: BudgetLimits = Depends(budget_limits)
+):
+    """
+    Generate a full learning roadmap, streaming nodes as each level completes.
+    
+    Parameters:
+    openai_api_key (str): OpenAI API key.
+    serper_api_key (str): Serper API key.
+    prompt (str): The prompt for the LLM.
+    depth (int): The depth of the roadmap.
+    retries (int): The number of retries for the LLM call.
+    limits (BudgetLimits): Optional deadline, max_nodes and max_llm_calls.
+    
+    Returns:
+    StreamingResponse: NDJSON events, or Server-Sent Events if the client accepts text/event-stream.
+    """
+    sse = "text/event-stream" in request.headers.get("accept", "")
+    return stream_on_pool(full_pipeline_events, openai_api_key, serper_api_key, prompt, depth, retries, limits_key=limits.key(), sse=sse, limits=limits)
 
 @app.post("/graph/ExpandNode")
 async def expand_node(
+    request: Request,
     openai_api_key: str = Query(get_api_key),
     serper_api_key: str = Query(get_serper_api_key),
-    upload_file: UploadFile = File(...),
+    source: RoadmapSource = Depends(roadmap_source),
     depth: int = Query(3, description="The depth of the roadmap"),
     retries: int = Query(2, description="The number of retries for the LLM call"),
     target_node: str = Query(..., description="Target node ID")
@@ -134,7 +749,7 @@ async def expand_node(
     Parameters:
     openai_api_key (str): OpenAI API key.
     serper_api_key (str): Serper API key.
-    upload_file (UploadFile): The uploaded roadmap file.
+    source (RoadmapSource): The uploaded roadmap file, or the roadmap_id/version of a stored roadmap.
     depth (int): The depth of the roadmap.
     retries (int): The number of retries for the LLM call.
     target_node (str): The ID of the target node to expand.
@@ -142,18 +757,17 @@ async def expand_node(
     Returns:
     dict: The expanded learning roadmap.
     """
-    json_data = json.load(upload_file.file)
-    client = instructor.from_openai(OpenAI(api_key=openai_api_key))
-    nodeexpander = rmg.NodeExpand(client=client, SERPER_API_KEY=serper_api_key)
-    expanded_roadmap = nodeexpander.expand_target_node(target_node, graph=nx.node_link_graph(json_data), depth=depth, retries=retries)
-    return nx.node_link_data(expanded_roadmap)
+    roadmap = await run_on_pool(expand_pipeline, openai_api_key, serper_api_key, source, depth, retries, target_node)
+    return await graph_response(request, roadmap)
 
 @app.get("/graph")
 async def get_graph(
+    request: Request,
     openai_api_key: str = Query(get_api_key),
     prompt: str = Query(..., description="The prompt for the LLM"),
     depth: int = Query(3, description="The depth of the roadmap"),
-    retries: int = Query(2, description="The number of retries for the LLM call")
+    retries: int = Query(2, description="The number of retries for the LLM call"),
+    limits: BudgetLimits = Depends(budget_limits)
 ):
     """
     Generate a learning roadmap.
@@ -163,22 +777,20 @@ async def get_graph(
     prompt (str): The prompt for the LLM.
     depth (int): The depth of the roadmap.
     retries (int): The number of retries for the LLM call.
+    limits (BudgetLimits): Optional deadline, max_nodes and max_llm_calls.
     
     Returns:
-    dict: The generated learning roadmap.
+    dict: The generated learning roadmap, flagged partial if a limit was reached.
     """
-    client = instructor.from_openai(OpenAI(api_key=openai_api_key))
-    generator = rmg.Generator(client=client)
-    roadmap = generator.generate_roadmap(prompt=prompt, depth=depth, retries=retries)
-
-    cleaned_roadmap = nx.node_link_data(roadmap)
-    cleaned_roadmap['prompt'] = prompt
-    return cleaned_roadmap
+    flight_key = FLIGHTS.key("graph", prompt, depth, LLM_MODEL, *limits.key())
+    roadmap = await run_on_pool(graph_pipeline, openai_api_key, prompt, depth, retries, limits=limits, flight_key=flight_key)
+    return await graph_response(request, dict(roadmap, prompt=prompt))
 
 @app.post("/mergegraph")
 async def merge_graph(
+    request: Request,
     openai_api_key: str = Query(get_api_key),
-    upload_file: UploadFile = File(...),
+    source: RoadmapSource = Depends(roadmap_source),
     retries: int = Query(2, description="The number of retries for the LLM call")
 ):
     """
@@ -186,22 +798,20 @@ async def merge_graph(
     
     Parameters:
     openai_api_key (str): OpenAI API key.
-    upload_file (UploadFile): The uploaded roadmap file.
+    source (RoadmapSource): The uploaded roadmap file, or the roadmap_id/version of a stored roadmap.
     retries (int): The number of retries for the LLM call.
     
     Returns:
     dict: The roadmap with redundant nodes removed.
     """
-    json_data = json.load(upload_file.file)
-    client = instructor.from_openai(OpenAI(api_key=openai_api_key))
-    redundant_fixer = rmg.RedundantFunc(client=client)
-    roadmap = redundant_fixer.remove_redundant_nodes(graph=nx.node_link_graph(json_data), retries=retries)
-    return nx.node_link_data(roadmap)
+    roadmap = await run_on_pool(merge_pipeline, openai_api_key, source, retries)
+    return await graph_response(request, roadmap)
 
 @app.post("/graph/resources")
 async def get_resources(
+    request: Request,
     serper_api_key: str = Query(get_serper_api_key),
-    upload_file: UploadFile = File(...),
+    source: RoadmapSource = Depends(roadmap_source),
     retries: int = Query(2, description="The number of retries for the LLM call")
 ):
     """
@@ -209,64 +819,396 @@ async def get_resources(
     
     Parameters:
     serper_api_key (str): Serper API key.
-    upload_file (UploadFile): The uploaded roadmap file.
+    source (RoadmapSource): The uploaded roadmap file, or the roadmap_id/version of a stored roadmap.
     retries (int): The number of retries for the LLM call.
     
     Returns:
     dict: The roadmap with recommended resources.
     """
-    json_data = json.load(upload_file.file)
-    websearch = rmg.ResourceFinder(SERPER_API_KEY=serper_api_key)
-    roadmap = websearch.serp_recommendation_graph(graph=nx.node_link_graph(json_data), SERPER_API_KEY=serper_api_key)
-    return nx.node_link_data(roadmap)
+    roadmap = await run_on_pool(resources_pipeline, serper_api_key, source)
+    return await graph_response(request, roadmap)
 
 @app.post("/graph/pageranker")
-async def page_ranker(upload_file: UploadFile = File(...)):
+async def page_ranker(request: Request, source: RoadmapSource = Depends(roadmap_source)):
     """
     Apply PageRank algorithm to the roadmap.
     
     Parameters:
-    upload_file (UploadFile): The uploaded roadmap file.
+    source (RoadmapSource): The uploaded roadmap file, or the roadmap_id/version of a stored roadmap.
     
     Returns:
     dict: The roadmap with PageRank scores.
     """
-    json_data = json.load(upload_file.file)
-    pagerank = rmg.ranker()
-    roadmap = pagerank.get_page_rank(graph=nx.node_link_graph(json_data))
-    return nx.node_link_data(roadmap)
+    # Cheap local steps use the default threadpool so they never wait behind long jobs
+    roadmap = await run_in_threadpool(pagerank_pipeline, source)
+    return await graph_response(request, roadmap)
 
 @app.post("/graph/tree")
-async def graph_to_tree(upload_file: UploadFile = File(...)):
+async def graph_to_tree(request: Request, source: RoadmapSource = Depends(roadmap_source)):
     """
     Convert a graph to a tree structure.
     
     Parameters:
-    upload_file (UploadFile): The uploaded roadmap file.
+    source (RoadmapSource): The uploaded roadmap file, or the roadmap_id/version of a stored roadmap.
     
     Returns:
     dict: The roadmap as a tree structure.
     """
-    json_data = json.load(upload_file.file)
-    graphfix = rmg.GraphFixer()
-    roadmap = graphfix.fix_graph(graph=nx.node_link_graph(json_data))
-    return nx.node_link_data(roadmap)
+    roadmap = await run_in_threadpool(tree_pipeline, source)
+    return await graph_response(request, roadmap)
 
 @app.post("/graphranking")
-async def get_graph_ranking(upload_file: UploadFile = File(...)):
+async def get_graph_ranking(request: Request, source: RoadmapSource = Depends(roadmap_source)):
     """
     Sort the roadmap by PageRank scores.
     
     Parameters:
-    upload_file (UploadFile): The uploaded roadmap file.
+    source (RoadmapSource): The uploaded roadmap file, or the roadmap_id/version of a stored roadmap.
     
     Returns:
     dict: The sorted roadmap.
     """
-    json_data = json.load(upload_file.file)
-    titlesort = rmg.sortpgscore()
-    roadmap = titlesort.graphsortattribute(graph=nx.node_link_graph(json_data))
-    return nx.node_link_data(roadmap)
+    roadmap = await run_in_threadpool(ranking_pipeline, source)
+    return await graph_response(request, roadmap)
+
+@app.get("/roadmaps/{roadmap_id}")
+async def get_roadmap(
+    request: Request,
+    roadmap_id: str,
+    version: Optional[int] = Query(None, description="Version of the roadmap, the latest if omitted")
+):
+    """
+    Fetch a stored roadmap.
+    
+    Parameters:
+    roadmap_id (str): The roadmap ID returned by a previous call.
+    version (int): The version to fetch, the latest if omitted.
+    
+    Returns:
+    dict: The roadmap with its roadmap_id and version.
+    """
+    def load():
+        graph, loaded_version = ROADMAP_STORE.get(roadmap_id, version)
+        return CODEC.to_data(graph, **ROADMAP_STORE.meta(roadmap_id), roadmap_id=roadmap_id, version=loaded_version)
+    roadmap = await run_in_threadpool(load)
+    return await graph_response(request, roadmap)
+
+@app.get("/roadmaps/{roadmap_id}/versions")
+def get_roadmap_versions(roadmap_id: str):
+    """
+    List the versions of a stored roadmap and the operation that produced each one.
+    
+    Parameters:
+    roadmap_id (str): The roadmap ID.
+    
+    Returns:
+    list: One entry per version.
+    """
+    return ROADMAP_STORE.versions(roadmap_id)
+
+@app.get("/roadmaps/{roadmap_id}/nodes/{node_id}/resources")
+async def get_node_resources(
+    roadmap_id: str,
+    node_id: str,
+    serper_api_key: str = Query(get_serper_api_key),
+    version: Optional[int] = Query(None, description="Version of the roadmap, the latest if omitted")
+):
+    """
+    Get the recommended resources of one node of a stored roadmap.
+    
+    Resources already on the node are returned as they are. Otherwise they come from the
+    background prefetch of a lazy roadmap, or are fetched on demand.
+    
+    Parameters:
+    roadmap_id (str): The roadmap ID.
+    node_id (str): The node ID.
+    serper_api_key (str): Serper API key, used if the resources have to be fetched.
+    version (int): The version of the roadmap, the latest if omitted.
+    
+    Returns:
+    dict: The node ID, its title and its recommend_books, recommend_videos and recommend_courses.
+    """
+    def load():
+        graph, _ = ROADMAP_STORE.get(roadmap_id, version)
+        if not graph.has_node(node_id):
+            raise HTTPException(status_code=404, detail=f"Node not found: {node_id}")
+        data = graph.nodes[node_id]
+        title = data.get('title', node_id)
+        if 'recommend_books' in data and not data.get('resources_pending'):
+            recommendation = {key: data[key] for key in ('recommend_books', 'recommend_videos', 'recommend_courses')}
+        else:
+            recommendation = PREFETCHER.get(title, serper_api_key)
+        return {"id": node_id, "title": title, **recommendation}
+    return await run_in_threadpool(load)
+
+@app.delete("/roadmaps/{roadmap_id}", status_code=204)
+def delete_roadmap(roadmap_id: str):
+    """
+    Delete a stored roadmap with all its versions.
+    
+    Parameters:
+    roadmap_id (str): The roadmap ID.
+    """
+    ROADMAP_STORE.delete(roadmap_id)
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    openai_api_key: str = Query(get_api_key),
+    serper_api_key: str = Query(None, description="Serper API key, required by the full pipeline"),
+    pipeline: str = Query("full", description="The pipeline to run: full or graph"),
+    prompt: str = Query(..., description="The prompt for the LLM"),
+    depth: int = Query(3, description="The depth of the roadmap"),
+    retries: int = Query(2, description="The number of retries for the LLM call"),
+    limits: BudgetLimits = Depends(budget_limits)
+):
+    """
+    Submit a roadmap generation as a background job.
+    
+    Parameters:
+    openai_api_key (str): OpenAI API key.
+    serper_api_key (str): Serper API key, only used by the full pipeline.
+    pipeline (str): "full" for the same result as /graph/full, "graph" for /graph.
+    prompt (str): The prompt for the LLM.
+    depth (int): The depth of the roadmap.
+    retries (int): The number of retries for the LLM call.
+    limits (BudgetLimits): Optional deadline, max_nodes and max_llm_calls; the deadline
+    counts from when the job starts running.
+    
+    Returns:
+    dict: The job ID and its status.
+    
+    Raises:
+    HTTPException: 400 for an unknown pipeline, 429 if the job queue is full.
+    """
+    if pipeline not in JOB_PIPELINES:
+        raise HTTPException(status_code=400, detail=f"Unknown pipeline '{pipeline}', expected one of {sorted(JOB_PIPELINES)}")
+
+    if pipeline == "full" and not serper_api_key:
+        raise HTTPException(status_code=400, detail="The full pipeline needs a serper_api_key")
+
+    # A job waits for an identical generation already in flight rather than repeating it
+    if pipeline == "full":
+        args = (openai_api_key, serper_api_key, prompt, depth, retries)
+        kwargs = {"limits_key": limits.key()}
+        flight_key = FLIGHTS.key("checkpoint", checkpoint_token("full", prompt, depth, False, limits.key()))
+    else:
+        args = (openai_api_key, prompt, depth, retries)
+        kwargs = {}
+        flight_key = FLIGHTS.key(pipeline, prompt, depth, LLM_MODEL, *limits.key())
+
+    def run():
+        # Cancelling the job ends its budget, so the pipeline stops at its next LLM call
+        budget = limits.start(cancel_event=rmg.current_job().cancel_event)
+        return dict(FLIGHTS.do(flight_key, JOB_PIPELINES[pipeline], *args, budget, **kwargs), prompt=prompt)
+
+    try:
+        job = JOB_RUNNER.submit_job(pipeline, run)
+    except rmg.JobQueueFull as e:
+        raise queue_full_error(e)
+    return job.to_dict(include_result=False)
+
+@app.post("/batch", status_code=202)
+async def submit_batch(
+    openai_api_key: str = Query(get_api_key),
+    serper_api_key: str = Query(None, description="Serper API key; without it the roadmaps have no resources"),
+    prompts: List[str] = Body(..., embed=True, description="The prompts, one roadmap each"),
+    depth: int = Query(3, description="The depth of the roadmaps"),
+    retries: int = Query(2, description="The number of retries for the LLM call")
+):
+    """
+    Generate roadmaps for many prompts as one background job.
+    
+    Parameters:
+    openai_api_key (str): OpenAI API key.
+    serper_api_key (str): Serper API key, optional.
+    prompts (List[str]): The prompts, sent as {"prompts": [...]} in the body.
+    depth (int): The depth of the roadmaps.
+    retries (int): The number of retries for the LLM call.
+    
+    Returns:
+    dict: The job, polled with GET /jobs/{job_id}, and the batch_id of its results.
+    
+    Raises:
+    HTTPException: 400 for an empty or too large batch, 429 if the job queue is full.
+    """
+    if not prompts or len(prompts) > BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=400, detail=f"A batch takes 1 to {BATCH_MAX_PROMPTS} prompts")
+
+    batch_id = uuid.uuid4().hex
+    os.makedirs(BATCH_OUTPUT_DIR, exist_ok=True)
+    output_path = os.path.join(BATCH_OUTPUT_DIR, f"{batch_id}.jsonl")
+    try:
+        job = JOB_RUNNER.submit_job("batch", batch_pipeline, openai_api_key, serper_api_key, prompts, depth, retries, output_path)
+    except rmg.JobQueueFull as e:
+        raise queue_full_error(e)
+    return dict(job.to_dict(include_result=False), batch_id=batch_id)
+
+@app.get("/batch/{batch_id}")
+def get_batch_results(batch_id: str):
+    """
+    Download the results of a batch as JSON Lines, one roadmap per line.
+    
+    The file grows while the batch runs, so it can be read before the job has finished.
+    
+    Parameters:
+    batch_id (str): The batch ID returned by POST /batch.
+    
+    Returns:
+    FileResponse: The application/x-ndjson results.
+    """
+    path = os.path.join(BATCH_OUTPUT_DIR, f"{batch_id}.jsonl")
+    if not re.fullmatch(r"[0-9a-f]{32}", batch_id) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail=f"Batch not found: {batch_id}")
+    return FileResponse(path, media_type="application/x-ndjson")
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """
+    Poll the status of a job, with its result once it has succeeded.
+    
+    Parameters:
+    job_id (str): The job ID returned by POST /jobs.
+    
+    Returns:
+    dict: The job status, and its result or error when finished.
+    """
+    job = JOB_RUNNER.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    """
+    Cancel a job. Queued jobs never start; a running job stops at its next LLM call and its result is discarded.
+    
+    Parameters:
+    job_id (str): The job ID returned by POST /jobs.
+    
+    Returns:
+    dict: The job status after cancellation.
+    """
+    job = JOB_RUNNER.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict(include_result=False)
+
+@app.get("/stats/jobs")
+def get_job_stats():
+    """
+    Report how busy the job pool of this worker is.
+    
+    Returns:
+    dict: Pool limits, jobs in flight and job counts by status.
+    """
+    return JOB_RUNNER.stats()
+
+@app.get("/stats/clients")
+def get_client_stats():
+    """
+    Report how the pooled API clients of this worker are used.
+    
+    Returns:
+    dict: Client counts by kind, leases in progress, utilization and hit/miss/eviction counters.
+    """
+    return CLIENTS.stats()
+
+@app.get("/stats/cache")
+def get_cache_stats():
+    """
+    Report hit/miss counters of the resource cache for this worker.
+    
+    Returns:
+    dict: Cache counters and entry counts.
+    """
+    return RESOURCE_CACHE.stats()
+
+@app.get("/stats/prefetch")
+def get_prefetch_stats():
+    """
+    Report the background resource prefetcher of this worker.
+    
+    Returns:
+    dict: Titles queued, scheduled and requested before they were prefetched, and lookups that
+    waited for or pulled forward their prefetch.
+    """
+    return PREFETCHER.stats()
+
+@app.get("/stats/calls")
+def get_call_stats():
+    """
+    Report the outbound call lanes of this worker, one per provider and API key digest.
+    
+    Returns:
+    dict: Per lane, its current concurrency limit, calls in flight, retries, throttled calls and failures.
+    """
+    return CALLS.stats()
+
+@app.get("/stats/checkpoints")
+def get_checkpoint_stats():
+    """
+    Report the checkpoints of interrupted generations.
+    
+    Returns:
+    dict: Checkpoints stored, their size, and saves and resumes by this worker.
+    """
+    return CHECKPOINTS.stats()
+
+@app.get("/stats/flights")
+def get_flight_stats():
+    """
+    Report how many generation requests were coalesced with an identical one.
+    
+    Returns:
+    dict: Generations in flight, leader/follower counts, queued generations taken over by a job
+    and short-lived result cache hits.
+    """
+    return FLIGHTS.stats()
+
+@app.get("/stats/roadmaps")
+def get_roadmap_stats():
+    """
+    Report how many roadmaps and versions are stored and how often they are served from memory.
+    
+    Returns:
+    dict: Store counters and sizes.
+    """
+    return ROADMAP_STORE.stats()
+
+@app.get("/stats/memo")
+def get_memo_stats():
+    """
+    Report hit/miss counters of the topic expansion memo for this worker.
+    
+    Returns:
+    dict: Memo counters and entry count.
+    """
+    return TOPIC_MEMO.stats()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """
+    Export stage latencies, LLM/Serper call counts, token usage and graph sizes for Prometheus.
+    
+    Returns:
+    str: Metrics of this worker in the Prometheus text format.
+    """
+    cache = RESOURCE_CACHE.stats()
+    memo = TOPIC_MEMO.stats()
+    jobs = JOB_RUNNER.stats()
+    clients = CLIENTS.stats()
+    gauges = {
+        "rmg_resource_cache_hit_rate": ("Share of resource lookups answered without Serper", cache["hit_rate"]),
+        "rmg_resource_cache_disk_entries": ("Topics stored in the on-disk resource cache", cache["disk_entries"]),
+        "rmg_topic_memo_hit_rate": ("Share of topic expansions answered from the memo", memo["hit_rate"]),
+        "rmg_topic_memo_entries": ("Topic expansions stored in the memo", memo["entries"]),
+        "rmg_jobs_in_flight": ("Jobs running or queued on the job pool", jobs["in_flight"]),
+        "rmg_generations_in_flight": ("Distinct generations running, each possibly shared by several requests", FLIGHTS.stats()["in_flight"]),
+        "rmg_prefetch_queued": ("Titles waiting for or in a background resource prefetch", PREFETCHER.stats()["queued"]),
+        "rmg_clients_in_use": ("Pooled API clients serving a request", clients["in_use"]),
+        "rmg_clients_size": ("Pooled API clients", clients["size"]),
+    }
+    return PlainTextResponse(rmg.METRICS.render(gauges), media_type="text/plain; version=0.0.4")
 
 app.add_middleware(
     CORSMiddleware,
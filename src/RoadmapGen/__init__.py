@@ -1,14 +1,58 @@
 from .core.RoadmapGenerator import TopicInfo
+from .core.RoadmapGenerator import TopicInfoBatch
 from .core.RoadmapGenerator import Generator
 
 from .core.Prompt import LlmPrompt
 
+from .core.Metrics import MetricsRegistry
+from .core.Metrics import RequestTimings
+from .core.Metrics import METRICS
+from .core.Metrics import start_request_timings
+
+from .core.Budget import GenerationBudget
+from .core.Budget import BudgetExhausted
+
 
 from .modules.RedunRemover import RedundantGroup
 from .modules.RedunRemover import MergedTopic
 from .modules.RedunRemover import RedundantFunc
+from .modules.candidateblocker import UnionFind
+from .modules.candidateblocker import CandidateBlocker
+from .modules.canonical import TopicIndex
+from .modules.canonical import TopicCanonicalizer
 
 from .modules.websearch import ResourceFinder
+from .modules.websearch import SerperError
+from .modules.prefetch import ResourcePrefetcher
+from .modules.resourcecache import LRUCache
+from .modules.resourcecache import SqliteCache
+from .modules.resourcecache import ResourceCache
+
+from .modules.topicmemo import TopicMemo
+
+from .modules.jobs import Job
+from .modules.jobs import JobQueueFull
+from .modules.jobs import JobRunner
+from .modules.jobs import current_job
+
+from .modules.clients import ClientRegistry
+from .modules.singleflight import SingleFlight
+from .modules.ratelimit import RateLimiter
+from .modules.callcontrol import CallLane
+from .modules.callcontrol import CallController
+
+from .modules.batch import BatchGenerator
+
+from .modules.wireformat import GraphCodec
+from .modules.wireformat import WireFormatError
+
+from .modules.roadmapstore import RoadmapNotFound
+from .modules.roadmapstore import RoadmapStore
+
+from .modules.checkpoint import CheckpointNotFound
+from .modules.checkpoint import CheckpointedError
+from .modules.checkpoint import Checkpoint
+from .modules.checkpoint import CheckpointStore
 
 from .modules.pagerank import ranker
 
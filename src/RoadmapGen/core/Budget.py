@@ -0,0 +1,83 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+class BudgetExhausted(Exception):
+    """Raised when a budget runs out before anything useful could be produced, e.g. the root topic."""
+
+class GenerationBudget:
+    """
+    Limits on one roadmap generation: a wall-clock deadline, a maximum node count and
+    a maximum number of LLM calls (retries included). Every limit is optional.
+
+    The budget is shared by every stage of a request and is safe to use from the LLM
+    worker threads. Stages stop at the first exhausted limit and return partial results;
+    `reason` tells which limit ran out first.
+    """
+
+    def __init__(self, deadline: Optional[float] = None, max_nodes: Optional[int] = None, max_llm_calls: Optional[int] = None, cancel_event: Optional[threading.Event] = None):
+        # The deadline is given in seconds from now
+        self.deadline = time.monotonic() + deadline if deadline is not None else None
+        self.max_nodes = max_nodes
+        self.max_llm_calls = max_llm_calls
+        # Optional event (e.g. Job.cancel_event) that ends the budget early
+        self.cancel_event = cancel_event
+        self.llm_calls = 0
+        self.reason: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def remaining_time(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def exhaust(self, reason: str) -> None:
+        with self._lock:
+            if self.reason is None:
+                self.reason = reason
+
+    def expired(self) -> bool:
+        """
+        True once the deadline has passed or the cancel event is set.
+
+        The node and LLM-call limits only stop generation; later stages such as Serper
+        lookups and PageRank keep going until the time runs out.
+        """
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            self.exhaust("cancelled")
+            return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.exhaust("deadline")
+            return True
+        return False
+
+    def reserve_llm_call(self) -> bool:
+        """Count one LLM call against the budget. Returns False, and counts nothing, if it is not allowed."""
+        if self.expired():
+            return False
+        with self._lock:
+            if self.max_llm_calls is not None and self.llm_calls >= self.max_llm_calls:
+                if self.reason is None:
+                    self.reason = "max_llm_calls"
+                return False
+            self.llm_calls += 1
+            return True
+
+    def llm_calls_left(self) -> Optional[int]:
+        if self.max_llm_calls is None:
+            return None
+        return max(0, self.max_llm_calls - self.llm_calls)
+
+    def nodes_left(self, node_count: int) -> Optional[int]:
+        if self.max_nodes is None:
+            return None
+        return max(0, self.max_nodes - node_count)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "reason": self.reason,
+            "llm_calls": self.llm_calls,
+            "max_llm_calls": self.max_llm_calls,
+            "max_nodes": self.max_nodes,
+            "remaining_time": self.remaining_time(),
+        }
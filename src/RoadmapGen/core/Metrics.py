@@ -0,0 +1,217 @@
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+# Latency buckets in seconds, from a cached lookup to a deep roadmap level
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Node/edge count buckets for graph sizes
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def _label_key(labels: Dict[str, Any]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+def _format_labels(key: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms rendered in the Prometheus text format.
+
+    Metrics are created on first use. `describe` only sets the help text, type and
+    (for histograms) buckets, so call sites never need to declare anything up front.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, str] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+        self._counters: Dict[str, Dict[tuple, float]] = {}
+        self._histograms: Dict[str, Dict[tuple, _Histogram]] = {}
+
+    def describe(self, name: str, help: str, buckets: Optional[Tuple[float, ...]] = None) -> None:
+        with self._lock:
+            self._help[name] = help
+            if buckets is not None:
+                self._buckets[name] = tuple(buckets)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets.get(name, LATENCY_BUCKETS))
+            histogram.observe(value)
+
+    def value(self, name: str, **labels) -> float:
+        """Current value of a counter, or the observation count of a histogram."""
+        key = _label_key(labels)
+        with self._lock:
+            if name in self._histograms:
+                histogram = self._histograms[name].get(key)
+                return histogram.total if histogram is not None else 0
+            return self._counters.get(name, {}).get(key, 0)
+
+    def render(self, gauges: Optional[Dict[str, Tuple[str, float]]] = None) -> str:
+        """
+        Render every metric in the Prometheus text exposition format.
+
+        Parameters:
+        gauges (Dict[str, Tuple[str, float]]): Extra point-in-time values to include,
+        as name to (help, value), e.g. cache sizes read at scrape time.
+
+        Returns:
+        str: The exposition text.
+        """
+        lines = []
+        with self._lock:
+            for name in sorted(self._counters):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(self._counters[name].items()):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+
+            for name in sorted(self._histograms):
+                lines.append(f"# HELP {name} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {histogram.total}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.total}")
+
+        for name, (help, value) in sorted((gauges or {}).items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+class RequestTimings:
+    """Total time and count per stage for one request, reported as a Server-Timing header."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Tuple[float, int]] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            total, count = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, count + 1)
+
+    def server_timing(self) -> str:
+        with self._lock:
+            items = list(self.stages.items())
+        # Stages that ran concurrently (e.g. call_llm) add up to more than the wall time
+        return ', '.join(f'{stage};dur={total * 1000:.1f};desc="{count}x"' for stage, (total, count) in items)
+
+# Shared by every rmg stage in the process
+METRICS = MetricsRegistry()
+METRICS.describe("rmg_stage_seconds", "Time spent in each roadmap pipeline stage")
+METRICS.describe("rmg_stage_errors_total", "Pipeline stages that raised")
+METRICS.describe("rmg_graph_nodes", "Number of nodes in the graph a stage returned", buckets=SIZE_BUCKETS)
+METRICS.describe("rmg_graph_edges", "Number of edges in the graph a stage returned", buckets=SIZE_BUCKETS)
+METRICS.describe("rmg_llm_calls_total", "LLM completions requested, by response model")
+METRICS.describe("rmg_llm_retries_total", "LLM completions repeated because the answer was unusable")
+METRICS.describe("rmg_llm_tokens_total", "Tokens used by LLM completions, by kind")
+METRICS.describe("rmg_serper_requests_total", "HTTP requests sent to Serper")
+METRICS.describe("rmg_serper_queries_total", "Search queries sent to Serper")
+METRICS.describe("rmg_serper_retries_total", "Serper requests repeated on a fresh connection")
+
+_request_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar("rmg_request_timings", default=None)
+
+def start_request_timings() -> RequestTimings:
+    """Collect stage timings of the current context (and of work it hands to `in_context`) into a new RequestTimings."""
+    timings = RequestTimings()
+    _request_timings.set(timings)
+    return timings
+
+def in_context(fn: Callable) -> Callable:
+    """
+    Bind `fn` to a copy of the caller's context, so stage timings it records in a worker
+    thread still reach the request that started it. Use one per submitted task.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+@contextmanager
+def timed(stage: str, **labels) -> Iterator[None]:
+    """Record the duration of the block in the stage histogram and the current request's timings."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        METRICS.inc("rmg_stage_errors_total", stage=stage, **labels)
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        METRICS.observe("rmg_stage_seconds", seconds, stage=stage, **labels)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add(stage, seconds)
+
+def record_graph(stage: str, graph) -> None:
+    METRICS.observe("rmg_graph_nodes", graph.number_of_nodes(), stage=stage)
+    METRICS.observe("rmg_graph_edges", graph.number_of_edges(), stage=stage)
+
+def record_llm_call(response_model: str, completion, attempt: int) -> None:
+    """Count one LLM completion, whether it was a retry, and its token usage if the client reports it."""
+    METRICS.inc("rmg_llm_calls_total", response_model=response_model)
+    if attempt:
+        METRICS.inc("rmg_llm_retries_total", response_model=response_model)
+
+    # instructor keeps the raw OpenAI response, with its usage, on the parsed model
+    usage = getattr(getattr(completion, '_raw_response', None), 'usage', None)
+    if usage is not None:
+        METRICS.inc("rmg_llm_tokens_total", getattr(usage, 'prompt_tokens', 0) or 0, kind="prompt")
+        METRICS.inc("rmg_llm_tokens_total", getattr(usage, 'completion_tokens', 0) or 0, kind="completion")
+
+def measured(stage: str) -> Callable:
+    """Decorator timing a function as `stage`, and recording the size of the graph it returns."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                result = fn(*args, **kwargs)
+            if hasattr(result, 'number_of_nodes'):
+                record_graph(stage, result)
+            return result
+        return wrapper
+    return decorator
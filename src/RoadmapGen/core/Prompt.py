@@ -3,4 +3,16 @@ class LlmPrompt:
         prompt_template = """Main Topic: {main_topic}
         Current Topic: {current_topic}
         Current Topic Description: {current_description}"""
-        return prompt_template
\ No newline at end of file
+        return prompt_template
+
+    def getbatchprompt():
+        prompt_template = """Main Topic: {main_topic}
+        Expand every current topic below on its own. Answer with one entry per current topic, in the same order, and repeat its name exactly as the topic.
+
+        {topics}"""
+        return prompt_template
+
+    def getbatchitem():
+        prompt_template = """Current Topic: {current_topic}
+        Current Topic Description: {current_description}"""
+        return prompt_template
@@ -1,9 +1,22 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 import networkx as nx
 from networkx.drawing.nx_pydot import graphviz_layout
-from typing import List, Tuple
-from pydantic import BaseModel, Field
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+import json
+from pydantic import BaseModel, Field, ValidationError
 from . import Prompt
+from . import Metrics
+from .Budget import BudgetExhausted, GenerationBudget
+
+# Raised by instructor once its own retries are used up; older releases keep it in instructor.exceptions
+try:
+    from instructor.core import InstructorRetryException
+except ImportError:
+    try:
+        from instructor.exceptions import InstructorRetryException
+    except ImportError:
+        InstructorRetryException = ValidationError
 
 class TopicInfo(BaseModel):
     topic: str = Field(
@@ -19,68 +32,364 @@ class TopicInfo(BaseModel):
         description="A list of description of prerequisite topics"
     )
 
+class TopicInfoBatch(BaseModel):
+    topics: List[TopicInfo] = Field(
+        description="One entry per current topic, in the order they were given"
+    )
+
 class Generator:
-    def __init__(self, client):
+    def __init__(self, client, max_workers: int = 8, memo=None, model: str = "gpt-4o-mini", executor=None, rate_limiter=None, batch_size: int = 1, canonicalizer=None, controller=None):
         self.client = client
+        # Upper bound on LLM calls in flight while expanding one level
+        self.max_workers = max(1, max_workers)
+        # Optional TopicMemo; expansions found in it are not sent to the LLM
+        self.memo = memo
+        self.model = model
+        # Optional executor shared with other generators (e.g. a BatchGenerator); a pool per level otherwise
+        self.executor = executor
+        # Optional RateLimiter every LLM call, retries included, waits on
+        self.rate_limiter = rate_limiter
+        # Sibling leaves expanded by one call; 1 sends a call per leaf
+        self.batch_size = max(1, batch_size)
+        # Optional TopicCanonicalizer; near-duplicate prerequisites join the node they duplicate
+        self.canonicalizer = canonicalizer
+        # Optional CallLane (see CallController) giving every call rate limits, adaptive concurrency, timeouts and backoff
+        self.controller = controller
+
+    # Function to send one structured completion, through the call controller when there is one
+    def create(self, response_model, messages: List[dict], model: str, budget: Optional[GenerationBudget] = None):
+        def send(timeout: Optional[float] = None):
+            # Every attempt, retries included, is paid for out of the budget
+            if budget is not None and not budget.reserve_llm_call():
+                raise BudgetExhausted(budget.reason)
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            options = {"timeout": timeout} if timeout is not None else {}
+            return self.client.chat.completions.create(model=model, response_model=response_model, messages=messages, **options)
+
+        if self.controller is None:
+            return send()
+        return self.controller.call(send, budget=budget)
     # Function to call the LLM with the given prompt
-    def call_llm(self, prompt: str, model="gpt-4o-mini", retries=3) -> Tuple[str, str, List[str], List[str]]:
-        for _ in range(retries):
-            completion = self.client.chat.completions.create(
-                model=model,
-                response_model=TopicInfo,
-                messages=[
-                    {"role": "system", "content": "You are a learning roadmap planner for a main topic. You will be given a current topic and you have to provide a list of prerequisite topics and descriptions."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
+    def call_llm(self, prompt: str, model="gpt-4o-mini", retries=3, budget: Optional[GenerationBudget] = None) -> Tuple[str, str, List[str], List[str]]:
+        for attempt in range(retries):
+            with Metrics.timed("call_llm"):
+                completion = self.create(
+                    TopicInfo,
+                    [
+                        {"role": "system", "content": "You are a learning roadmap planner for a main topic. You will be given a current topic and you have to provide a list of prerequisite topics and descriptions."},
+                        {"role": "user", "content": prompt}
+                    ],
+                    model=model,
+                    budget=budget
+                )
+            Metrics.record_llm_call("TopicInfo", completion, attempt)
             if len(completion.prerequisite_topics) == len(completion.description_prerequisite_topics):
                 return completion.topic, completion.description, completion.prerequisite_topics, completion.description_prerequisite_topics
         raise ValueError("Mismatched prerequisite and description lengths after retries")
     
-    def clean_text(self,text: str):
-        return text.replace(':', '-')
+    # Function to expand several topics of the same main topic with one call
+    def call_llm_batch(self, main_topic: str, topics: List[Tuple[str, str]], budget: Optional[GenerationBudget] = None) -> List[Optional[Tuple[str, str, List[str], List[str]]]]:
+        """
+        Expand `topics` with a single structured call.
 
-    # Function to generate the knowledge graph roadmap
-    def generate_roadmap(self, prompt: str, depth: int, retries: int) -> nx.DiGraph:
-        graph = nx.DiGraph()
-        root_topic, root_description, root_prerequisites, root_description_prerequisites = self.call_llm(prompt, retries=retries)
+        Returns:
+        List: One result per topic, in order. Topics missing from the answer, or with
+        mismatched prerequisite and description lengths, are None so the caller can
+        retry them on their own. An answer that fails validation gives None for every
+        topic; any other error of the call is raised.
+        """
+        items = "\n\n".join(
+            Prompt.LlmPrompt.getbatchitem().format(current_topic=topic, current_description=description)
+            for topic, description in topics
+        )
+        try:
+            with Metrics.timed("call_llm_batch"):
+                completion = self.create(
+                    TopicInfoBatch,
+                    [
+                        {"role": "system", "content": "You are a learning roadmap planner for a main topic. You will be given several current topics and you have to provide, for each one, a list of prerequisite topics and descriptions."},
+                        {"role": "user", "content": Prompt.LlmPrompt.getbatchprompt().format(main_topic=main_topic, topics=items)}
+                    ],
+                    model=self.model,
+                    budget=budget
+                )
+        except (InstructorRetryException, ValidationError) as e:
+            # Only an answer that does not fit the batch schema falls back to one call per topic;
+            # auth errors, unknown models or exhausted rate limits would only fail N more times
+            if not self.invalid_answer(e):
+                raise
+            return [None] * len(topics)
+        Metrics.record_llm_call("TopicInfoBatch", completion, 0)
 
-        root_topic = self.clean_text(root_topic)
-        root_description = self.clean_text(root_description)
-        root_prerequisites = [self.clean_text(x) for x in root_prerequisites]
-        root_description_prerequisites = [self.clean_text(x) for x in root_description_prerequisites]
+        # Entries are matched on their topic; order is only trusted when the counts agree
+        answers = {self.clean_text(entry.topic).strip().lower(): entry for entry in completion.topics}
+        results = []
+        for index, (topic, _) in enumerate(topics):
+            entry = answers.get(self.clean_text(topic).strip().lower())
+            if entry is None and len(completion.topics) == len(topics):
+                entry = completion.topics[index]
+            if entry is None or len(entry.prerequisite_topics) != len(entry.description_prerequisite_topics):
+                results.append(None)
+            else:
+                results.append((entry.topic, entry.description, entry.prerequisite_topics, entry.description_prerequisite_topics))
+        return results
 
-        graph.add_node(root_topic, description=root_description)
+    # Function to tell an answer that failed validation from a call that failed
+    def invalid_answer(self, error: BaseException) -> bool:
+        # instructor raises its retry exception from the last error, which may be an API error as well
+        while isinstance(error, InstructorRetryException) and error.__cause__ is not None:
+            error = error.__cause__
+        return isinstance(error, (ValidationError, json.JSONDecodeError))
 
-        for topic, description in zip(root_prerequisites, root_description_prerequisites):
-            if not graph.has_node(topic):
+    def clean_text(self,text: str):
+        return text.replace(':', '-')
+
+    # Function to connect a topic to its prerequisites, reusing nodes that already exist
+    def add_prerequisites(self, graph: nx.DiGraph, topic: str, prerequisites: List[str], descriptions: List[str], index=None) -> None:
+        prerequisites = [self.clean_text(x) for x in prerequisites]
+        descriptions = [self.clean_text(x) for x in descriptions]
+
+        for child_topic, child_description in zip(prerequisites, descriptions):
+            if index is not None and not graph.has_node(child_topic):
+                canonical = index.resolve(child_topic)
+                if canonical != child_topic:
+                    # The near-duplicate is kept as an alias of the node it joins
+                    aliases = graph.nodes[canonical].setdefault('aliases', [])
+                    if child_topic not in aliases:
+                        aliases.append(child_topic)
+                    child_topic = canonical
+                if child_topic == topic:
+                    continue
+            if not graph.has_node(child_topic):
                 # Add the new node and connect it
-                graph.add_node(topic, description=description)
-                graph.add_edge(root_topic, topic)
+                graph.add_node(child_topic, description=child_description)
+                graph.add_edge(topic, child_topic)
             else:
                 # If the node exists but the edge does not, add the edge
-                if not graph.has_edge(root_topic, topic):
-                    graph.add_edge(root_topic, topic)
+                if not graph.has_edge(topic, child_topic):
+                    graph.add_edge(topic, child_topic)
+
+    # Function to expand many prompts at once with a bounded number of concurrent LLM calls
+    def expand_level(self, prompts: List[str], retries: int, desc: str = "Expanding nodes", budget: Optional[GenerationBudget] = None) -> List[Optional[Tuple[str, str, List[str], List[str]]]]:
+        return self.run_calls(lambda prompt: self.call_llm(prompt, model=self.model, retries=retries, budget=budget), prompts, desc, budget)
+
+    # Function to run one LLM-calling function per item with bounded concurrency, returning results in item order
+    def run_calls(self, fn: Callable[[Any], Any], items: List[Any], desc: str, budget: Optional[GenerationBudget] = None) -> List[Optional[Any]]:
+        if not items:
+            return []
+
+        executor = self.executor or ThreadPoolExecutor(max_workers=min(self.max_workers, len(items)))
+        futures = []
+        try:
+            futures = [executor.submit(Metrics.in_context(fn), item) for item in items]
+            try:
+                timeout = budget.remaining_time() if budget is not None else None
+                for future in tqdm(as_completed(futures, timeout=timeout), total=len(futures), desc=desc):
+                    # Surface the first failure right away instead of waiting for the whole level
+                    if not isinstance(future.exception(), BudgetExhausted):
+                        future.result()
+            except TimeoutError:
+                budget.expired()
+            # Results are returned in item order, not completion order; items the budget stopped are None
+            return [self.budget_result(future) for future in futures]
+        finally:
+            if self.executor is None:
+                # Past the deadline, calls still in flight are abandoned instead of awaited
+                executor.shutdown(wait=budget is None or not budget.expired(), cancel_futures=True)
+            else:
+                # A shared executor stays up, only this level's queued calls are dropped
+                for future in futures:
+                    future.cancel()
+
+    # Function to read the result of a level future, or None if the budget stopped it
+    def budget_result(self, future) -> Optional[Any]:
+        if not future.done() or future.cancelled() or isinstance(future.exception(), BudgetExhausted):
+            return None
+        return future.result()
+
+    # Function to expand the given (topic, description) pairs of one level, answering from the memo when possible
+    def expand_topics(self, main_topic: str, topics: List[Tuple[str, str]], retries: int, desc: str = "Expanding nodes", budget: Optional[GenerationBudget] = None) -> List[Optional[Tuple[str, str, List[str], List[str]]]]:
+        results = [None] * len(topics)
+        missing = []
+        for index, (topic, _) in enumerate(topics):
+            cached = self.memo.get(self.model, main_topic, topic) if self.memo is not None else None
+            if cached is not None:
+                results[index] = (cached.topic, cached.description, cached.prerequisite_topics, cached.description_prerequisite_topics)
+            else:
+                missing.append(index)
+
+        # Expansions are stored as soon as they are made, so a failure later in the level
+        # does not lose them (e.g. to a checkpoint used as the memo)
+        def expand_chunk(chunk: List[int]) -> List[Optional[Tuple[str, str, List[str], List[str]]]]:
+            answer = self.call_llm_batch(main_topic, [topics[index] for index in chunk], budget=budget)
+            for index, result in zip(chunk, answer):
+                if result is not None:
+                    self.store_expansion(results, main_topic, topics, index, result)
+            return answer
+
+        def expand_one(index: int) -> Tuple[str, str, List[str], List[str]]:
+            prompt = Prompt.LlmPrompt.getprompt().format(main_topic=main_topic, current_topic=topics[index][0], current_description=topics[index][1])
+            result = self.call_llm(prompt, model=self.model, retries=retries, budget=budget)
+            self.store_expansion(results, main_topic, topics, index, result)
+            return result
+
+        if self.batch_size > 1 and len(missing) > 1:
+            chunks = [missing[start:start + self.batch_size] for start in range(0, len(missing), self.batch_size)]
+            answers = self.run_calls(expand_chunk, chunks, desc, budget)
+            # Topics the batched answer left out or got wrong are retried one by one;
+            # a chunk stopped by the budget has no answer at all and is not retried
+            missing = [
+                index
+                for chunk, answer in zip(chunks, answers) if answer is not None
+                for index, result in zip(chunk, answer) if result is None
+            ]
+
+        self.run_calls(expand_one, missing, desc, budget)
+        return results
+
+    # Function to record the expansion of one topic in the level results and in the memo
+    def store_expansion(self, results: List[Any], main_topic: str, topics: List[Tuple[str, str]], index: int, result: Optional[Tuple[str, str, List[str], List[str]]]) -> None:
+        results[index] = result
+        if self.memo is not None and result is not None:
+            self.memo.set(self.model, main_topic, topics[index][0], self.to_topic_info(result))
+
+    # Function to expand the user prompt into the root topic, answering from the memo when possible
+    def expand_root(self, prompt: str, retries: int, budget: Optional[GenerationBudget] = None) -> Tuple[str, str, List[str], List[str]]:
+        # The root is memoized on the raw prompt since its main topic is not known yet
+        cached = self.memo.get(self.model, None, prompt) if self.memo is not None else None
+        if cached is not None:
+            return cached.topic, cached.description, cached.prerequisite_topics, cached.description_prerequisite_topics
+
+        result = self.call_llm(prompt, model=self.model, retries=retries, budget=budget)
+        if self.memo is not None:
+            self.memo.set(self.model, None, prompt, self.to_topic_info(result))
+        return result
+
+    def to_topic_info(self, result: Tuple[str, str, List[str], List[str]]) -> TopicInfo:
+        topic, description, prerequisites, descriptions = result
+        return TopicInfo(topic=topic, description=description, prerequisite_topics=prerequisites, description_prerequisite_topics=descriptions)
+
+    # Function to build the roadmap level by level, yielding after each level
+    def iter_roadmap(self, prompt: str, depth: int, retries: int, budget: Optional[GenerationBudget] = None, start: Optional[Tuple[nx.DiGraph, int]] = None) -> Iterator[Tuple[nx.DiGraph, List[str], List[Tuple[str, str]]]]:
+        """
+        Build the roadmap one level at a time.
+
+        With a budget, generation stops at the level where a limit runs out: the leaves
+        that were not expanded are flagged `unexpanded`, graph.graph['partial'] is set and
+        the graph built so far is yielded as the last level.
+
+        Parameters:
+        start (Tuple[nx.DiGraph, int]): Optional graph of an earlier run with the number of
+        levels it had completed, e.g. from a checkpoint. Generation goes on from the next
+        level and only the levels still to come are yielded.
+
+        Raises:
+        BudgetExhausted: If the budget runs out before the root topic is known.
+
+        Yields:
+        Tuple: The graph so far, the nodes added by this level and the edges added by this level.
+        """
+        if start is not None:
+            graph, levels_done = start
+            # The root is always the first node added
+            root_topic = next(iter(graph.nodes))
+            index = self.canonicalizer.index(graph.nodes) if self.canonicalizer is not None else None
+        else:
+            graph, levels_done = nx.DiGraph(), 1
+            with Metrics.timed("generate_level", level="1"):
+                root_topic, root_description, root_prerequisites, root_description_prerequisites = self.expand_root(prompt, retries=retries, budget=budget)
+
+                root_topic = self.clean_text(root_topic)
+                root_description = self.clean_text(root_description)
+
+                graph.add_node(root_topic, description=root_description)
+                index = self.canonicalizer.index([root_topic]) if self.canonicalizer is not None else None
+                self.add_prerequisites(graph, root_topic, root_prerequisites, root_description_prerequisites, index)
+            yield graph, list(graph.nodes), list(graph.out_edges(root_topic))
             
-        for current_depth in range(depth - 1):
-            leaf_nodes = [node for node in graph.nodes if graph.out_degree(node) == 0]
-
-            for topic in tqdm(leaf_nodes, desc="Expanding nodes at current depth {depth}".format(depth=current_depth + 2)):
-                current_description = graph.nodes[topic]['description']
-                child_topic, child_description, child_prerequisites, child_description_prerequisites = self.call_llm(
-                    Prompt.LlmPrompt.getprompt().format(main_topic=root_topic, current_topic=topic, current_description=current_description),
-                    retries=retries
+        for current_depth in range(levels_done - 1, depth - 1):
+            # Only the work of the level is timed, not the consumer of the yield
+            with Metrics.timed("generate_level", level=str(current_depth + 2)):
+                leaf_nodes = [node for node in graph.nodes if graph.out_degree(node) == 0]
+                known_nodes = graph.number_of_nodes()
+                skipped = []
+                if budget is not None:
+                    selected = self.leaves_within_budget(graph, leaf_nodes, budget)
+                    skipped = leaf_nodes[len(selected):]
+                    leaf_nodes = selected
+
+                # Memoized leaves are answered without the LLM, and so are their memoized children
+                # on the next level, so a whole cached subtree is replayed without any call
+                results = self.expand_topics(
+                    root_topic,
+                    [(topic, graph.nodes[topic]['description']) for topic in leaf_nodes],
+                    retries=retries,
+                    desc="Expanding nodes at current depth {depth}".format(depth=current_depth + 2),
+                    budget=budget
                 )
 
-                child_prerequisites = [self.clean_text(x) for x in child_prerequisites]
-                child_description_prerequisites = [self.clean_text(x) for x in child_description_prerequisites]
+                # Merge in leaf order so the graph is the same whichever call finished first
+                for topic, result in zip(leaf_nodes, results):
+                    if result is None or not self.fits_budget(graph, result[2], budget):
+                        skipped.append(topic)
+                        continue
+                    self.add_prerequisites(graph, topic, result[2], result[3], index)
+
+            # Nodes keep insertion order, so the new ones are at the end
+            new_nodes = list(graph.nodes)[known_nodes:]
+            if skipped:
+                # The leaves just added would have been expanded by the levels still to come
+                last_level = current_depth == depth - 2
+                self.flag_unexpanded(graph, skipped if last_level else skipped + new_nodes, budget)
+                yield graph, new_nodes, list(graph.out_edges(leaf_nodes))
+                break
+            yield graph, new_nodes, list(graph.out_edges(leaf_nodes))
+
+    # Function to choose the leaves of the next level that the budget can still pay for
+    def leaves_within_budget(self, graph: nx.DiGraph, leaf_nodes: List[str], budget: GenerationBudget) -> List[str]:
+        if budget.expired():
+            return []
+        limit = len(leaf_nodes)
 
-                for child_topic, child_description in zip(child_prerequisites, child_description_prerequisites):
-                    if not graph.has_node(child_topic):
-                        graph.add_node(child_topic, description=child_description)
-                        graph.add_edge(topic, child_topic)
-                    else:
-                        if not graph.has_edge(topic, child_topic):
-                            graph.add_edge(topic, child_topic)
+        calls_left = budget.llm_calls_left()
+        if calls_left is not None and calls_left * self.batch_size < limit:
+            limit = calls_left * self.batch_size
+            budget.exhaust("max_llm_calls")
 
+        nodes_left = budget.nodes_left(graph.number_of_nodes())
+        if nodes_left is not None:
+            # Estimate the children of a leaf from the fan-out of the nodes expanded so far
+            parents = sum(1 for node in graph.nodes if graph.out_degree(node) > 0)
+            fan_out = max(1, round(graph.number_of_edges() / max(1, parents)))
+            if nodes_left // fan_out < limit:
+                limit = nodes_left // fan_out
+                budget.exhaust("max_nodes")
+
+        return leaf_nodes[:limit]
+
+    # Function to check that merging an expansion keeps the graph within max_nodes
+    def fits_budget(self, graph: nx.DiGraph, prerequisites: List[str], budget: Optional[GenerationBudget]) -> bool:
+        if budget is None or budget.max_nodes is None:
+            return True
+        new_topics = {self.clean_text(topic) for topic in prerequisites} - set(graph.nodes)
+        if graph.number_of_nodes() + len(new_topics) > budget.max_nodes:
+            budget.exhaust("max_nodes")
+            return False
+        return True
+
+    # Function to flag the leaves the budget left unexpanded and mark the graph as partial
+    def flag_unexpanded(self, graph: nx.DiGraph, nodes: List[str], budget: Optional[GenerationBudget]) -> None:
+        for node in nodes:
+            graph.nodes[node]['unexpanded'] = True
+        graph.graph['partial'] = True
+        if budget is not None:
+            graph.graph['budget'] = budget.to_dict()
+
+    # Function to generate the knowledge graph roadmap
+    @Metrics.measured("generate_roadmap")
+    def generate_roadmap(self, prompt: str, depth: int, retries: int, budget: Optional[GenerationBudget] = None) -> nx.DiGraph:
+        graph = None
+        for graph, _, _ in self.iter_roadmap(prompt=prompt, depth=depth, retries=retries, budget=budget):
+            pass
         return graph
\ No newline at end of file
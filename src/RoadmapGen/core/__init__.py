@@ -1,3 +1,9 @@
 from .RoadmapGenerator import TopicInfo
+from .RoadmapGenerator import TopicInfoBatch
 from .RoadmapGenerator import Generator
-from .Prompt import LlmPrompt
\ No newline at end of file
+from .Prompt import LlmPrompt
+from .Metrics import MetricsRegistry
+from .Metrics import RequestTimings
+from .Metrics import METRICS
+from .Budget import GenerationBudget
+from .Budget import BudgetExhausted
@@ -1,8 +1,12 @@
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel, Field
 from typing import List, Tuple, Optional
 from tqdm import tqdm
 import networkx as nx
 
+from ..core import Metrics
+from .candidateblocker import CandidateBlocker, UnionFind
+
 # Define a RedundantGroup class to structure the LLM response for redundant nodes
 class RedundantGroup(BaseModel):
     group: List[List[str]] = Field(description="List of List of similar/redundant topic groups")
@@ -13,94 +17,165 @@ class MergedTopic(BaseModel):
     description: str = Field(description="The description of this topic")
 
 class RedundantFunc:
-    def __init__(self, client):
+    def __init__(self, client, max_workers: int = 4, chunk_size: int = 40, blocker: Optional[CandidateBlocker] = None, controller=None):
         self.client = client
+        # Grouping prompts run in parallel, each with at most chunk_size candidate topics
+        self.max_workers = max(1, max_workers)
+        self.chunk_size = max(2, chunk_size)
+        self.blocker = blocker if blocker is not None else CandidateBlocker()
+        # Optional CallLane (see CallController) every LLM call goes through
+        self.controller = controller
 
     def clean_text(self,text: str):
         return text.replace(':', '-')
     
-    # Function to merge lists of redundant nodes
-    def merge_redundant_lists(self, lists: List[List[str]]) -> List[List[str]]:
-        merged_lists = []
-
-        while lists:
-            first, *rest = lists
-            first = set(first)
-            combined = first
-
-            rest_copy = rest[:]
-            for lst in rest_copy:
-                if first.intersection(lst):
-                    combined.update(lst)
-                    rest.remove(lst)
+    # Function to send one structured completion, through the call controller when there is one
+    def create(self, **kwargs):
+        def send(timeout: Optional[float] = None):
+            options = {"timeout": timeout} if timeout is not None else {}
+            return self.client.chat.completions.create(**kwargs, **options)
 
-            merged_lists.append(list(combined))
-            lists = rest
+        if self.controller is None:
+            return send()
+        return self.controller.call(send)
 
-        return merged_lists
+    # Function to merge lists of redundant nodes that share at least one topic
+    def merge_redundant_lists(self, lists: List[List[str]]) -> List[List[str]]:
+        union_find = UnionFind()
+        for lst in lists:
+            union_find.union_all(lst)
+        return union_find.groups()
     
-    # Function to call the LLM for merging redundant topics
-    def call_llm_redundant_grouper(self, prompt: str, retries: int = 3) -> Tuple[str, str]:
-        for _ in range(retries):
-            completion = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                response_model=RedundantGroup,
-                temperature=0,
-                max_retries=0,
-                messages=[
-                    {"role": "system", "content": "You are a learning roadmap planner for a main topic. You will be given a list of prerequisite topics. Your task is to identify and group redundant or similar topics."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            if completion.group:
+    # Function to call the LLM for grouping redundant topics
+    def call_llm_redundant_grouper(self, prompt: str, retries: int = 3, allow_empty: bool = False) -> List[List[str]]:
+        for attempt in range(retries):
+            with Metrics.timed("redundant_group"):
+                completion = self.create(
+                    model="gpt-4o-mini",
+                    response_model=RedundantGroup,
+                    temperature=0,
+                    max_retries=0,
+                    messages=[
+                        {"role": "system", "content": "You are a learning roadmap planner for a main topic. You will be given a list of prerequisite topics. Your task is to identify and group redundant or similar topics."},
+                        {"role": "user", "content": prompt}
+                    ]
+                )
+            Metrics.record_llm_call("RedundantGroup", completion, attempt)
+            # A candidate chunk may legitimately have nothing redundant in it
+            if completion.group or allow_empty:
                 return completion.group
         raise ValueError("Failed to group redundant topics after retries")
     
     # Function to call the LLM for merging redundant topics
     def call_llm_redundant_merger(self, prompt: str, retries: int = 3) -> Tuple[str, str]:
-        for _ in range(retries):
-            completion = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                response_model=MergedTopic,
-                messages=[
-                    {"role": "system", "content": "You are a redundant topic merger for a main topic. You will be given a list of redundant topics and you have to provide a merged topic and description."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
+        for attempt in range(retries):
+            with Metrics.timed("redundant_merge"):
+                completion = self.create(
+                    model="gpt-4o-mini",
+                    response_model=MergedTopic,
+                    messages=[
+                        {"role": "system", "content": "You are a redundant topic merger for a main topic. You will be given a list of redundant topics and you have to provide a merged topic and description."},
+                        {"role": "user", "content": prompt}
+                    ]
+                )
+            Metrics.record_llm_call("MergedTopic", completion, attempt)
             if completion.topic and completion.description:
                 return completion.topic, completion.description
         raise ValueError("Failed to merge redundant topics after retries")
     
-    # Function to remove redundant nodes from the graph
-    def remove_redundant_nodes(self, graph: nx.DiGraph, retries: int = 3) -> nx.DiGraph:
-        root_topic = [n for n, d in graph.in_degree() if d == 0][0]
+    # Function to pack candidate clusters into prompts of at most chunk_size topics
+    def chunk_clusters(self, clusters: List[List[str]]) -> List[List[str]]:
+        chunks = []
+        current = []
+        for cluster in sorted(clusters, key=len, reverse=True):
+            # Oversized clusters are split; pairs that land in different slices are not compared
+            for start in range(0, len(cluster), self.chunk_size):
+                piece = cluster[start:start + self.chunk_size]
+                if len(piece) < 2:
+                    continue
+                if current and len(current) + len(piece) > self.chunk_size:
+                    chunks.append(current)
+                    current = []
+                current = current + piece
+        if current:
+            chunks.append(current)
+        return chunks
+
+    # Function to find groups of redundant nodes, asking the LLM only about local candidate clusters
+    def find_redundant_groups(self, graph: nx.DiGraph, retries: int = 3) -> List[List[str]]:
+        clusters = self.blocker.candidate_clusters({
+            node: (node, graph.nodes[node].get('description', '')) for node in graph.nodes
+        })
+        chunks = self.chunk_clusters(clusters)
+        if not chunks:
+            return []
+
+        prompts = [
+            ''.join(f"{node}\t{graph.nodes[node].get('description', '')}\n" for node in chunk)
+            for chunk in chunks
+        ]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(prompts))) as executor:
+            futures = [executor.submit(Metrics.in_context(self.call_llm_redundant_grouper), prompt, retries=retries, allow_empty=True) for prompt in prompts]
+            chunk_groups = list(tqdm(
+                (future.result() for future in futures),
+                total=len(prompts),
+                desc="Grouping redundant nodes"
+            ))
+
+        # Ignore topics the LLM made up and groups with nothing left to merge
+        groups = []
+        for chunk_group in chunk_groups:
+            for group in chunk_group:
+                group = [topic for topic in group if topic in graph.nodes]
+                if len(group) > 1:
+                    groups.append(group)
+        return [group for group in self.merge_redundant_lists(groups) if len(group) > 1]
 
-        node_text = ''.join(f"{node}\t{graph.nodes[node]['description']}\n" for node in graph.nodes)
+    # Function to ask the LLM for the merged topic of every group, with a bounded number of concurrent calls
+    def merge_groups(self, graph: nx.DiGraph, groups: List[List[str]], retries: int = 3) -> List[Tuple[str, str]]:
+        if not groups:
+            return []
 
-        redundant_list = self.call_llm_redundant_grouper(node_text)
-        redundant_list = self.merge_redundant_lists(redundant_list)
+        prompts = [
+            ''.join(f"{topic}\t{graph.nodes[topic].get('description', '')}\n" for topic in group if topic in graph.nodes)
+            for group in groups
+        ]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(prompts))) as executor:
+            futures = [executor.submit(Metrics.in_context(self.call_llm_redundant_merger), prompt=prompt, retries=retries) for prompt in prompts]
+            merged = list(tqdm(
+                (future.result() for future in futures),
+                total=len(prompts),
+                desc="Merging redundant nodes"
+            ))
+        return [(self.clean_text(topic), self.clean_text(description)) for topic, description in merged]
 
-        for redundant in tqdm(redundant_list, desc="Merging redundant nodes"):
-            node_text = ''.join(f"{topic}\t{graph.nodes[topic]['description']}\n" for topic in redundant if topic in graph.nodes)
-            # Ensure merged_topic is a string or another hashable type
-            merged_topic, merged_description = self.call_llm_redundant_merger(
-                prompt=node_text,
-                retries=retries
-            )
+    # Function to contract every group into its merged node in a single pass
+    def contract_groups(self, graph: nx.DiGraph, groups: List[List[str]], merged: List[Tuple[str, str]]) -> nx.DiGraph:
+        mapping = {}
+        for group, (merged_topic, _) in zip(groups, merged):
+            for topic in group:
+                mapping[topic] = merged_topic
 
-            merged_topic = self.clean_text(merged_topic)
-            merged_description = self.clean_text(merged_description)
+        # Collect the rewired edges before the old nodes (and their edges) are removed
+        rewired = [
+            (mapping.get(source, source), mapping.get(target, target), data)
+            for source, target, data in graph.edges(data=True)
+            if source in mapping or target in mapping
+        ]
+        graph.remove_nodes_from(list(mapping))
 
+        for merged_topic, merged_description in merged:
             graph.add_node(merged_topic, description=merged_description)
+        graph.add_edges_from(rewired)
 
-            for topic in redundant:
-                if topic in graph.nodes:
-                    for parent in graph.predecessors(topic):
-                        graph.add_edge(parent, merged_topic)
-                    for _, child in graph.edges(topic):
-                        graph.add_edge(merged_topic, child)
-                    graph.remove_node(topic)
-            graph.remove_edges_from(nx.selfloop_edges(graph))
-            graph.remove_nodes_from(list(nx.isolates(graph)))
+        graph.remove_edges_from(list(nx.selfloop_edges(graph)))
+        graph.remove_nodes_from(list(nx.isolates(graph)))
         return graph
-    #meow
\ No newline at end of file
+
+    # Function to remove redundant nodes from the graph
+    @Metrics.measured("remove_redundant_nodes")
+    def remove_redundant_nodes(self, graph: nx.DiGraph, retries: int = 3) -> nx.DiGraph:
+        redundant_list = self.find_redundant_groups(graph, retries=retries)
+        merged = self.merge_groups(graph, redundant_list, retries=retries)
+        return self.contract_groups(graph, redundant_list, merged)
+    #meow
@@ -1,7 +1,35 @@
 from .RedunRemover import RedundantGroup
 from .RedunRemover import MergedTopic
 from .RedunRemover import RedundantFunc
+from .candidateblocker import UnionFind
+from .candidateblocker import CandidateBlocker
+from .canonical import TopicIndex
+from .canonical import TopicCanonicalizer
 from .websearch import ResourceFinder
+from .websearch import SerperError
+from .prefetch import ResourcePrefetcher
+from .resourcecache import LRUCache
+from .resourcecache import SqliteCache
+from .resourcecache import ResourceCache
+from .topicmemo import TopicMemo
+from .jobs import Job
+from .jobs import JobQueueFull
+from .jobs import JobRunner
+from .jobs import current_job
+from .clients import ClientRegistry
+from .singleflight import SingleFlight
+from .ratelimit import RateLimiter
+from .callcontrol import CallLane
+from .callcontrol import CallController
+from .batch import BatchGenerator
+from .wireformat import GraphCodec
+from .wireformat import WireFormatError
+from .roadmapstore import RoadmapNotFound
+from .roadmapstore import RoadmapStore
+from .checkpoint import CheckpointNotFound
+from .checkpoint import CheckpointedError
+from .checkpoint import Checkpoint
+from .checkpoint import CheckpointStore
 from .pagerank import ranker
 from .nodeexpander import NodeExpand
 from .nodefixer import GraphFixer
@@ -0,0 +1,161 @@
+import copy
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+import networkx as nx
+
+from ..core import Metrics
+from ..core.RoadmapGenerator import Generator
+from .jsonranker import sortpgscore
+from .nodefixer import GraphFixer
+from .pagerank import ranker
+from .resourcecache import ResourceCache
+from .topicmemo import TopicMemo
+from .websearch import ResourceFinder
+from .wireformat import GraphCodec
+
+class BatchGenerator:
+    """
+    Generates roadmaps for many prompts at once and writes them as JSON lines.
+
+    Up to `max_roadmaps` roadmaps are built at the same time. All their LLM expansions
+    share one pool of `max_workers` threads, and all their Serper lookups share one
+    finder, each behind an optional RateLimiter, so throughput is bounded by the API rate
+    limits rather than by the number of prompts. Work shared inside the batch is done once:
+    repeated prompts are generated once, expansions go through the TopicMemo, and a
+    topic found in several roadmaps is looked up on Serper once.
+    """
+
+    def __init__(self, client, SERPER_API_KEY: Optional[str] = None, max_workers: int = 8, max_roadmaps: int = 4, llm_limiter=None, serper_limiter=None, memo=None, cache=None, http_client=None, model: str = "gpt-4o-mini", batch_size: int = 1, codec=None, store=None, canonicalizer=None, llm_controller=None, serper_controller=None):
+        self.client = client
+        self.SERPER_API_KEY = SERPER_API_KEY
+        self.max_workers = max(1, max_workers)
+        self.max_roadmaps = max(1, max_roadmaps)
+        self.llm_limiter = llm_limiter
+        self.memo = memo if memo is not None else TopicMemo()
+        # Optional CallLane (see CallController) for the OpenAI key; the Serper one goes to the finder
+        self.llm_controller = llm_controller
+        self.finder = ResourceFinder(SERPER_API_KEY, cache=cache if cache is not None else ResourceCache(), http_client=http_client, rate_limiter=serper_limiter, controller=serper_controller)
+        self.model = model
+        # Sibling leaves per LLM call, see Generator
+        self.batch_size = batch_size
+        # Optional TopicCanonicalizer, see Generator
+        self.canonicalizer = canonicalizer
+        self.codec = codec if codec is not None else GraphCodec()
+        # Optional RoadmapStore; stored roadmaps get a roadmap_id and version in their line
+        self.store = store
+        # Topic -> Future of its Serper recommendation, shared by every roadmap of the run
+        self._topics: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.shared_topics = 0
+
+    def normalize(self, prompt: str) -> str:
+        return " ".join(prompt.lower().split())
+
+    # Function to look up the resources of a graph, reusing lookups made for other roadmaps of the batch
+    def add_resources(self, graph: nx.DiGraph) -> None:
+        claimed, shared = [], []
+        with self._lock:
+            for topic in graph.nodes:
+                if topic in self._topics:
+                    shared.append((topic, self._topics[topic]))
+                else:
+                    self._topics[topic] = Future()
+                    claimed.append(topic)
+            self.shared_topics += len(shared)
+
+        try:
+            # Claimed topics are packed into as few Serper requests as possible
+            for topic, recommendation in self.finder.serp_recommendation_batch(claimed, self.SERPER_API_KEY):
+                graph.nodes[topic].update(recommendation)
+                self._topics[topic].set_result(recommendation)
+        except BaseException as e:
+            with self._lock:
+                for topic in claimed:
+                    if not self._topics[topic].done():
+                        self._topics[topic].set_exception(e)
+                        # The next roadmap that meets the topic tries again
+                        del self._topics[topic]
+            raise
+
+        for topic, future in shared:
+            # Each graph gets its own lists, as with the resource cache
+            graph.nodes[topic].update(copy.deepcopy(future.result()))
+
+    # Function to build one roadmap as /graph/full does
+    def build(self, generator: Generator, prompt: str, depth: int, retries: int, resources: bool) -> Dict[str, Any]:
+        graph = generator.generate_roadmap(prompt=prompt, depth=depth, retries=retries)
+        if resources:
+            with Metrics.timed("batch_resources"):
+                self.add_resources(graph)
+        graph = ranker().get_page_rank(graph=graph)
+        graph = GraphFixer().fix_graph(graph)
+        graph = sortpgscore().graphsortattribute(graph)
+
+        ids = {}
+        if self.store is not None:
+            roadmap_id, version = self.store.create(graph, meta={"prompt": prompt}, operation="batch")
+            ids = {"roadmap_id": roadmap_id, "version": version}
+        return self.codec.to_data(graph, prompt=prompt, **ids)
+
+    @Metrics.measured("batch")
+    def run(self, prompts: List[str], output_path: str, depth: int = 3, retries: int = 2, resources: bool = True) -> Dict[str, Any]:
+        """
+        Generate a roadmap per prompt and append each one to `output_path` as soon as it is done.
+
+        Parameters:
+        prompts (List[str]): The prompts, repeated ones are generated once.
+        output_path (str): The JSON Lines file to write.
+        depth (int): The depth of every roadmap.
+        retries (int): The number of retries for each LLM call.
+        resources (bool): Whether to look up Serper resources.
+
+        Returns:
+        dict: Counts of the run. Every prompt gets one line, in completion order, with
+        its `index` in `prompts`; a failed prompt gets an `error` instead of a roadmap.
+        """
+        start = time.perf_counter()
+        groups: Dict[str, List[int]] = {}
+        for index, prompt in enumerate(prompts):
+            groups.setdefault(self.normalize(prompt), []).append(index)
+
+        if resources and self.SERPER_API_KEY is None:
+            raise ValueError("A SERPER_API_KEY is needed to look up resources")
+
+        with self._lock:
+            self._topics = {}
+            self.shared_topics = 0
+        summary = {"prompts": len(prompts), "unique_prompts": len(groups), "succeeded": 0, "failed": 0, "output": output_path}
+
+        llm_pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="rmg-batch-llm")
+        generator = Generator(client=self.client, max_workers=self.max_workers, memo=self.memo, model=self.model, executor=llm_pool, rate_limiter=self.llm_limiter, batch_size=self.batch_size, canonicalizer=self.canonicalizer, controller=self.llm_controller)
+        try:
+            with open(output_path, "w", encoding="utf-8") as output, ThreadPoolExecutor(max_workers=self.max_roadmaps, thread_name_prefix="rmg-batch") as roadmaps:
+                futures = {
+                    roadmaps.submit(Metrics.in_context(self.build), generator, prompts[indices[0]], depth, retries, resources): indices
+                    for indices in groups.values()
+                }
+                for future in as_completed(futures):
+                    try:
+                        data, error = future.result(), None
+                    except Exception as e:
+                        data, error = None, f"{type(e).__name__}: {e}"
+
+                    for index in futures[future]:
+                        if error is None:
+                            line = dict(data, index=index, prompt=prompts[index])
+                            summary["succeeded"] += 1
+                        else:
+                            line = {"index": index, "prompt": prompts[index], "error": error}
+                            summary["failed"] += 1
+                        output.write(self.codec.dumps(line).decode("utf-8") + "\n")
+                    # Lines are readable while the rest of the batch is still running
+                    output.flush()
+        finally:
+            llm_pool.shutdown(wait=True, cancel_futures=True)
+
+        summary["shared_topics"] = self.shared_topics
+        summary["seconds"] = time.perf_counter() - start
+        return summary
@@ -0,0 +1,242 @@
+import hashlib
+import http.client
+import random
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from ..core import Metrics
+from ..core.Budget import BudgetExhausted
+from .ratelimit import RateLimiter
+
+Metrics.METRICS.describe("rmg_call_retries_total", "Outbound calls retried after a throttled or transient failure")
+Metrics.METRICS.describe("rmg_call_throttled_total", "Outbound calls answered with 429 or another rate-limit error")
+Metrics.METRICS.describe("rmg_call_failures_total", "Outbound calls that failed after their last attempt")
+
+# Status codes worth another attempt; 429 (and Anthropic-style 529) also mean "slow down"
+THROTTLED_STATUS = {429, 529}
+TRANSIENT_STATUS = {408, 409, 500, 502, 503, 504}
+# OpenAI SDK errors that carry no status code but are worth another attempt
+TRANSIENT_ERRORS = {"APIConnectionError", "APITimeoutError"}
+
+def _status(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None) or getattr(response, "status", None)
+    return status if isinstance(status, int) else None
+
+def classify(error: BaseException) -> Optional[str]:
+    """
+    Tell whether a failed call is worth another attempt.
+
+    Returns:
+    str: "throttled" for rate-limit errors, "transient" for timeouts, connection errors and
+    server errors, or None for errors another attempt would not fix. Wrapped errors (e.g. an
+    instructor retry exception around an OpenAI error) are classified by their cause.
+    """
+    seen = 0
+    while error is not None and seen < 5:
+        if isinstance(error, BudgetExhausted):
+            return None
+        status = _status(error)
+        if status in THROTTLED_STATUS:
+            return "throttled"
+        if status in TRANSIENT_STATUS:
+            return "transient"
+        if isinstance(error, (TimeoutError, ConnectionError, http.client.HTTPException, httpx.TransportError)):
+            return "transient"
+        if any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__):
+            return "transient"
+        if any(cls.__name__ == "RateLimitError" for cls in type(error).__mro__):
+            return "throttled"
+        error = error.__cause__ or error.__context__
+        seen += 1
+    return None
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """The delay asked for by a Retry-After header of the failed response, if any."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or getattr(error, "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+class CallLane:
+    """
+    Outbound calls to one provider with one API key.
+
+    Calls wait on the key's token bucket and the provider's, then for one of `limit`
+    concurrency slots. The limit follows AIMD: every successful call raises it by about one
+    per `limit` calls, and a throttled call (or one slower than the latency target) multiplies
+    it by `decrease`, at most once per round trip. Throttled and transient failures are
+    retried with full-jitter exponential backoff, honoring Retry-After.
+    """
+
+    def __init__(self, provider: str, key_limiter: Optional[RateLimiter], provider_limiter: Optional[RateLimiter], max_concurrency: int, min_concurrency: int, attempts: int, timeout: Optional[float], base_delay: float, max_delay: float, decrease: float, latency_target: Optional[float]):
+        self.provider = provider
+        self.key_limiter = key_limiter
+        self.provider_limiter = provider_limiter
+        self.max_concurrency = max(1, max_concurrency)
+        self.min_concurrency = max(1, min(min_concurrency, self.max_concurrency))
+        self.attempts = max(1, attempts)
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.decrease = decrease
+        self.latency_target = latency_target
+        # Start at the ceiling and let throttling bring the limit down to what the provider allows
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self._cond = threading.Condition()
+
+    def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+        return None if deadline is None else deadline - time.monotonic()
+
+    def _take_tokens(self, deadline: Optional[float]) -> bool:
+        for limiter in (self.key_limiter, self.provider_limiter):
+            if limiter is not None and not limiter.acquire(timeout=self._remaining(deadline)):
+                return False
+        return True
+
+    def _enter(self, deadline: Optional[float]) -> bool:
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                remaining = self._remaining(deadline)
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(timeout=remaining)
+            self.in_flight += 1
+            return True
+
+    def _leave(self, started: float, congested: bool) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            if congested:
+                # Calls started before the last decrease saw the old limit, they do not count again
+                if started >= self.last_decrease:
+                    self.limit = max(float(self.min_concurrency), self.limit * self.decrease)
+                    self.last_decrease = time.monotonic()
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def backoff(self, attempt: int, error: BaseException) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        asked = retry_after(error)
+        return max(delay, min(asked, self.max_delay)) if asked is not None else delay
+
+    def call(self, fn: Callable[[Optional[float]], Any], timeout: Optional[float] = None, budget=None) -> Any:
+        """
+        Run `fn(timeout)` with rate limits, a concurrency slot and retries.
+
+        Parameters:
+        fn (Callable): The call; it gets the timeout in seconds it must give up after.
+        timeout (float): A shorter timeout for this call than the lane's.
+        budget (GenerationBudget): Optional; its deadline bounds every wait, attempt and backoff.
+
+        Raises:
+        BudgetExhausted: If the budget's deadline passes before the call could be made.
+        Exception: The error of the last attempt, or the first one not worth retrying.
+        """
+        remaining = budget.remaining_time() if budget is not None else None
+        deadline = time.monotonic() + remaining if remaining is not None else None
+
+        for attempt in range(self.attempts):
+            if not self._take_tokens(deadline) or not self._enter(deadline):
+                budget.expired()
+                raise BudgetExhausted(budget.reason or "deadline")
+
+            limits = [value for value in (self.timeout, timeout, self._remaining(deadline)) if value is not None]
+            started = time.monotonic()
+            congested = False
+            try:
+                result = fn(min(limits) if limits else None)
+                congested = self.latency_target is not None and time.monotonic() - started > self.latency_target
+                return result
+            except Exception as e:
+                kind = classify(e)
+                congested = kind == "throttled"
+                if kind == "throttled":
+                    self.throttled += 1
+                    Metrics.METRICS.inc("rmg_call_throttled_total", provider=self.provider)
+                delay = self.backoff(attempt, e)
+                remaining = self._remaining(deadline)
+                if kind is None or attempt == self.attempts - 1 or (remaining is not None and delay >= remaining):
+                    self.failures += 1
+                    Metrics.METRICS.inc("rmg_call_failures_total", provider=self.provider)
+                    raise
+                self.retries += 1
+                Metrics.METRICS.inc("rmg_call_retries_total", provider=self.provider, reason=kind)
+            finally:
+                self.calls += 1
+                self._leave(started, congested)
+            time.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "concurrency_limit": self.limit,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "failures": self.failures,
+            }
+
+class CallController:
+    """
+    Shared controller of outbound LLM and Serper calls, one CallLane per provider and API key.
+
+    `provider_rates` and `key_rates` map a provider name to the calls per second allowed to
+    the whole provider and to each of its keys; providers left out are not rate limited. Up
+    to `max_lanes` lanes are kept, the least recently used idle ones are dropped beyond that.
+    """
+
+    def __init__(self, provider_rates: Optional[Dict[str, float]] = None, key_rates: Optional[Dict[str, float]] = None, max_concurrency: int = 16, min_concurrency: int = 1, attempts: int = 4, timeout: Optional[float] = 60.0, base_delay: float = 0.5, max_delay: float = 20.0, decrease: float = 0.5, latency_target: Optional[float] = None, max_lanes: int = 256):
+        self.key_rates = key_rates or {}
+        self.settings = dict(max_concurrency=max_concurrency, min_concurrency=min_concurrency, attempts=attempts, timeout=timeout, base_delay=base_delay, max_delay=max_delay, decrease=decrease, latency_target=latency_target)
+        self.max_lanes = max_lanes
+        self.provider_limiters = {provider: RateLimiter(rate, name=provider) for provider, rate in (provider_rates or {}).items()}
+        self._lanes: "OrderedDict[Tuple[str, str], CallLane]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _digest(self, api_key: Optional[str]) -> str:
+        # Keys are never kept or reported, only a short digest of them
+        return hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+
+    def lane(self, provider: str, api_key: Optional[str] = None) -> CallLane:
+        """The lane of `provider` for `api_key`, created on first use."""
+        key = (provider, self._digest(api_key))
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                rate = self.key_rates.get(provider)
+                key_limiter = RateLimiter(rate, name=f"{provider}_key") if rate else None
+                lane = CallLane(provider, key_limiter, self.provider_limiters.get(provider), **self.settings)
+                self._lanes[key] = lane
+                self._evict()
+            self._lanes.move_to_end(key)
+            return lane
+
+    def _evict(self) -> None:
+        for key in list(self._lanes):
+            if len(self._lanes) <= self.max_lanes:
+                break
+            if self._lanes[key].in_flight == 0:
+                del self._lanes[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lanes = list(self._lanes.items())
+        return {f"{provider}:{digest}": lane.stats() for (provider, digest), lane in lanes}
@@ -0,0 +1,121 @@
+import re
+import zlib
+from typing import Dict, Hashable, Iterable, List, Sequence, Set
+
+import numpy as np
+
+# Words that say little about what a topic is; "Basics of Linear Algebra" should block with "Linear Algebra"
+STOPWORDS = {
+    "a", "an", "and", "the", "of", "to", "in", "for", "on", "with", "by", "from", "into", "at", "as", "or",
+    "is", "are", "its", "it", "this", "that", "how", "what", "using", "use",
+    "basic", "basics", "introduction", "intro", "fundamental", "fundamentals", "overview", "principle",
+    "principles", "concept", "concepts", "understanding", "learn", "learning", "topic", "topics",
+}
+
+class UnionFind:
+    """Disjoint sets with path halving and union by size."""
+
+    def __init__(self):
+        self.parent: Dict[Hashable, Hashable] = {}
+        self.size: Dict[Hashable, int] = {}
+
+    def add(self, item: Hashable) -> None:
+        if item not in self.parent:
+            self.parent[item] = item
+            self.size[item] = 1
+
+    def find(self, item: Hashable) -> Hashable:
+        self.add(item)
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, first: Hashable, second: Hashable) -> None:
+        first, second = self.find(first), self.find(second)
+        if first == second:
+            return
+        if self.size[first] < self.size[second]:
+            first, second = second, first
+        self.parent[second] = first
+        self.size[first] += self.size[second]
+
+    def union_all(self, items: Iterable[Hashable]) -> None:
+        items = iter(items)
+        first = next(items, None)
+        if first is None:
+            return
+        self.add(first)
+        for item in items:
+            self.union(first, item)
+
+    def groups(self) -> List[List[Hashable]]:
+        """Return every set, in the order its first member was added."""
+        groups: Dict[Hashable, List[Hashable]] = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return list(groups.values())
+
+class CandidateBlocker:
+    """
+    Finds clusters of possibly redundant topics locally, before any LLM call.
+
+    Titles and descriptions are reduced to normalized tokens, hashed into MinHash
+    signatures and bucketed with LSH banding. Topics sharing a bucket in any band are
+    candidates, and candidates are chained together with union-find into clusters. With
+    the default 16 bands of 4 rows, pairs above roughly 0.5 token Jaccard similarity are
+    very likely to end up in the same cluster.
+    """
+
+    # Mersenne prime 2^31 - 1 keeps the hash products inside 64 bits
+    PRIME = (1 << 31) - 1
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, self.PRIME, size=num_perm, dtype=np.int64)
+        self._b = rng.integers(0, self.PRIME, size=num_perm, dtype=np.int64)
+
+    def tokens(self, text: str) -> Set[str]:
+        words = re.findall(r"[a-z0-9+#]+", text.lower())
+        # Strip a plural "s" so "Vectors" and "Vector" match
+        return {word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word for word in words if word not in STOPWORDS}
+
+    def signature(self, tokens: Set[str]) -> np.ndarray:
+        hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) % self.PRIME for token in tokens), dtype=np.int64, count=len(tokens))
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % self.PRIME).min(axis=1)
+
+    def candidate_clusters(self, items: Dict[str, Sequence[str]]) -> List[List[str]]:
+        """
+        Group items whose text is likely to be similar.
+
+        Parameters:
+        items (Dict[str, Sequence[str]]): Item key (e.g. node title) to the texts to compare,
+        e.g. its title and its description. Each field is banded separately, so two items
+        become candidates when any one field is similar enough.
+
+        Returns:
+        List[List[str]]: Clusters of two or more keys.
+        """
+        union_find = UnionFind()
+        buckets: Dict[tuple, str] = {}
+
+        for key, fields in items.items():
+            union_find.add(key)
+            for field, text in enumerate(fields):
+                tokens = self.tokens(text or '')
+                if not tokens:
+                    continue
+                signature = self.signature(tokens)
+                for band in range(self.bands):
+                    bucket = (field, band, signature[band * self.rows:(band + 1) * self.rows].tobytes())
+                    if bucket in buckets:
+                        union_find.union(buckets[bucket], key)
+                    else:
+                        buckets[bucket] = key
+
+        return [group for group in union_find.groups() if len(group) > 1]
@@ -0,0 +1,74 @@
+from typing import Dict, FrozenSet, Iterable, Optional, Set
+
+from ..core import Metrics
+from .candidateblocker import CandidateBlocker
+
+Metrics.METRICS.describe("rmg_canonical_merges_total", "Generated topics joined to an existing near-duplicate topic")
+
+class TopicIndex:
+    """
+    Canonical topics of one roadmap, looked up as nodes are added.
+
+    A title is reduced to its normalized tokens (case, punctuation, stopwords and plural
+    "s" removed), so "Linear Algebra", "linear algebra" and "Basics of Linear Algebra"
+    share a key. Titles whose tokens differ slightly are found through an inverted token
+    index and joined when their token Jaccard similarity reaches the threshold.
+    """
+
+    def __init__(self, tokens, threshold: float):
+        self.tokens = tokens
+        self.threshold = threshold
+        self.canonical: Dict[FrozenSet[str], str] = {}
+        self.postings: Dict[str, Set[FrozenSet[str]]] = {}
+
+    def add(self, title: str) -> None:
+        key = frozenset(self.tokens(title))
+        # Titles made only of stopwords ("Introduction") are kept apart
+        if not key or key in self.canonical:
+            return
+        self.canonical[key] = title
+        for token in key:
+            self.postings.setdefault(token, set()).add(key)
+
+    def lookup(self, title: str) -> Optional[str]:
+        """The canonical title `title` is a near-duplicate of, or None."""
+        key = frozenset(self.tokens(title))
+        if not key:
+            return None
+        if key in self.canonical:
+            return self.canonical[key]
+
+        best, best_score = None, self.threshold
+        candidates = set().union(*(self.postings.get(token, ()) for token in key))
+        for candidate in candidates:
+            score = len(key & candidate) / len(key | candidate)
+            if score >= best_score:
+                best, best_score = candidate, score
+        return self.canonical[best] if best is not None else None
+
+    def resolve(self, title: str) -> str:
+        """Return the canonical title for `title`, registering it as canonical if it is new."""
+        canonical = self.lookup(title)
+        if canonical is not None:
+            Metrics.METRICS.inc("rmg_canonical_merges_total")
+            return canonical
+        self.add(title)
+        return title
+
+class TopicCanonicalizer:
+    """
+    Builds a TopicIndex per roadmap for Generator, so near-duplicate prerequisites join
+    an existing node (recorded in its "aliases") instead of becoming a leaf of their own
+    that is expanded at the next level and merged again by /mergegraph.
+    """
+
+    def __init__(self, threshold: float = 0.8, blocker: Optional[CandidateBlocker] = None):
+        # Minimum token Jaccard similarity for two different token sets to be the same topic
+        self.threshold = threshold
+        self.blocker = blocker if blocker is not None else CandidateBlocker()
+
+    def index(self, titles: Iterable[str] = ()) -> TopicIndex:
+        index = TopicIndex(self.blocker.tokens, self.threshold)
+        for title in titles:
+            index.add(title)
+        return index
@@ -0,0 +1,206 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import networkx as nx
+
+from ..core import Metrics
+from ..core.RoadmapGenerator import TopicInfo
+from .wireformat import GraphCodec
+
+Metrics.METRICS.describe("rmg_checkpoint_saves_total", "Checkpoints written by long generations")
+Metrics.METRICS.describe("rmg_checkpoint_resumes_total", "Generations resumed from a checkpoint")
+
+class CheckpointNotFound(KeyError):
+    """Raised when a resume token has no checkpoint, or it has expired."""
+
+class CheckpointedError(Exception):
+    """Raised when a pipeline fails after saving its progress; `resume_token` resumes it."""
+
+    def __init__(self, resume_token: str, cause: BaseException):
+        super().__init__(f"{type(cause).__name__}: {cause} (resume with resume_token={resume_token})")
+        self.resume_token = resume_token
+        self.cause = cause
+
+class Checkpoint:
+    """
+    Progress of one long generation: the graph so far, the number of levels it has
+    completed, the stage it is in ("generate", then "resources") and the expansions
+    already made for the level in progress.
+
+    A checkpoint is also a memo for Generator. Expansions made during a level are kept
+    here, in front of the optional shared `memo`, so a resumed level replays them instead
+    of calling the LLM again. The nodes already enriched are those carrying resources on
+    the graph.
+    """
+
+    def __init__(self, store: "CheckpointStore", token: str, meta: Dict[str, Any], stage: str = "generate", level: int = 0, graph: Optional[nx.DiGraph] = None, expansions: Optional[Dict[str, Dict[str, Any]]] = None, memo=None):
+        self.store = store
+        self.token = token
+        # The parameters of the run, e.g. prompt and depth, so it can be resumed from its token alone
+        self.meta = meta
+        self.stage = stage
+        self.level = level
+        self.graph = graph
+        self.expansions = expansions if expansions is not None else {}
+        self.memo = memo
+        self.saved_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def resumed(self) -> bool:
+        return self.graph is not None
+
+    def start(self):
+        """The (graph, levels done) to pass to Generator.iter_roadmap, or None to start from the root."""
+        return (self.graph, self.level) if self.graph is not None else None
+
+    def _key(self, model: str, main_topic: Optional[str], current_topic: str) -> str:
+        return json.dumps([model, " ".join((main_topic or '').lower().split()), " ".join(current_topic.lower().split())])
+
+    def get(self, model: str, main_topic: Optional[str], current_topic: str) -> Optional[TopicInfo]:
+        with self._lock:
+            value = self.expansions.get(self._key(model, main_topic, current_topic))
+        if value is not None:
+            return TopicInfo.model_validate(value)
+        return self.memo.get(model, main_topic, current_topic) if self.memo is not None else None
+
+    def set(self, model: str, main_topic: Optional[str], current_topic: str, info: TopicInfo) -> None:
+        with self._lock:
+            self.expansions[self._key(model, main_topic, current_topic)] = info.model_dump()
+        if self.memo is not None:
+            self.memo.set(model, main_topic, current_topic, info)
+        # Expansions of a long level are saved as they come, so a restart mid-level keeps them
+        self.save_every(self.store.interval)
+
+    # Function to record a completed generation level and save it
+    def level_done(self, graph: nx.DiGraph) -> None:
+        with self._lock:
+            self.graph = graph
+            self.level += 1
+            # The expansions of the level are on the graph now
+            self.expansions = {}
+        self.save()
+
+    # Function to move on to the next stage of the pipeline and save it
+    def advance(self, stage: str) -> None:
+        self.stage = stage
+        self.save()
+
+    def save(self) -> None:
+        self.store.save(self)
+
+    def save_every(self, interval: float) -> None:
+        """Save if the last save is more than `interval` seconds old, to bound the cost of frequent progress."""
+        with self._lock:
+            due = time.monotonic() - self.saved_at >= interval
+            if due:
+                # Expansions finishing together on worker threads save once
+                self.saved_at = time.monotonic()
+        if due:
+            self.save()
+
+class CheckpointStore:
+    """
+    Checkpoints of long generations in SQLite, keyed by a resume token.
+
+    The token is derived from the parameters of the run, so the same request made again
+    after a failure or a worker restart finds the checkpoint on its own. A checkpoint is
+    deleted once its run succeeds, and dropped after `ttl` seconds otherwise.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = 24 * 3600, interval: float = 5.0, codec: Optional[GraphCodec] = None):
+        self.path = path
+        self.ttl = ttl
+        # Least number of seconds between two saves of progress made within a stage
+        self.interval = interval
+        self.codec = codec if codec is not None else GraphCodec()
+        self.saves = 0
+        self.resumes = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS checkpoints (token TEXT PRIMARY KEY, payload BLOB NOT NULL, updated_at REAL NOT NULL)")
+
+    def token(self, *parts: Any) -> str:
+        """Build a resume token from the parameters of a run, with strings lowercased and whitespace collapsed."""
+        normalized = [" ".join(part.lower().split()) if isinstance(part, str) else part for part in parts]
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+    def _encode(self, checkpoint: Checkpoint) -> bytes:
+        with checkpoint._lock:
+            body = {
+                "meta": checkpoint.meta,
+                "stage": checkpoint.stage,
+                "level": checkpoint.level,
+                "graph": self.codec.compact(self.codec.to_data(checkpoint.graph)) if checkpoint.graph is not None else None,
+                "expansions": dict(checkpoint.expansions),
+            }
+        return gzip.compress(self.codec.dumps(body), compresslevel=5)
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        payload = self._encode(checkpoint)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO checkpoints (token, payload, updated_at) VALUES (?, ?, ?)",
+                (checkpoint.token, payload, now)
+            )
+            self.saves += 1
+            if self.ttl is not None and self.saves % 100 == 0:
+                self._conn.execute("DELETE FROM checkpoints WHERE updated_at < ?", (now - self.ttl,))
+        checkpoint.saved_at = time.monotonic()
+        Metrics.METRICS.inc("rmg_checkpoint_saves_total")
+
+    def load(self, token: str, memo=None) -> Checkpoint:
+        """
+        Load the checkpoint of a resume token.
+
+        Raises:
+        CheckpointNotFound: If there is none, or it is older than the TTL.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT payload, updated_at FROM checkpoints WHERE token = ?", (token,)).fetchone()
+        if row is None or (self.ttl is not None and row[1] < time.time() - self.ttl):
+            raise CheckpointNotFound(token)
+
+        body = json.loads(gzip.decompress(row[0]))
+        graph = self.codec.from_data(body["graph"]) if body["graph"] is not None else None
+        with self._lock:
+            self.resumes += 1
+        Metrics.METRICS.inc("rmg_checkpoint_resumes_total")
+        return Checkpoint(self, token, body["meta"], stage=body["stage"], level=body["level"], graph=graph, expansions=body["expansions"], memo=memo)
+
+    def open(self, token: str, meta: Dict[str, Any], memo=None) -> Checkpoint:
+        """The checkpoint of `token` if there is one, a new (unsaved) one otherwise."""
+        try:
+            return self.load(token, memo=memo)
+        except CheckpointNotFound:
+            return Checkpoint(self, token, meta, memo=memo)
+
+    def delete(self, token: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE token = ?", (token,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (checkpoints, stored_bytes) = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM checkpoints").fetchone()
+        return {
+            "checkpoints": checkpoints,
+            "stored_bytes": stored_bytes,
+            "saves": self.saves,
+            "resumes": self.resumes,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,138 @@
+import hashlib
+import importlib.util
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Tuple
+
+import httpx
+
+class _Entry:
+    def __init__(self, client: Any, closer: Callable[[], None]):
+        self.client = client
+        self.closer = closer
+        self.leases = 0
+        self.uses = 0
+        self.last_used = time.monotonic()
+
+class ClientRegistry:
+    """
+    Long-lived, pooled API clients shared across requests, keyed by API key.
+
+    Each key gets one OpenAI/instructor client and one Serper HTTP client backed by a
+    keep-alive connection pool (HTTP/2 when the `h2` package is installed). Clients
+    idle for longer than `idle_timeout` seconds are closed, and the least recently used
+    ones are closed once more than `max_clients` exist. Clients that are leased out are
+    never closed.
+    """
+
+    def __init__(self, max_clients: int = 64, idle_timeout: float = 600, max_connections: int = 20, max_keepalive_connections: int = 10, timeout: float = 60.0, openai_max_retries: int = 2):
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections, keepalive_expiry=idle_timeout)
+        self.timeout = timeout
+        # Retries of the OpenAI SDK itself; 0 when a CallController does the retrying
+        self.openai_max_retries = openai_max_retries
+        self.http2 = importlib.util.find_spec("h2") is not None
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _key(self, kind: str, api_key: str) -> Tuple[str, str]:
+        # Only a digest of the API key is kept as the registry key
+        return kind, hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()
+
+    def _build_http_client(self) -> httpx.Client:
+        return httpx.Client(http2=self.http2, limits=self.limits, timeout=self.timeout)
+
+    def _build_openai(self, api_key: str) -> _Entry:
+        import instructor
+        from openai import DefaultHttpxClient, OpenAI
+
+        http_client = DefaultHttpxClient(http2=self.http2, limits=self.limits, timeout=self.timeout)
+        openai_client = OpenAI(api_key=api_key, http_client=http_client, max_retries=self.openai_max_retries)
+        return _Entry(instructor.from_openai(openai_client), openai_client.close)
+
+    def _build_serper(self, api_key: str) -> _Entry:
+        http_client = self._build_http_client()
+        return _Entry(http_client, http_client.close)
+
+    @contextmanager
+    def _lease(self, kind: str, api_key: str, build: Callable[[str], _Entry]) -> Iterator[Any]:
+        key = self._key(kind, api_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                entry = build(api_key)
+                self._entries[key] = entry
+            else:
+                self.hits += 1
+            self._entries.move_to_end(key)
+            entry.leases += 1
+            entry.uses += 1
+            closing = self._evict()
+
+        for closer in closing:
+            closer()
+        try:
+            yield entry.client
+        finally:
+            with self._lock:
+                entry.leases -= 1
+                entry.last_used = time.monotonic()
+
+    def _evict(self):
+        """Drop idle and surplus entries; must hold the lock. Returns the closers to call outside it."""
+        now = time.monotonic()
+        closing = []
+        for key, entry in list(self._entries.items()):
+            too_many = len(self._entries) > self.max_clients
+            idle = now - entry.last_used > self.idle_timeout
+            if entry.leases == 0 and (too_many or idle):
+                del self._entries[key]
+                closing.append(entry.closer)
+                self.evictions += 1
+        return closing
+
+    def openai(self, api_key: str):
+        """Lease the instructor-wrapped OpenAI client for this key: `with registry.openai(key) as client:`."""
+        return self._lease("openai", api_key, self._build_openai)
+
+    def serper(self, api_key: str):
+        """Lease the pooled HTTP client used for Serper calls with this key."""
+        return self._lease("serper", api_key, self._build_serper)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            clients: Dict[str, int] = {}
+            leases = 0
+            in_use = 0
+            for (kind, _), entry in self._entries.items():
+                clients[kind] = clients.get(kind, 0) + 1
+                leases += entry.leases
+                in_use += entry.leases > 0
+            size = len(self._entries)
+            return {
+                "clients": clients,
+                "size": size,
+                "max_clients": self.max_clients,
+                "in_use": in_use,
+                "leases": leases,
+                # Share of pooled clients serving at least one request right now
+                "utilization": in_use / size if size else 0.0,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "http2": self.http2,
+            }
+
+    def close(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.closer()
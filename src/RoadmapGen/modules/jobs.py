@@ -0,0 +1,157 @@
+import contextvars
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+class JobQueueFull(Exception):
+    """Raised when the runner already holds as many running and queued jobs as it allows."""
+
+_current_job: contextvars.ContextVar[Optional["Job"]] = contextvars.ContextVar("rmg_current_job", default=None)
+
+def current_job() -> Optional["Job"]:
+    """The job the calling code runs in, or None outside JobRunner.submit_job."""
+    return _current_job.get()
+
+class Job:
+    def __init__(self, job_id: str, name: str):
+        self.id = job_id
+        self.name = name
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        # Set when the pipeline failed after saving a checkpoint it can be resumed from
+        self.resume_token = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future: Optional[Future] = None
+        # Set when the client cancels; pipelines pass it to their GenerationBudget to stop early
+        self.cancel_event = threading.Event()
+
+    def to_dict(self, include_result: bool = True) -> Dict[str, Any]:
+        data = {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.error is not None:
+            data["error"] = self.error
+        if self.resume_token is not None:
+            data["resume_token"] = self.resume_token
+        if include_result and self.status == "succeeded":
+            data["result"] = self.result
+        return data
+
+class JobRunner:
+    """
+    Runs blocking pipelines on a bounded worker pool outside the event loop.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more wait for a
+    worker. Submitting beyond that raises `JobQueueFull` so the caller can push back.
+    Finished jobs are kept for `retention` seconds so their result can be polled.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queue: int = 16, retention: float = 3600):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rmg-job")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._in_flight = 0
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> None:
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull(f"{self.max_workers} jobs running and {self.max_queue} queued")
+        with self._lock:
+            self._in_flight += 1
+
+    def _release(self, _future: Future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Run `fn` on the pool without tracking it as a pollable job."""
+        self._reserve()
+        # Run in a copy of the caller's context so per-request state (e.g. stage timings) follows the work
+        future = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        future.add_done_callback(self._release)
+        return future
+
+    def submit_job(self, name: str, fn: Callable, *args, **kwargs) -> Job:
+        """Run `fn` on the pool as a job that can be polled and cancelled by ID."""
+        self._evict_finished()
+        self._reserve()
+        job = Job(uuid.uuid4().hex, name)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.future = self._executor.submit(contextvars.copy_context().run, self._run, job, fn, args, kwargs)
+        job.future.add_done_callback(self._release)
+        return job
+
+    def _run(self, job: Job, fn: Callable, args, kwargs) -> Any:
+        if job.cancel_event.is_set():
+            return None
+        job.status = "running"
+        job.started_at = time.time()
+        _current_job.set(job)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            job.status = "cancelled" if job.cancel_event.is_set() else "failed"
+            job.error = f"{type(e).__name__}: {e}"
+            job.resume_token = getattr(e, "resume_token", None)
+            raise
+        finally:
+            job.finished_at = time.time()
+
+        if job.cancel_event.is_set():
+            # The client no longer wants the result of a job that was already running
+            job.status = "cancelled"
+            return None
+        job.result = result
+        job.status = "succeeded"
+        return result
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = "cancelled"
+            job.finished_at = time.time()
+        return job
+
+    def _evict_finished(self) -> None:
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            statuses: Dict[str, int] = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "jobs": statuses,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,35 +1,28 @@
-from typing import List, Tuple
 import networkx as nx
+import numpy as np
+
+from ..core import Metrics
 
 class sortpgscore:
-    def sortscore(self, graph: nx.DiGraph) -> List[Tuple[float, str]]:
-        pairs: List[Tuple[float, str]] = []
-        for node in graph.nodes():
-            node_data = graph.nodes[node]
-            pagerank = node_data.get('pagerank', 0.0)  # Default 0.0
-            title = node_data.get('title', '')  # Default ''
-            pairs.append((pagerank, title))
+    @Metrics.measured("graphsortattribute")
+    def graphsortattribute(self, graph: nx.DiGraph) -> nx.DiGraph:
+        """
+        Give every node a dense rank by ascending PageRank (rank 1 is the lowest score).
 
-        sorted_pairs = sorted(pairs, key=lambda x: x[0], reverse=False)
-        return sorted_pairs
+        Ranks are computed per node ID in one sort, so copies of the same title made by
+        GraphFixer each keep their own rank.
+        """
+        nodes = list(graph.nodes())
+        if not nodes:
+            return graph
 
-        
-    def graphsortattribute(self, graph: nx.DiGraph) -> nx.DiGraph:
-        pairs = self.sortscore(graph)
-        rank = 0
-        last_pagerank = None
-        
-        for pair_pagerank, pair_title in pairs:
-            # Only increment rank if the pagerank changes
-            if pair_pagerank != last_pagerank:
-                last_pagerank = pair_pagerank
-                rank += 1
-            
-            # Set the rank for all nodes with the same title
-            for node in graph.nodes():
-                node_data = graph.nodes[node]
-                title = node_data.get('title', '')
-                if title == pair_title:
-                    graph.nodes[node]['rank'] = rank
+        scores = np.fromiter(
+            (graph.nodes[node].get('pagerank', 0.0) for node in nodes),  # Default 0.0
+            dtype=np.float64,
+            count=len(nodes)
+        )
+        # np.unique sorts the distinct scores; each node's index into them is its dense rank
+        _, dense_rank = np.unique(scores, return_inverse=True)
 
+        nx.set_node_attributes(graph, dict(zip(nodes, (dense_rank + 1).tolist())), 'rank')
         return graph
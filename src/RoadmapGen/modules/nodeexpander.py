@@ -1,5 +1,6 @@
 import networkx as nx
 
+from ..core import Metrics
 from ..core.RoadmapGenerator import Generator
 from .pagerank import ranker
 from .nodefixer import GraphFixer
@@ -7,9 +8,16 @@ from .jsonranker import sortpgscore
 from .websearch import ResourceFinder
 
 class NodeExpand:
-    def __init__(self, client, SERPER_API_KEY: str):
+    def __init__(self, client, SERPER_API_KEY: str, max_workers: int = 8, cache=None, memo=None, http_client=None, llm_controller=None, serper_controller=None):
         self.client = client
         self.SERPER_API_KEY = SERPER_API_KEY
+        self.max_workers = max_workers
+        self.cache = cache
+        self.memo = memo
+        self.http_client = http_client
+        # Optional CallLanes (see CallController) for the OpenAI and Serper keys
+        self.llm_controller = llm_controller
+        self.serper_controller = serper_controller
 
     def get_child_topic_desc(self, targetnode: str, graph: nx.DiGraph) -> str:
         """
@@ -22,13 +30,9 @@ class NodeExpand:
         Returns:
         str: The title of the target node.
         """
-        try:
-            for node, data in graph.nodes(data=True):
-                if node == targetnode:
-                    return data.get('title', '')
-        except ValueError as e:
-            print(f"Error: {e}")
-        return ''
+        if not graph.has_node(targetnode):
+            return ''
+        return graph.nodes[targetnode].get('title', '')
 
     def connect_expanded_graph(self, original_graph: nx.DiGraph, expanded_graph: nx.DiGraph, targetnode: str) -> nx.DiGraph:
         """
@@ -52,6 +56,41 @@ class NodeExpand:
 
         return original_graph
     
+    def splice_subtree(self, graph: nx.DiGraph, expanded_graph: nx.DiGraph, targetnode: str) -> nx.DiGraph:
+        """
+        Tree-ify the expanded topics on their own and hang them under the target's existing ID.
+
+        The new topics are connected to the target as connect_expanded_graph does, but
+        GraphFixer only runs over this small subgraph, so nodes already in the roadmap keep
+        their IDs. A new ID that clashes with an existing one is hashed again with the target.
+        Ranking is not limited to the new nodes: their PageRank flows into every score, and
+        the rank of a node depends on all the others, so the caller ranks the whole roadmap.
+
+        Parameters:
+        graph (nx.DiGraph): The tree-ified roadmap graph, updated in place.
+        expanded_graph (nx.DiGraph): The generated topics, keyed by title.
+        targetnode (str): The target node ID.
+
+        Returns:
+        nx.DiGraph: The roadmap graph with the new subtree, not yet ranked.
+        """
+        graphfix = GraphFixer()
+        subtree = nx.DiGraph()
+        subtree.add_node(targetnode)
+        subtree = graphfix.fix_graph(self.connect_expanded_graph(subtree, expanded_graph, targetnode))
+
+        mapping = {}
+        for node, title in subtree.nodes(data='title'):
+            if title == targetnode:
+                mapping[node] = targetnode
+            elif graph.has_node(node):
+                mapping[node] = graphfix._generate_hash_id(node, targetnode)
+        subtree = nx.relabel_nodes(subtree, mapping)
+
+        graph.add_nodes_from((node, data) for node, data in subtree.nodes(data=True) if node != targetnode)
+        graph.add_edges_from(subtree.edges(data=True))
+        return graph
+
     def delete_pagerank(self, graph: nx.DiGraph) -> nx.DiGraph:
         """
         Delete PageRank attribute from the graph nodes.
@@ -82,10 +121,16 @@ class NodeExpand:
                 del graph.nodes[node]['rank']
         return graph 
     
+    @Metrics.measured("expand_target_node")
     def expand_target_node(self, targetnode: str, graph: nx.DiGraph, depth: int, retries: int) -> nx.DiGraph:
         """
         Expand the target node by generating new topics.
         
+        On a tree-ified roadmap (every node has a title) only the new subtree is
+        enriched with resources and tree-ified; it is spliced in under the target's
+        existing ID. PageRank and ranks are still recomputed over the whole roadmap,
+        warm-started from the current scores. Other roadmaps are rebuilt as a whole.
+        
         Parameters:
         targetnode (str): The target node ID.
         graph (nx.DiGraph): The roadmap graph.
@@ -95,34 +140,44 @@ class NodeExpand:
         Returns:
         nx.DiGraph: The expanded roadmap graph.
         """
-        has_child_node = any(edge[0] == targetnode for edge in graph.edges())
+        has_child_node = graph.has_node(targetnode) and graph.out_degree(targetnode) > 0
+        # Hashed IDs mean nothing to the LLM, so prompt with the title
+        target_topic = self.get_child_topic_desc(targetnode, graph) or targetnode
 
-        generator = Generator(client=self.client)
+        generator = Generator(client=self.client, max_workers=self.max_workers, memo=self.memo, controller=self.llm_controller)
 
         if has_child_node:
             # Case 1: The target node has child nodes
             topics = [
-                self.get_child_topic_desc(edge[1], graph)
-                for edge in graph.edges()
-                if edge[0] == targetnode
+                self.get_child_topic_desc(child, graph) or child
+                for child in graph.successors(targetnode)
             ]
             combined_topics = ", ".join(topics)
-            prompt = f"I want you to only generate topics about the {targetnode} but I want the topic to be an extra topic that does not exist in these topics: {combined_topics}"
+            prompt = f"I want you to only generate topics about the {target_topic} but I want the topic to be an extra topic that does not exist in these topics: {combined_topics}"
         else:
             # Case 2: The target node does not have child nodes
-            prompt = f"I want you to generate extra topics about the {targetnode}"
+            prompt = f"I want you to generate extra topics about the {target_topic}"
 
         expanded_graph = generator.generate_roadmap(prompt=prompt, depth=depth, retries=retries)
 
-        websearch = ResourceFinder(SERPER_API_KEY=self.SERPER_API_KEY)
+        websearch = ResourceFinder(SERPER_API_KEY=self.SERPER_API_KEY, cache=self.cache, http_client=self.http_client, controller=self.serper_controller)
         pagerank = ranker()
         graphfix = GraphFixer()
         titlesort = sortpgscore()
 
+        # Only the new topics are looked up, the rest of the roadmap already has its resources
+        expanded_graph = websearch.serp_recommendation_graph(graph=expanded_graph, SERPER_API_KEY=self.SERPER_API_KEY)
+
+        if graph.has_node(targetnode) and all('title' in data for _, data in graph.nodes(data=True)):
+            graph = self.splice_subtree(graph, expanded_graph, targetnode)
+            # The target is no longer a leaf left by a generation budget
+            graph.nodes[targetnode].pop('unexpanded', None)
+            graph = pagerank.get_page_rank(graph, warm_start=True)
+            return titlesort.graphsortattribute(graph)
+
         graph = self.delete_pagerank(graph)
         graph = self.delete_rank(graph)
 
-        expanded_graph = websearch.serp_recommendation_graph(graph=expanded_graph, SERPER_API_KEY=self.SERPER_API_KEY)
         expanded_graph = self.connect_expanded_graph(graph, expanded_graph, targetnode)
         expanded_graph = graphfix.fix_graph(expanded_graph)
         expanded_graph = pagerank.get_page_rank(expanded_graph)
@@ -1,51 +1,45 @@
 import hashlib
+import json
 import networkx as nx
 from tqdm import tqdm
-from typing import Dict
+from typing import Dict, Optional, Tuple
+
+from ..core import Metrics
 class GraphFixer:
-    def _generate_hash_id(self, node_id :str, src: str, node_data: Dict) -> str:
-        """Generate a unique hash ID based on the node ID, source, and its data."""
-        content = f"{node_id}-{src}-{node_data}"
+    def _generate_hash_id(self, node_id: str, src: Optional[str]) -> str:
+        """Generate a stable hash ID from the node title and the title of the parent it hangs under."""
+        # Titles may contain '-' (clean_text turns ':' into one), so the pair is encoded unambiguously
+        content = json.dumps([node_id, src])
         return hashlib.sha256(content.encode('utf-8')).hexdigest()
 
+    @Metrics.measured("fix_graph")
     def fix_graph(self, graph: nx.DiGraph) -> nx.DiGraph:
-        node_id_to_hash = {}
+        """
+        Turn the roadmap into a tree-like graph with hashed node IDs in O(V+E).
+
+        A node with several parents is duplicated once per parent, and every copy of
+        a parent is connected to the copy of each child made for that parent.
+        """
+        node_id_to_hash: Dict[Tuple[str, Optional[str]], str] = {}
         new_graph = nx.DiGraph()
+        # Keep graph-level attributes such as the partial flag of a budget-limited roadmap
+        new_graph.graph.update(graph.graph)
 
         for node in tqdm(graph.nodes(), desc="Processing nodes"):
-            in_edges = list(graph.in_edges(node))
             node_data = graph.nodes[node]
+            # Root nodes / no incoming edge nodes get a single copy keyed on None
+            parents = list(graph.predecessors(node)) or [None]
 
-            if len(in_edges) > 1:
-                # Duplicate child node for each parent (multiple incoming edges)
-                for src, _ in in_edges:
-                    new_hash_id = self._generate_hash_id(node, src, node_data)
-                    node_id_to_hash[(node, src)] = new_hash_id
-                    new_node_data = node_data.copy()
-                    new_node_data['title'] = node
-                    new_graph.add_node(new_hash_id, **new_node_data)
-            elif in_edges:
-                src = in_edges[0][0]
-                new_hash_id = self._generate_hash_id(node, src, node_data)
+            for src in parents:
+                new_hash_id = self._generate_hash_id(node, src)
                 node_id_to_hash[(node, src)] = new_hash_id
                 new_node_data = node_data.copy()
                 new_node_data['title'] = node
                 new_graph.add_node(new_hash_id, **new_node_data)
-            else:
-                # Root nodes / no incoming edge nodes
-                new_hash_id = self._generate_hash_id(node, None, node_data)
-                node_id_to_hash[(node, None)] = new_hash_id
-                new_node_data = node_data.copy()
-                new_node_data['title'] = node
-                new_graph.add_node(new_hash_id, **new_node_data)
-
-        for src, tgt in tqdm(graph.edges(), desc="Adding edges"):
-            for (src_node, tgt_node) in graph.edges():
-                new_src_hash = node_id_to_hash.get((src_node, src), node_id_to_hash.get((src_node, None)))
-                new_tgt_hash = node_id_to_hash.get((tgt_node, src_node), node_id_to_hash.get((tgt_node, None)))
 
-                if new_src_hash and new_tgt_hash:
-                    new_graph.add_edge(new_src_hash, new_tgt_hash, **graph.get_edge_data(src_node, tgt_node))
-                    # print(f"Debug: Creating edge from {new_src_hash} to {new_tgt_hash} (original {src_node} -> {tgt_node})")
+        for src_node, tgt_node, edge_data in graph.edges(data=True):
+            new_tgt_hash = node_id_to_hash[(tgt_node, src_node)]
+            for parent in list(graph.predecessors(src_node)) or [None]:
+                new_graph.add_edge(node_id_to_hash[(src_node, parent)], new_tgt_hash, **edge_data)
 
         return new_graph
@@ -1,21 +1,102 @@
 import networkx as nx
-from typing import Dict
-from tqdm import tqdm
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+import scipy.sparse
+
+from ..core import Metrics
+from ..core.Budget import GenerationBudget
 
 class ranker:
-    def pagerank_recommend(self, graph: nx.DiGraph) -> Dict[str, float]:
-        pagerank = nx.pagerank(graph)
-        pagerank = dict(sorted(pagerank.items(), key=lambda item: item[1], reverse = True))
-        return pagerank
-    
+    def __init__(self, alpha: float = 0.85, tol: float = 1.0e-6, max_iter: int = 100):
+        self.alpha = alpha
+        self.tol = tol
+        self.max_iter = max_iter
+        # Number of power iterations used by the last call, handy to check warm starts
+        self.last_iterations = 0
+        # False when the last call was stopped by a budget before converging
+        self.last_converged = True
+
+    def transition_matrix(self, graph: nx.DiGraph) -> Tuple[List[str], scipy.sparse.csr_array, np.ndarray]:
+        """
+        Build the transposed row-stochastic adjacency matrix of the graph once.
+
+        Returns:
+        Tuple: The node order, the transposed transition matrix and the dangling-node mask.
+        """
+        nodes = list(graph.nodes())
+        adjacency = nx.to_scipy_sparse_array(graph, nodelist=nodes, weight='weight', dtype=np.float64, format='csr')
+        out_weight = np.asarray(adjacency.sum(axis=1)).ravel()
+        dangling = out_weight == 0
+
+        inverse = np.zeros_like(out_weight)
+        inverse[~dangling] = 1.0 / out_weight[~dangling]
+        # Scale each CSR row in place instead of multiplying by a diagonal matrix
+        adjacency.data *= np.repeat(inverse, np.diff(adjacency.indptr))
+
+        return nodes, adjacency.T.tocsr(), dangling
+
+    def start_vector(self, nodes: List[str], nstart: Optional[Dict[str, float]]) -> np.ndarray:
+        size = len(nodes)
+        if not nstart:
+            return np.full(size, 1.0 / size)
+
+        # Nodes without a previous score (e.g. freshly expanded ones) start at the mean score
+        known = [nstart[node] for node in nodes if node in nstart]
+        fill = float(np.mean(known)) if known else 1.0 / size
+        x = np.fromiter((nstart.get(node, fill) for node in nodes), dtype=np.float64, count=size)
+        total = x.sum()
+        return x / total if total > 0 else np.full(size, 1.0 / size)
+
+    def pagerank_recommend(self, graph: nx.DiGraph, nstart: Optional[Dict[str, float]] = None, budget: Optional[GenerationBudget] = None) -> Dict[str, float]:
+        """
+        Run PageRank by power iteration on a sparse transition matrix.
+
+        Parameters:
+        graph (nx.DiGraph): The roadmap graph.
+        nstart (Dict[str, float]): Optional previous scores to warm start from.
+        budget (GenerationBudget): Optional budget; once it has run out the current,
+        unconverged scores are returned and last_converged is False.
+
+        Returns:
+        Dict[str, float]: The PageRank score of each node.
+        """
+        self.last_converged = True
+        if len(graph) == 0:
+            self.last_iterations = 0
+            return {}
+
+        nodes, transition, dangling = self.transition_matrix(graph)
+        size = len(nodes)
+        teleport = np.full(size, 1.0 / size)
+        x = self.start_vector(nodes, nstart)
+
+        for iteration in range(1, self.max_iter + 1):
+            x_last = x
+            # Rank held by dangling nodes is spread uniformly, as in nx.pagerank
+            x = self.alpha * (transition @ x_last + x_last[dangling].sum() * teleport) + (1 - self.alpha) * teleport
+            if np.abs(x - x_last).sum() < size * self.tol:
+                self.last_iterations = iteration
+                return dict(zip(nodes, x.tolist()))
+            if budget is not None and budget.expired():
+                self.last_iterations = iteration
+                self.last_converged = False
+                return dict(zip(nodes, (x / x.sum()).tolist()))
+
+        raise nx.PowerIterationFailedConvergence(self.max_iter)
+
     def pagerank_graph(self, graph: nx.DiGraph, pagerank: Dict[str, float]) -> nx.DiGraph:
-        for node in tqdm(graph.nodes ,desc = 'Ranking each nodes'):
-            new_attrs = {node : {'pagerank': pagerank[node]}}
-            old_attrs = graph.nodes[node]
-            nx.set_node_attributes(graph, {**old_attrs, **new_attrs})
+        nx.set_node_attributes(graph, pagerank, 'pagerank')
         return graph
-    
-    def get_page_rank(self, graph: nx.DiGraph) -> nx.digraph:
-        pagerank_dict = self.pagerank_recommend(graph)
+
+    @Metrics.measured("get_page_rank")
+    def get_page_rank(self, graph: nx.DiGraph, warm_start: bool = False, budget: Optional[GenerationBudget] = None) -> nx.digraph:
+        # A warm start reuses the scores already on the graph, e.g. after a small expansion
+        nstart = dict(graph.nodes(data='pagerank', default=None)) if warm_start else None
+        if nstart:
+            nstart = {node: score for node, score in nstart.items() if score is not None}
+        pagerank_dict = self.pagerank_recommend(graph, nstart=nstart, budget=budget)
         graph = self.pagerank_graph(graph, pagerank_dict)
+        if not self.last_converged:
+            graph.graph['pagerank_converged'] = False
+            graph.graph['partial'] = True
         return graph
@@ -0,0 +1,131 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, ContextManager, Dict, List, Optional
+
+import networkx as nx
+
+from ..core import Metrics
+from .websearch import ResourceFinder
+
+Metrics.METRICS.describe("rmg_prefetch_topics_total", "Topics whose resources were fetched ahead of being opened")
+Metrics.METRICS.describe("rmg_prefetch_on_demand_total", "Node resources requested before they were prefetched")
+
+class ResourcePrefetcher:
+    """
+    Fetches Serper resources of a roadmap in the background, best-ranked nodes first.
+
+    Roadmaps are returned as a ranked skeleton and their top `max_topics` titles are
+    queued in descending pagerank order, packed `topics_per_request` to a Serper request.
+    Results land in the shared ResourceCache, so resources opened later are answered
+    from it, and titles nobody opens beyond the prefetched ones never reach Serper.
+    A title opened while its chunk is still queued pulls the whole chunk forward, so
+    opening it costs no Serper request beyond the prefetch's own.
+    """
+
+    def __init__(self, finder: Callable[[str], ContextManager[ResourceFinder]], max_workers: int = 2, max_topics: int = 99, topics_per_request: Optional[int] = None):
+        # Context manager factory giving a ResourceFinder (with the shared cache) for a Serper key
+        self.finder = finder
+        self.max_topics = max_topics
+        self.topics_per_request = topics_per_request or ResourceFinder.MAX_QUERIES_PER_REQUEST // 3
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="rmg-prefetch")
+        # Title -> Future of the chunk that will fetch it, for titles queued or being fetched
+        self._pending: Dict[str, Future] = {}
+        # Future -> the titles of its chunk, until the chunk is done or cancelled
+        self._chunks: Dict[Future, List[str]] = {}
+        self._lock = threading.Lock()
+        self.scheduled = 0
+        self.on_demand = 0
+        self.waited = 0
+        self.promoted = 0
+
+    def ranked_titles(self, graph: nx.DiGraph) -> List[str]:
+        """The distinct node titles of the graph, best pagerank first."""
+        best: Dict[str, float] = {}
+        for node, data in graph.nodes(data=True):
+            title = data.get('title', node)
+            best[title] = max(best.get(title, 0.0), data.get('pagerank') or 0.0)
+        # Ties keep graph order, so the root comes before its prerequisites
+        return sorted(best, key=lambda title: -best[title])
+
+    def schedule(self, graph: nx.DiGraph, SERPER_API_KEY: str) -> int:
+        """
+        Queue the best-ranked titles of the graph for prefetching.
+
+        Returns:
+        int: The number of titles queued, leaving out those already queued.
+        """
+        titles = []
+        with self._lock:
+            for title in self.ranked_titles(graph)[:self.max_topics]:
+                if title not in self._pending:
+                    titles.append(title)
+
+            # Chunks are submitted in rank order, so the pool works through them best first
+            for start in range(0, len(titles), self.topics_per_request):
+                chunk = titles[start:start + self.topics_per_request]
+                future = self._executor.submit(Metrics.in_context(self._fetch), chunk, SERPER_API_KEY)
+                for title in chunk:
+                    self._pending[title] = future
+                self._chunks[future] = chunk
+                future.add_done_callback(lambda _future, chunk=chunk: self._land(chunk, _future))
+            self.scheduled += len(titles)
+        return len(titles)
+
+    def _fetch(self, titles: List[str], SERPER_API_KEY: str) -> None:
+        with self.finder(SERPER_API_KEY) as finder:
+            # Titles opened on demand meanwhile are already cached and are not sent again
+            fetched = 0
+            for _ in finder.serp_recommendation_batch(titles, SERPER_API_KEY):
+                fetched += 1
+        Metrics.METRICS.inc("rmg_prefetch_topics_total", fetched)
+
+    def _land(self, titles: List[str], future: Future) -> None:
+        with self._lock:
+            self._chunks.pop(future, None)
+            for title in titles:
+                if self._pending.get(title) is future:
+                    del self._pending[title]
+
+    def get(self, title: str, SERPER_API_KEY: str) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Resources of one title: fetches its prefetch chunk right away if the chunk is still
+        queued, waits for it if it is being fetched, and otherwise answers from the cache
+        or fetches the title alone.
+        """
+        with self._lock:
+            future = self._pending.get(title)
+            chunk = self._chunks.get(future) if future is not None else None
+
+        if future is not None and future.cancel():
+            # Fetching the title alone would cost a request and leave the chunk to send it again
+            self.promoted += 1
+            try:
+                self._fetch(chunk, SERPER_API_KEY)
+            except Exception:
+                # A failed prefetch is retried below for this title alone
+                pass
+        elif future is not None and not future.done():
+            self.waited += 1
+            try:
+                future.result()
+            except Exception:
+                pass
+
+        with self.finder(SERPER_API_KEY) as finder:
+            if finder.cache is None or finder.cache.get(title) is None:
+                self.on_demand += 1
+                Metrics.METRICS.inc("rmg_prefetch_on_demand_total")
+            return finder.serp_recommendation(title, SERPER_API_KEY)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queued": len(self._pending),
+                "scheduled": self.scheduled,
+                "on_demand": self.on_demand,
+                "waited": self.waited,
+                "promoted": self.promoted,
+            }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from ..core import Metrics
+
+Metrics.METRICS.describe("rmg_rate_limit_wait_seconds_total", "Time callers spent waiting for a rate limiter")
+
+class RateLimiter:
+    """
+    Token bucket shared by every thread that calls one API.
+
+    `rate` tokens are added per second up to `burst`; each call takes one token (or more)
+    and blocks until enough are available, so callers on any number of threads together
+    never go faster than the rate.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None, name: str = "default"):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.name = name
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.acquired = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take `tokens` if they are available right now, without waiting."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens < tokens:
+                return False
+            self.tokens -= tokens
+            self.acquired += 1
+            return True
+
+    def acquire(self, tokens: float = 1, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until `tokens` are available and take them.
+
+        Returns:
+        bool: False if they could not be taken within `timeout` seconds.
+        """
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    self.acquired += 1
+                    waited = now - start
+                    self.waited += waited
+                    break
+                wait = (tokens - self.tokens) / self.rate
+            if timeout is not None and now + wait > start + timeout:
+                return False
+            time.sleep(wait)
+
+        if waited > 0:
+            Metrics.METRICS.inc("rmg_rate_limit_wait_seconds_total", waited, limiter=self.name)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refill(time.monotonic())
+            return {
+                "rate": self.rate,
+                "burst": self.capacity,
+                "tokens": self.tokens,
+                "acquired": self.acquired,
+                "waited_seconds": self.waited,
+            }
@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+class LRUCache:
+    """In-process LRU cache with an optional time-to-live, safe to share between threads."""
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+class SqliteCache:
+    """
+    On-disk key/value cache backed by SQLite.
+
+    Entries expire after `ttl` seconds and the table is trimmed to `max_entries`,
+    dropping the least recently written entries first. The database runs in WAL mode
+    so several processes on the same host (e.g. uvicorn workers) can share one file.
+    """
+
+    def __init__(self, path: str, ttl: Optional[float] = None, max_entries: int = 50000, table: str = "cache"):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.table = table
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, written_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_written_at ON {self.table} (written_at)")
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        if expires_at is not None and expires_at < time.time():
+            self.delete(key)
+            return None
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, written_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires_at, now)
+            )
+            self._writes += 1
+            # Pruning scans the table, so only do it every so often
+            if self._writes % 100 == 0:
+                self._prune(now)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def prune(self) -> None:
+        with self._lock:
+            self._prune(time.time())
+
+    def _prune(self, now: float) -> None:
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+        (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY written_at ASC LIMIT ?)",
+                (count - self.max_entries,)
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class ResourceCache:
+    """
+    Two-tier cache for Serper recommendations keyed on a normalized topic string.
+
+    Lookups go to the in-process LRU first, then to the optional SQLite store. Disk
+    hits are promoted to memory. Hit/miss counters are kept per process.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: Optional[float] = 7 * 24 * 3600, memory_size: int = 2048, max_entries: int = 50000):
+        self.memory = LRUCache(maxsize=memory_size, ttl=ttl)
+        self.disk = SqliteCache(path, ttl=ttl, max_entries=max_entries, table="resources") if path else None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def normalize(self, topic: str) -> str:
+        return " ".join(topic.lower().split())
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, topic: str) -> Optional[Dict]:
+        key = self.normalize(topic)
+        value = self.memory.get(key)
+        if value is not None:
+            self._count('memory_hits')
+            return json.loads(value)
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self._count('disk_hits')
+                self.memory.set(key, json.dumps(value))
+                return value
+        self._count('misses')
+        return None
+
+    def set(self, topic: str, recommendation: Dict) -> None:
+        key = self.normalize(topic)
+        # Values are kept serialized so callers never share mutable lists between graphs
+        self.memory.set(key, json.dumps(recommendation))
+        if self.disk is not None:
+            self.disk.set(key, recommendation)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+        }
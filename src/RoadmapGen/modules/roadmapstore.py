@@ -0,0 +1,308 @@
+import gzip
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+import networkx as nx
+
+from .resourcecache import LRUCache
+from .wireformat import GraphCodec
+
+class RoadmapNotFound(KeyError):
+    """Raised when a roadmap ID or one of its versions is not in the store."""
+
+class RoadmapStore:
+    """
+    Versioned roadmap graphs kept server-side, so follow-up operations refer to a
+    `roadmap_id` instead of uploading the whole graph again.
+
+    Every operation on a roadmap adds a version. A version is stored as a diff against
+    the version it was derived from, or as a full compact snapshot when the diff touches
+    most of the graph or the diff chain has grown to `snapshot_every` links. Recently used versions are
+    kept materialized in memory; everything is persisted in SQLite (WAL mode, so
+    several workers on one host can share the file). Roadmaps not touched for `ttl`
+    seconds are dropped.
+    """
+
+    def __init__(self, path: str, memory_size: int = 64, snapshot_every: int = 16, ttl: Optional[float] = 7 * 24 * 3600, codec: Optional[GraphCodec] = None):
+        self.path = path
+        self.snapshot_every = max(1, snapshot_every)
+        self.ttl = ttl
+        self.codec = codec if codec is not None else GraphCodec()
+        self.memory = LRUCache(maxsize=memory_size)
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_loads = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS roadmaps (id TEXT PRIMARY KEY, meta BLOB NOT NULL, latest_version INTEGER NOT NULL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS roadmap_versions ("
+            "roadmap_id TEXT NOT NULL, version INTEGER NOT NULL, base_version INTEGER, chain INTEGER NOT NULL, "
+            "operation TEXT, payload BLOB NOT NULL, created_at REAL NOT NULL, PRIMARY KEY (roadmap_id, version))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS roadmaps_updated_at ON roadmaps (updated_at)")
+
+    def _memory_key(self, roadmap_id: str, version: int) -> str:
+        return f"{roadmap_id}:{version}"
+
+    # Function to compute the changes that turn graph `old` into graph `new`
+    def diff(self, old: nx.DiGraph, new: nx.DiGraph) -> Dict[str, Any]:
+        added = [node for node in new.nodes if node not in old]
+        changes = {
+            "removed_nodes": [node for node in old.nodes if node not in new],
+            "nodes": [[node, data] for node, data in new.nodes(data=True) if node not in old or old.nodes[node] != data],
+            "removed_links": [[source, target] for source, target in old.edges if not new.has_edge(source, target)],
+            "links": [
+                [source, target, data]
+                for source, target, data in new.edges(data=True)
+                if not old.has_edge(source, target) or old.edges[source, target] != data
+            ],
+        }
+        if new.graph != old.graph:
+            changes["graph"] = new.graph
+
+        # Applying the diff keeps surviving nodes in place and appends added ones; record
+        # the node order only when the new graph differs from that
+        if [node for node in old.nodes if node in new] + added != list(new.nodes):
+            changes["order"] = list(new.nodes)
+        return changes
+
+    # Function to apply a diff made by `diff` to a graph, in place
+    def apply(self, graph: nx.DiGraph, changes: Dict[str, Any]) -> nx.DiGraph:
+        graph.remove_nodes_from(changes["removed_nodes"])
+        for node, data in changes["nodes"]:
+            if node in graph:
+                graph.nodes[node].clear()
+                graph.nodes[node].update(data)
+            else:
+                graph.add_node(node, **data)
+        graph.remove_edges_from(changes["removed_links"])
+        for source, target, data in changes["links"]:
+            if graph.has_edge(source, target):
+                graph.edges[source, target].clear()
+            graph.add_edge(source, target, **data)
+        if "graph" in changes:
+            graph.graph.clear()
+            graph.graph.update(changes["graph"])
+
+        if "order" in changes:
+            ordered = graph.__class__()
+            ordered.graph.update(graph.graph)
+            ordered.add_nodes_from((node, graph.nodes[node]) for node in changes["order"])
+            ordered.add_edges_from(graph.edges(data=True))
+            return ordered
+        return graph
+
+    def _encode(self, kind: str, body: Any) -> bytes:
+        return gzip.compress(self.codec.dumps({"kind": kind, "body": body}), compresslevel=5)
+
+    def _snapshot(self, graph: nx.DiGraph) -> bytes:
+        return self._encode("snapshot", self.codec.compact(self.codec.to_data(graph)))
+
+    def create(self, graph: nx.DiGraph, meta: Optional[Dict[str, Any]] = None, operation: str = "create") -> Tuple[str, int]:
+        """
+        Store a new roadmap as version 1.
+
+        Parameters:
+        graph (nx.DiGraph): The roadmap.
+        meta (Dict): Extra fields returned with every version, e.g. the prompt.
+        operation (str): What produced the graph.
+
+        Returns:
+        Tuple[str, int]: The new roadmap ID and its version.
+        """
+        roadmap_id = uuid.uuid4().hex
+        now = time.time()
+        payload = self._snapshot(graph)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO roadmaps (id, meta, latest_version, created_at, updated_at) VALUES (?, ?, 1, ?, ?)",
+                    (roadmap_id, self.codec.dumps(meta or {}), now, now)
+                )
+                self._conn.execute(
+                    "INSERT INTO roadmap_versions (roadmap_id, version, base_version, chain, operation, payload, created_at) VALUES (?, 1, NULL, 0, ?, ?, ?)",
+                    (roadmap_id, operation, payload, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._after_write(now)
+        self.memory.set(self._memory_key(roadmap_id, 1), graph.copy())
+        return roadmap_id, 1
+
+    def commit(self, roadmap_id: str, graph: nx.DiGraph, base_version: Optional[int] = None, operation: Optional[str] = None) -> int:
+        """
+        Store `graph` as the next version of a roadmap.
+
+        Parameters:
+        roadmap_id (str): The roadmap ID.
+        graph (nx.DiGraph): The new graph.
+        base_version (int): The version the graph was derived from, the latest if None.
+        operation (str): What produced the graph, e.g. "expand".
+
+        Returns:
+        int: The new version number.
+        """
+        base, base_version = self.get(roadmap_id, base_version)
+        changes = self.diff(base, graph)
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chain FROM roadmap_versions WHERE roadmap_id = ? AND version = ?", (roadmap_id, base_version)
+            ).fetchone()
+        chain = row[0] + 1 if row is not None else self.snapshot_every
+        # A diff touching most of the graph (e.g. GraphFixer relabelling every node) is no
+        # smaller than a snapshot and only slows down reads
+        touched = len(changes["nodes"]) + len(changes["removed_nodes"])
+        if chain >= self.snapshot_every or touched * 2 > graph.number_of_nodes():
+            chain, base_version, payload = 0, None, self._snapshot(graph)
+        else:
+            payload = self._encode("diff", changes)
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT latest_version FROM roadmaps WHERE id = ?", (roadmap_id,)).fetchone()
+                if row is None:
+                    raise RoadmapNotFound(roadmap_id)
+                version = row[0] + 1
+                self._conn.execute(
+                    "INSERT INTO roadmap_versions (roadmap_id, version, base_version, chain, operation, payload, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (roadmap_id, version, base_version, chain, operation, payload, now)
+                )
+                self._conn.execute("UPDATE roadmaps SET latest_version = ?, updated_at = ? WHERE id = ?", (version, now, roadmap_id))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._after_write(now)
+        self.memory.set(self._memory_key(roadmap_id, version), graph.copy())
+        return version
+
+    def latest_version(self, roadmap_id: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT latest_version FROM roadmaps WHERE id = ?", (roadmap_id,)).fetchone()
+        if row is None:
+            raise RoadmapNotFound(roadmap_id)
+        return row[0]
+
+    def get(self, roadmap_id: str, version: Optional[int] = None) -> Tuple[nx.DiGraph, int]:
+        """
+        Load a version of a roadmap.
+
+        Returns:
+        Tuple[nx.DiGraph, int]: A copy of the graph the caller may modify, and its version.
+
+        Raises:
+        RoadmapNotFound: If the roadmap or the version does not exist.
+        """
+        if version is None:
+            version = self.latest_version(roadmap_id)
+
+        graph = self.memory.get(self._memory_key(roadmap_id, version))
+        if graph is not None:
+            self.memory_hits += 1
+            return graph.copy(), version
+
+        graph = self._materialize(roadmap_id, version)
+        self.disk_loads += 1
+        self.memory.set(self._memory_key(roadmap_id, version), graph)
+        return graph.copy(), version
+
+    def _materialize(self, roadmap_id: str, version: int) -> nx.DiGraph:
+        # Walk back to the nearest snapshot or in-memory version, then replay the diffs
+        pending = []
+        current = version
+        graph = None
+        while graph is None:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT base_version, payload FROM roadmap_versions WHERE roadmap_id = ? AND version = ?", (roadmap_id, current)
+                ).fetchone()
+            if row is None:
+                raise RoadmapNotFound(f"{roadmap_id} version {current}")
+            base_version, payload = row
+            record = self.codec.decode(payload)
+            if record["kind"] == "snapshot":
+                graph = self.codec.from_data(record["body"])
+                break
+            pending.append(record["body"])
+            cached = self.memory.get(self._memory_key(roadmap_id, base_version))
+            if cached is not None:
+                graph = cached.copy()
+                break
+            current = base_version
+
+        for changes in reversed(pending):
+            graph = self.apply(graph, changes)
+        return graph
+
+    def meta(self, roadmap_id: str) -> Dict[str, Any]:
+        with self._lock:
+            row = self._conn.execute("SELECT meta FROM roadmaps WHERE id = ?", (roadmap_id,)).fetchone()
+        if row is None:
+            raise RoadmapNotFound(roadmap_id)
+        return self.codec.decode(bytes(row[0]))
+
+    def versions(self, roadmap_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT version, base_version, operation, LENGTH(payload), created_at, chain FROM roadmap_versions WHERE roadmap_id = ? ORDER BY version",
+                (roadmap_id,)
+            ).fetchall()
+        if not rows:
+            raise RoadmapNotFound(roadmap_id)
+        return [
+            {"version": version, "base_version": base_version, "operation": operation, "stored_bytes": size, "created_at": created_at, "snapshot": chain == 0}
+            for version, base_version, operation, size, created_at, chain in rows
+        ]
+
+    def delete(self, roadmap_id: str) -> None:
+        with self._lock:
+            versions = [row[0] for row in self._conn.execute("SELECT version FROM roadmap_versions WHERE roadmap_id = ?", (roadmap_id,))]
+            self._conn.execute("DELETE FROM roadmap_versions WHERE roadmap_id = ?", (roadmap_id,))
+            self._conn.execute("DELETE FROM roadmaps WHERE id = ?", (roadmap_id,))
+        for version in versions:
+            self.memory.delete(self._memory_key(roadmap_id, version))
+
+    def _after_write(self, now: float) -> None:
+        """Drop expired roadmaps every so often; must hold the lock."""
+        self._writes += 1
+        if self.ttl is None or self._writes % 100:
+            return
+        expired = [row[0] for row in self._conn.execute("SELECT id FROM roadmaps WHERE updated_at < ?", (now - self.ttl,))]
+        for roadmap_id in expired:
+            self._conn.execute("DELETE FROM roadmap_versions WHERE roadmap_id = ?", (roadmap_id,))
+            self._conn.execute("DELETE FROM roadmaps WHERE id = ?", (roadmap_id,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (roadmaps,) = self._conn.execute("SELECT COUNT(*) FROM roadmaps").fetchone()
+            (versions, stored_bytes) = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM roadmap_versions").fetchone()
+        return {
+            "roadmaps": roadmaps,
+            "versions": versions,
+            "stored_bytes": stored_bytes,
+            "memory_entries": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "disk_loads": self.disk_loads,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
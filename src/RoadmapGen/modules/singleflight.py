@@ -0,0 +1,149 @@
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict
+
+from .resourcecache import LRUCache
+
+class SingleFlight:
+    """
+    Coalesces identical computations that are in flight at the same time.
+
+    The first caller for a key (the leader) starts the computation; callers arriving
+    while it runs get the same Future and share its result or exception. Successful
+    results are also kept for `ttl` seconds so near-simultaneous repeats are answered
+    without starting anything. Shared results must be treated as read-only.
+
+    `do` runs on a pool worker and must never wait for work still queued on that pool:
+    if the workers waiting are the ones that would run it, they wait forever. So `do`
+    only follows a flight that has started. A flight whose pooled work is still queued
+    is taken over: its work is cancelled and the caller of `do` runs it instead.
+    """
+
+    def __init__(self, ttl: float = 30.0, maxsize: int = 256):
+        self.results = LRUCache(maxsize=maxsize, ttl=ttl) if ttl > 0 else None
+        self._flights: Dict[str, Future] = {}
+        # Pool futures of flights started by `submit`, until they finish or are taken over
+        self._queued: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.takeovers = 0
+        self.cache_hits = 0
+
+    def key(self, *parts: Any) -> str:
+        """Build a key from the parts, with strings lowercased and whitespace collapsed."""
+        normalized = [" ".join(part.lower().split()) if isinstance(part, str) else part for part in parts]
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _cached(self, key: str):
+        if self.results is None:
+            return None
+        result = self.results.get(key)
+        if result is not None:
+            self.cache_hits += 1
+        return result
+
+    def submit(self, key: str, start: Callable[[], Future]) -> Future:
+        """
+        Return the in-flight Future for `key`, or call `start()` to launch one.
+
+        `start` runs under the internal lock, so it should only hand the work to a pool
+        (e.g. `lambda: runner.submit(fn, ...)`). Exceptions it raises, such as a full
+        queue, reach the caller and nothing is recorded.
+        """
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                return future
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.followers += 1
+                return flight
+
+            work = start()
+            # Callers get a Future of their own, so the flight outlives its work being taken over by `do`
+            flight = Future()
+            flight.set_running_or_notify_cancel()
+            self._flights[key] = flight
+            self._queued[key] = work
+            self.leaders += 1
+        work.add_done_callback(lambda done: self._finish(key, flight, done))
+        return flight
+
+    def _finish(self, key: str, flight: Future, work: Future) -> None:
+        # Work cancelled by `do` is run by that caller, which completes the flight itself
+        if work.cancelled():
+            return
+        error = work.exception()
+        if error is not None:
+            flight.set_exception(error)
+        else:
+            flight.set_result(work.result())
+        self._land(key, flight)
+
+    def do(self, key: str, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Run `fn(*args, **kwargs)` in this thread unless the same key is already running, then wait for that one.
+
+        A flight submitted to a pool but not started yet is run here instead of waited for.
+        """
+        with self._lock:
+            cached = self._cached(key)
+            if cached is not None:
+                return cached
+
+            flight = self._flights.get(key)
+            work = self._queued.get(key)
+            if flight is not None and work is not None and work.cancel():
+                # The leader is still queued, maybe behind this very worker: run it here
+                del self._queued[key]
+                self.takeovers += 1
+                leader = True
+            elif flight is not None:
+                # A started flight is running on another worker and does not wait on the pool
+                self.followers += 1
+                leader = False
+            else:
+                flight = Future()
+                flight.set_running_or_notify_cancel()
+                self._flights[key] = flight
+                self.leaders += 1
+                leader = True
+
+        if not leader:
+            return flight.result()
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            flight.set_exception(e)
+            self._land(key, flight)
+            raise
+        flight.set_result(result)
+        self._land(key, flight)
+        return result
+
+    def _land(self, key: str, future: Future) -> None:
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+                self._queued.pop(key, None)
+            # Failures are never cached so the next caller tries again
+            if self.results is not None and not future.cancelled() and future.exception() is None:
+                self.results.set(key, future.result())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "takeovers": self.takeovers,
+                "cache_hits": self.cache_hits,
+                "cached_results": len(self.results) if self.results is not None else 0,
+            }
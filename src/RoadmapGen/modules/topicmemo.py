@@ -0,0 +1,55 @@
+import hashlib
+import json
+import threading
+from typing import Any, Dict, Optional
+
+from ..core.RoadmapGenerator import TopicInfo
+from .resourcecache import LRUCache
+
+class TopicMemo:
+    """
+    Content-addressed memo of LLM topic expansions.
+
+    Entries are keyed by the model plus the normalized main topic and current topic,
+    so the same expansion asked for by another request (or by a node expansion) is
+    answered without calling the LLM. The topic description is left out of the key
+    because it is generated text that rarely repeats word for word.
+
+    Any store with `get(key)` and `set(key, value)` can be plugged in, e.g. an
+    `LRUCache` (LRU and optional TTL eviction, in memory) or a `SqliteCache`
+    (TTL and size cap, on disk).
+    """
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else LRUCache(maxsize=4096)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def normalize(self, text: Optional[str]) -> str:
+        return " ".join((text or '').lower().split())
+
+    def key(self, model: str, main_topic: Optional[str], current_topic: str) -> str:
+        content = json.dumps([model, self.normalize(main_topic), self.normalize(current_topic)])
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def get(self, model: str, main_topic: Optional[str], current_topic: str) -> Optional[TopicInfo]:
+        value = self.store.get(self.key(model, main_topic, current_topic))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return TopicInfo.model_validate(value)
+
+    def set(self, model: str, main_topic: Optional[str], current_topic: str, info: TopicInfo) -> None:
+        self.store.set(self.key(model, main_topic, current_topic), info.model_dump())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.store),
+        }
@@ -1,17 +1,56 @@
 import http.client
-from typing import List, Dict
+import threading
+from typing import Callable, List, Dict, Iterator, Optional, Tuple
 import json
 from tqdm import tqdm
 import networkx as nx
 
+from ..core import Metrics
+from ..core.Budget import GenerationBudget
+
+class SerperError(Exception):
+    """An error status returned by Serper; `status_code` and `headers` let callers decide to retry."""
+
+    def __init__(self, status_code: int, headers, body: str = ""):
+        super().__init__(f"Serper returned {status_code}: {body[:200]}")
+        self.status_code = status_code
+        self.headers = {key.lower(): value for key, value in headers.items()}
+
 class ResourceFinder:
-    def __init__(self, SERPER_API_KEY):
+    SERPER_HOST = "google.serper.dev"
+    # Serper's /search endpoint accepts at most 100 queries per request
+    MAX_QUERIES_PER_REQUEST = 100
+
+    def __init__(self, SERPER_API_KEY, max_queries_per_request: int = MAX_QUERIES_PER_REQUEST, timeout: float = 30.0, cache=None, http_client=None, rate_limiter=None, controller=None):
         self.SERPER_API_KEY = SERPER_API_KEY
-        
-    def call_serp(self, query: List[str], SERPER_API_KEY: str):
-        # Establish connection to the SERPER API
-        conn = http.client.HTTPSConnection("google.serper.dev")
+        # Optional ResourceCache consulted before any topic is sent to Serper
+        self.cache = cache
+        self.max_queries_per_request = max(1, min(max_queries_per_request, self.MAX_QUERIES_PER_REQUEST))
+        self.timeout = timeout
+        # Optional pooled httpx.Client shared across requests (see ClientRegistry.serper)
+        self.http_client = http_client
+        # Optional RateLimiter every Serper request waits on
+        self.rate_limiter = rate_limiter
+        # Optional CallLane (see CallController) giving requests adaptive concurrency, timeouts and backoff
+        self.controller = controller
+        # Without one, a single keep-alive connection is reused for every request made by this finder
+        self._conn = None
+        self._conn_lock = threading.Lock()
+
+    def _connection(self) -> http.client.HTTPSConnection:
+        if self._conn is None:
+            self._conn = http.client.HTTPSConnection(self.SERPER_HOST, timeout=self.timeout)
+        return self._conn
+
+    def close(self):
+        with self._conn_lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
 
+    def call_serp(self, query: List[str], SERPER_API_KEY: str, timeout: Optional[float] = None, budget: Optional[GenerationBudget] = None):
+        # A shorter timeout can be given per call, e.g. what is left of a generation budget
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
         headers = {
             'X-API-KEY': SERPER_API_KEY,
             'Content-Type': 'application/json'
@@ -19,23 +58,56 @@ class ResourceFinder:
 
         query_json = [{"q": i} for i in query]
         payload = json.dumps(query_json)
+        if self.controller is None:
+            return self.post(payload, headers, len(query_json), timeout)
+        # The controller retries throttled and transient failures and may shorten the timeout further
+        return self.controller.call(lambda limit: self.post(payload, headers, len(query_json), limit or timeout), timeout=timeout, budget=budget)
 
-        conn.request("POST", "/search", payload, headers)
+    # Function to send one Serper request, raising SerperError on an error status
+    def post(self, payload: str, headers: Dict[str, str], queries: int, timeout: float):
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        Metrics.METRICS.inc("rmg_serper_requests_total")
+        Metrics.METRICS.inc("rmg_serper_queries_total", queries)
 
-        res = conn.getresponse()
-        data = res.read()
+        if self.http_client is not None:
+            with Metrics.timed("call_serp"):
+                res = self.http_client.post(f"https://{self.SERPER_HOST}/search", content=payload, headers=headers, timeout=timeout)
+                if res.status_code >= 400:
+                    raise SerperError(res.status_code, res.headers, res.text)
+                return res.json()
 
+        with self._conn_lock, Metrics.timed("call_serp"):
+            for attempt in range(2):
+                conn = self._connection()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                try:
+                    conn.request("POST", "/search", payload, headers)
+                    res = conn.getresponse()
+                    data = res.read()
+                    break
+                except (http.client.HTTPException, ConnectionError):
+                    # The server may have closed the idle keep-alive connection, reconnect once
+                    conn.close()
+                    self._conn = None
+                    if attempt:
+                        raise
+                    Metrics.METRICS.inc("rmg_serper_retries_total")
+
+        if res.status >= 400:
+            raise SerperError(res.status, dict(res.getheaders()), data.decode("utf-8", "replace"))
         return json.loads(data.decode("utf-8"))
 
-    def serp_recommendation(self, topic: str, SERPER_API_KEY: str) -> Dict[str, List[Dict[str, str]]]:
-        query = [
+    def build_queries(self, topic: str) -> List[str]:
+        return [
             f'{topic} Books filetype:pdf',
             f'{topic} Video',
             f'{topic} Course OR Workshop'
         ]
 
-        serp_result = self.call_serp(query=query, SERPER_API_KEY=SERPER_API_KEY)
-
+    def parse_recommendation(self, serp_result: List[Dict]) -> Dict[str, List[Dict[str, str]]]:
         # Extract top 3 results for books, videos, and courses/workshops
         recommend_books = serp_result[0]['organic'][:3]
         recommend_videos = serp_result[1]['organic'][:3]
@@ -47,9 +119,91 @@ class ResourceFinder:
             "recommend_courses": recommend_courses
         }
 
-    def serp_recommendation_graph(self, graph: nx.DiGraph, SERPER_API_KEY: str) -> nx.DiGraph:
-        for node in tqdm(graph.nodes, desc = 'Building Recommendation graph'):
-            new_attrs = {node : self.serp_recommendation(node, SERPER_API_KEY)}
-            old_attrs = graph.nodes[node]
-            nx.set_node_attributes(graph, {**old_attrs, **new_attrs})
-        return graph
\ No newline at end of file
+    def serp_recommendation(self, topic: str, SERPER_API_KEY: str) -> Dict[str, List[Dict[str, str]]]:
+        if self.cache is not None:
+            recommendation = self.cache.get(topic)
+            if recommendation is not None:
+                return recommendation
+
+        query = self.build_queries(topic)
+        serp_result = self.call_serp(query=query, SERPER_API_KEY=SERPER_API_KEY)
+        recommendation = self.parse_recommendation(serp_result)
+
+        if self.cache is not None:
+            self.cache.set(topic, recommendation)
+        return recommendation
+
+    def serp_recommendation_batch(self, topics: List[str], SERPER_API_KEY: str, budget: Optional[GenerationBudget] = None) -> Iterator[Tuple[str, Dict[str, List[Dict[str, str]]]]]:
+        """
+        Look up resources for many topics, packing their queries into as few requests as possible.
+
+        Parameters:
+        topics (List[str]): The topics to look up.
+        SERPER_API_KEY (str): Serper API key.
+        budget (GenerationBudget): Optional budget; no request is started once it has run out,
+        and each request is given at most the time that is left.
+
+        Yields:
+        Tuple[str, Dict]: Each topic with its recommendations. Cached topics come first,
+        the rest follow in input order. Topics left when the budget runs out are not yielded.
+        """
+        if self.cache is not None:
+            missing = []
+            for topic in topics:
+                recommendation = self.cache.get(topic)
+                if recommendation is None:
+                    missing.append(topic)
+                else:
+                    yield topic, recommendation
+            topics = missing
+
+        queries_per_topic = len(self.build_queries(''))
+        topics_per_request = max(1, self.max_queries_per_request // queries_per_topic)
+
+        for start in range(0, len(topics), topics_per_request):
+            if budget is not None and budget.expired():
+                return
+            chunk = topics[start:start + topics_per_request]
+            query = [q for topic in chunk for q in self.build_queries(topic)]
+            timeout = budget.remaining_time() if budget is not None else None
+            serp_result = self.call_serp(query=query, SERPER_API_KEY=SERPER_API_KEY, timeout=timeout, budget=budget)
+
+            # Results come back in query order, split them back per topic
+            for index, topic in enumerate(chunk):
+                offset = index * queries_per_topic
+                recommendation = self.parse_recommendation(serp_result[offset:offset + queries_per_topic])
+                if self.cache is not None:
+                    self.cache.set(topic, recommendation)
+                yield topic, recommendation
+
+    @Metrics.measured("serp_recommendation_graph")
+    def serp_recommendation_graph(self, graph: nx.DiGraph, SERPER_API_KEY: str, batched: bool = True, budget: Optional[GenerationBudget] = None, nodes: Optional[List[str]] = None, on_found: Optional[Callable[[str], None]] = None) -> nx.DiGraph:
+        # Only `nodes` are looked up when given, e.g. those a checkpoint has no resources for yet;
+        # `on_found` is called with each node once its resources are on the graph
+        nodes = list(graph.nodes) if nodes is None else nodes
+        if batched:
+            recommendations = self.serp_recommendation_batch(nodes, SERPER_API_KEY, budget=budget)
+        else:
+            recommendations = (
+                (node, self.serp_recommendation(node, SERPER_API_KEY))
+                for node in nodes if budget is None or not budget.expired()
+            )
+
+        found = set()
+        for node, recommendation in tqdm(recommendations, total=len(nodes), desc = 'Building Recommendation graph'):
+            graph.nodes[node].update(recommendation)
+            graph.nodes[node].pop('resources_pending', None)
+            found.add(node)
+            if on_found is not None:
+                on_found(node)
+
+        if len(found) < len(nodes):
+            # Nodes the budget left without resources get empty lists and can be filled in later
+            empty = {key: [] for key in self.parse_recommendation([{'organic': []}] * len(self.build_queries('')))}
+            for node in nodes:
+                if node not in found:
+                    graph.nodes[node].update(empty, resources_pending=True)
+            graph.graph['partial'] = True
+            if budget is not None:
+                graph.graph['budget'] = budget.to_dict()
+        return graph
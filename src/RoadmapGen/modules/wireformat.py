@@ -0,0 +1,278 @@
+import gzip
+import json
+import zlib
+from typing import Any, Dict, IO, List, Optional, Tuple, Union
+
+import networkx as nx
+
+# Optional fast encoders and compressors; missing ones are simply not offered
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+class WireFormatError(ValueError):
+    """Raised when an uploaded roadmap cannot be decoded."""
+
+def _plain(obj: Any) -> Any:
+    # numpy scalars (ranks, scores) are not JSON or msgpack types
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f"Cannot encode {type(obj).__name__}")
+
+class GraphCodec:
+    """
+    Encodes roadmap graphs for the wire and decodes uploaded ones.
+
+    Besides plain node-link JSON, graphs can travel in a compact form where every
+    list-of-dict node attribute (the Serper results under recommend_books, etc.) is
+    stored once in a shared "resources" table and referenced by index, and links are
+    pairs of node indices. The compact form is sent as JSON or MessagePack, and any
+    payload may be compressed with gzip or zstd. Uploads are detected from their bytes,
+    so clients can send whichever form they received.
+    """
+
+    JSON = "application/json"
+    COMPACT_JSON = "application/vnd.rmg.compact+json"
+    MSGPACK = "application/msgpack"
+    COMPACT_FORMAT = "rmg-compact"
+    COMPACT_VERSION = 1
+
+    def __init__(self, compress_min_size: int = 1024, gzip_level: int = 5, zstd_level: int = 3, max_upload_size: int = 256 * 1024 * 1024):
+        # Payloads smaller than this are not worth compressing
+        self.compress_min_size = compress_min_size
+        self.gzip_level = gzip_level
+        self.zstd_level = zstd_level
+        # Limit on the decompressed size of an upload
+        self.max_upload_size = max_upload_size
+
+    def media_types(self) -> List[str]:
+        types = [self.JSON, self.COMPACT_JSON]
+        if msgpack is not None:
+            types.append(self.MSGPACK)
+        return types
+
+    def encodings(self) -> List[str]:
+        return (["zstd"] if zstandard is not None else []) + ["gzip"]
+
+    # Function to convert a graph to node-link data, with extra top-level keys such as the prompt
+    def to_data(self, graph: nx.DiGraph, **extra) -> Dict[str, Any]:
+        data = nx.node_link_data(graph)
+        data.update(extra)
+        return data
+
+    # Function to build a graph from node-link or compact data
+    def from_data(self, data: Dict[str, Any]) -> nx.DiGraph:
+        if not isinstance(data, dict):
+            raise WireFormatError(f"Roadmap must be an object, not {type(data).__name__}")
+        if data.get("format") == self.COMPACT_FORMAT:
+            data = self.expand(data)
+        # networkx would make up an ID for a node without one
+        if any(not isinstance(node, dict) or not isinstance(node.get("id"), str) for node in data.get("nodes", ())):
+            raise WireFormatError("Every node must be an object with a string \"id\"")
+        return nx.node_link_graph(data)
+
+    def compact(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Turn node-link data into the compact form.
+
+        Every list of dicts found on a node is replaced by the indices of its entries in
+        the shared "resources" table, so the same Serper result on many node copies is
+        sent once.
+        """
+        resources: List[Dict[str, Any]] = []
+        resource_index: Dict[bytes, int] = {}
+        resource_fields = set()
+        index_of = {}
+        nodes = []
+
+        for position, node in enumerate(data["nodes"]):
+            index_of[node["id"]] = position
+            compact_node = {}
+            for key, value in node.items():
+                if isinstance(value, list) and value and all(isinstance(entry, dict) for entry in value):
+                    resource_fields.add(key)
+                    refs = []
+                    for entry in value:
+                        fingerprint = self.dumps(entry, sort_keys=True)
+                        if fingerprint not in resource_index:
+                            resource_index[fingerprint] = len(resources)
+                            resources.append(entry)
+                        refs.append(resource_index[fingerprint])
+                    compact_node[key] = refs
+                else:
+                    compact_node[key] = value
+            nodes.append(compact_node)
+
+        links = []
+        for link in data["links"]:
+            pair = [index_of[link["source"]], index_of[link["target"]]]
+            attributes = {key: value for key, value in link.items() if key not in ("source", "target")}
+            links.append(pair + [attributes] if attributes else pair)
+
+        compact = {key: value for key, value in data.items() if key not in ("nodes", "links")}
+        compact.update({
+            "format": self.COMPACT_FORMAT,
+            "version": self.COMPACT_VERSION,
+            "resource_fields": sorted(resource_fields),
+            "resources": resources,
+            "nodes": nodes,
+            "links": links,
+        })
+        return compact
+
+    def expand(self, compact: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn compact data back into node-link data."""
+        if compact.get("version") != self.COMPACT_VERSION:
+            raise WireFormatError(f"Unsupported compact format version {compact.get('version')}")
+
+        resources = compact["resources"]
+        resource_fields = set(compact["resource_fields"])
+        nodes = []
+        try:
+            for node in compact["nodes"]:
+                nodes.append({
+                    key: [dict(resources[ref]) for ref in value] if key in resource_fields and isinstance(value, list) else value
+                    for key, value in node.items()
+                })
+
+            links = []
+            for link in compact["links"]:
+                expanded = {"source": nodes[link[0]]["id"], "target": nodes[link[1]]["id"]}
+                if len(link) > 2:
+                    expanded.update(link[2])
+                links.append(expanded)
+        except (IndexError, KeyError, TypeError) as e:
+            raise WireFormatError(f"Malformed compact roadmap: {e}")
+
+        data = {key: value for key, value in compact.items() if key not in ("format", "version", "resource_fields", "resources")}
+        data["nodes"] = nodes
+        data["links"] = links
+        return data
+
+    def dumps(self, data: Any, sort_keys: bool = False) -> bytes:
+        """Serialize to JSON bytes with the fastest available encoder."""
+        if orjson is not None:
+            option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(data, default=_plain, option=option)
+        return json.dumps(data, default=_plain, sort_keys=sort_keys, separators=(',', ':')).encode('utf-8')
+
+    def negotiate(self, accept: Optional[str], accept_encoding: Optional[str]) -> Tuple[str, Optional[str]]:
+        """
+        Pick the response media type and content encoding from the request headers.
+
+        Returns:
+        Tuple[str, Optional[str]]: The media type, and "zstd", "gzip" or None.
+        """
+        accepted = self._parse_header(accept)
+        media_type = self.JSON
+        if msgpack is not None and (self.MSGPACK in accepted or "application/x-msgpack" in accepted):
+            media_type = self.MSGPACK
+        elif self.COMPACT_JSON in accepted:
+            media_type = self.COMPACT_JSON
+
+        encodings = self._parse_header(accept_encoding)
+        encoding = next((candidate for candidate in self.encodings() if candidate in encodings), None)
+        return media_type, encoding
+
+    def _parse_header(self, value: Optional[str]) -> List[str]:
+        # Keep the values whose quality is not zero, ignoring other parameters
+        accepted = []
+        for part in (value or '').split(','):
+            name, *params = [item.strip() for item in part.split(';')]
+            if not name:
+                continue
+            quality = next((param[2:] for param in params if param.startswith('q=')), '1')
+            try:
+                if float(quality) > 0:
+                    accepted.append(name.lower())
+            except ValueError:
+                continue
+        return accepted
+
+    def encode(self, data: Dict[str, Any], media_type: str = JSON, encoding: Optional[str] = None) -> Tuple[bytes, Optional[str]]:
+        """
+        Serialize node-link data as `media_type`, compressed with `encoding` when it is worth it.
+
+        Returns:
+        Tuple[bytes, Optional[str]]: The body, and the content encoding actually applied.
+        """
+        if media_type == self.MSGPACK:
+            body = msgpack.packb(self.compact(data), use_bin_type=True, default=_plain)
+        elif media_type == self.COMPACT_JSON:
+            body = self.dumps(self.compact(data))
+        else:
+            body = self.dumps(data)
+
+        if encoding is None or len(body) < self.compress_min_size:
+            return body, None
+        if encoding == "zstd":
+            return zstandard.ZstdCompressor(level=self.zstd_level).compress(body), "zstd"
+        return gzip.compress(body, compresslevel=self.gzip_level), "gzip"
+
+    def _decompress(self, raw: bytes) -> bytes:
+        if raw.startswith(GZIP_MAGIC):
+            decompressor = zlib.decompressobj(wbits=31)
+            body = decompressor.decompress(raw, self.max_upload_size + 1)
+        elif raw.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise WireFormatError("zstd uploads need the zstandard package")
+            with zstandard.ZstdDecompressor().stream_reader(raw) as reader:
+                body = reader.read(self.max_upload_size + 1)
+        else:
+            return raw
+        if len(body) > self.max_upload_size:
+            raise WireFormatError(f"Roadmap is larger than {self.max_upload_size} bytes once decompressed")
+        return body
+
+    def decode(self, raw: bytes) -> Dict[str, Any]:
+        """
+        Parse an uploaded roadmap in any supported form (JSON or MessagePack, optionally gzip/zstd compressed).
+
+        Raises:
+        WireFormatError: If the body cannot be decompressed or parsed, or is not an object.
+        """
+        try:
+            body = self._decompress(raw)
+        except (OSError, zlib.error) as e:
+            raise WireFormatError(f"Could not decompress roadmap: {e}")
+        if not body.lstrip()[:1] in (b'{', b'['):
+            if msgpack is None:
+                raise WireFormatError("Roadmap is not JSON and msgpack is not installed")
+            try:
+                data = msgpack.unpackb(body, raw=False, strict_map_key=False)
+            except Exception as e:
+                raise WireFormatError(f"Could not parse MessagePack roadmap: {e}")
+        else:
+            try:
+                data = orjson.loads(body) if orjson is not None else json.loads(body)
+            except ValueError as e:
+                raise WireFormatError(f"Could not parse JSON roadmap: {e}")
+        if not isinstance(data, dict):
+            raise WireFormatError(f"Roadmap must be an object, not {type(data).__name__}")
+        return data
+
+    # Function to read an uploaded roadmap file into a graph
+    def read_graph(self, upload: Union[IO[bytes], bytes]) -> nx.DiGraph:
+        raw = upload if isinstance(upload, bytes) else upload.read()
+        data = self.decode(raw)
+        try:
+            return self.from_data(data)
+        except (KeyError, TypeError, AttributeError, nx.NetworkXError) as e:
+            # e.g. a node that is not an object or has no "id", or a link to an unknown index
+            raise WireFormatError(f"Malformed roadmap: {type(e).__name__}: {e}")
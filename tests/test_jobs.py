@@ -0,0 +1,68 @@
+import threading
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeLLMClient
+from src import RoadmapGen as rmg
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+def cancellable_generation(llm: FakeLLMClient, depth: int = 4):
+    # What POST /jobs does: the budget of the pipeline ends when its job is cancelled
+    def generate():
+        budget = rmg.GenerationBudget(cancel_event=rmg.current_job().cancel_event)
+        return rmg.Generator(client=llm, max_workers=1).generate_roadmap(prompt="Learn Cancelling", depth=depth, retries=2, budget=budget)
+    return generate
+
+def test_current_job_is_the_running_job():
+    runner = rmg.JobRunner(max_workers=1, max_queue=1)
+    job = runner.submit_job("probe", lambda: rmg.current_job())
+    assert job.future.result(timeout=5) is job
+    assert rmg.current_job() is None
+    runner.shutdown()
+
+def test_cancelled_running_job_stops_at_its_next_llm_call():
+    llm = FakeLLMClient(fan_out=3, latency=0.02, seed=1)
+    runner = rmg.JobRunner(max_workers=1, max_queue=1)
+    job = runner.submit_job("full", cancellable_generation(llm))
+    wait_for(lambda: llm.total_calls >= 3)
+
+    runner.cancel(job.id)
+    calls_at_cancel = llm.total_calls
+    assert job.future.result(timeout=5) is None
+
+    assert job.status == "cancelled"
+    # Only the call already in flight may complete; a full run makes 40
+    assert llm.total_calls <= calls_at_cancel + 1
+    runner.shutdown()
+
+def test_cancelled_queued_job_never_starts():
+    release = threading.Event()
+    llm = FakeLLMClient(fan_out=3, seed=2)
+    runner = rmg.JobRunner(max_workers=1, max_queue=1)
+    blocker = runner.submit_job("block", release.wait)
+    queued = runner.submit_job("full", cancellable_generation(llm))
+
+    runner.cancel(queued.id)
+    release.set()
+    blocker.future.result(timeout=5)
+
+    assert queued.status == "cancelled"
+    assert queued.started_at is None
+    assert llm.total_calls == 0
+    runner.shutdown()
+
+def test_full_runner_raises_job_queue_full():
+    release = threading.Event()
+    runner = rmg.JobRunner(max_workers=1, max_queue=1)
+    runner.submit_job("block", release.wait)
+    runner.submit_job("queued", release.wait)
+    with pytest.raises(rmg.JobQueueFull):
+        runner.submit_job("extra", release.wait)
+    release.set()
+    runner.shutdown()
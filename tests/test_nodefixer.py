@@ -0,0 +1,125 @@
+import random
+
+import networkx as nx
+import pytest
+
+from benchmarks.fakes import FakeLLMClient, FakeSerperTransport
+from src import RoadmapGen as rmg
+
+def reference_fix_graph(graph: nx.DiGraph) -> nx.DiGraph:
+    """
+    The O(V·E) GraphFixer.fix_graph from before it was made linear, kept as an oracle.
+
+    Only the hash call differs: IDs come from GraphFixer._generate_hash_id(title, parent)
+    instead of also hashing the node data, so both implementations give comparable IDs.
+    """
+    fixer = rmg.GraphFixer()
+    node_id_to_hash = {}
+    new_graph = nx.DiGraph()
+
+    for node in graph.nodes():
+        in_edges = list(graph.in_edges(node))
+        node_data = graph.nodes[node]
+
+        if len(in_edges) > 1:
+            for src, _ in in_edges:
+                new_hash_id = fixer._generate_hash_id(node, src)
+                node_id_to_hash[(node, src)] = new_hash_id
+                new_node_data = node_data.copy()
+                new_node_data['title'] = node
+                new_graph.add_node(new_hash_id, **new_node_data)
+        elif in_edges:
+            src = in_edges[0][0]
+            new_hash_id = fixer._generate_hash_id(node, src)
+            node_id_to_hash[(node, src)] = new_hash_id
+            new_node_data = node_data.copy()
+            new_node_data['title'] = node
+            new_graph.add_node(new_hash_id, **new_node_data)
+        else:
+            new_hash_id = fixer._generate_hash_id(node, None)
+            node_id_to_hash[(node, None)] = new_hash_id
+            new_node_data = node_data.copy()
+            new_node_data['title'] = node
+            new_graph.add_node(new_hash_id, **new_node_data)
+
+    for src, tgt in graph.edges():
+        for (src_node, tgt_node) in graph.edges():
+            new_src_hash = node_id_to_hash.get((src_node, src), node_id_to_hash.get((src_node, None)))
+            new_tgt_hash = node_id_to_hash.get((tgt_node, src_node), node_id_to_hash.get((tgt_node, None)))
+
+            if new_src_hash and new_tgt_hash:
+                new_graph.add_edge(new_src_hash, new_tgt_hash, **graph.get_edge_data(src_node, tgt_node))
+
+    return new_graph
+
+def generated_roadmap(depth: int, fan_out: int, vocabulary: int, seed: int) -> nx.DiGraph:
+    # A small vocabulary makes topics recur under several parents, as in real roadmaps
+    llm = FakeLLMClient(fan_out=fan_out, vocabulary=vocabulary, variant_rate=0.2, seed=seed)
+    graph = rmg.Generator(client=llm, max_workers=4).generate_roadmap(prompt=f"Learn Topic {seed}", depth=depth, retries=2)
+    with FakeSerperTransport().client() as http_client:
+        return rmg.ResourceFinder(SERPER_API_KEY="offline", http_client=http_client).serp_recommendation_graph(graph, SERPER_API_KEY="offline")
+
+def random_dag(nodes: int, edge_probability: float, seed: int) -> nx.DiGraph:
+    rng = random.Random(seed)
+    graph = nx.DiGraph()
+    titles = [f"Topic {index}" for index in range(nodes)]
+    for title in titles:
+        graph.add_node(title, description=f"About {title}")
+    for i in range(nodes):
+        for j in range(i + 1, nodes):
+            if rng.random() < edge_probability:
+                graph.add_edge(titles[i], titles[j])
+    return graph
+
+def assert_same_tree(expected: nx.DiGraph, actual: nx.DiGraph) -> None:
+    assert set(actual.nodes) == set(expected.nodes)
+    assert set(actual.edges) == set(expected.edges)
+    for node in expected.nodes:
+        assert actual.nodes[node] == expected.nodes[node]
+
+@pytest.mark.parametrize("depth, fan_out, vocabulary, seed", [
+    (2, 3, 1000, 0),
+    (3, 3, 30, 1),
+    (3, 4, 20, 2),
+    (4, 3, 40, 3),
+])
+def test_fix_graph_matches_reference_on_generated_roadmaps(depth, fan_out, vocabulary, seed):
+    roadmap = generated_roadmap(depth, fan_out, vocabulary, seed)
+    # The roadmaps must exercise the duplication of nodes with several parents
+    if vocabulary < 100:
+        assert any(roadmap.in_degree(node) > 1 for node in roadmap.nodes)
+
+    assert_same_tree(reference_fix_graph(roadmap), rmg.GraphFixer().fix_graph(roadmap))
+
+@pytest.mark.parametrize("seed", range(10))
+def test_fix_graph_matches_reference_on_random_dags(seed):
+    graph = random_dag(nodes=25, edge_probability=0.15, seed=seed)
+    assert_same_tree(reference_fix_graph(graph), rmg.GraphFixer().fix_graph(graph))
+
+def test_fix_graph_ids_come_from_title_and_parent():
+    roadmap = generated_roadmap(3, 3, 30, 1)
+    fixer = rmg.GraphFixer()
+    tree = fixer.fix_graph(roadmap)
+
+    roots = {node for node in roadmap.nodes if roadmap.in_degree(node) == 0}
+    expected_ids = {fixer._generate_hash_id(node, None) for node in roots}
+    expected_ids |= {fixer._generate_hash_id(target, source) for source, target in roadmap.edges}
+    assert set(tree.nodes) == expected_ids
+
+def test_fix_graph_ids_do_not_collide_on_dashes():
+    graph = nx.DiGraph()
+    graph.add_edge("c", "a-b")
+    graph.add_edge("b-c", "a")
+    tree = rmg.GraphFixer().fix_graph(graph)
+
+    assert tree.number_of_nodes() == 4
+    assert {data['title'] for _, data in tree.nodes(data=True)} == {"a", "a-b", "b-c", "c"}
+
+def test_fix_graph_ids_survive_refreshed_resources():
+    roadmap = generated_roadmap(3, 3, 30, 1)
+    refreshed = roadmap.copy()
+    for node in refreshed.nodes:
+        refreshed.nodes[node]['recommend_books'] = [{"title": f"New book on {node}", "link": "https://example.com"}]
+
+    fixer = rmg.GraphFixer()
+    assert set(fixer.fix_graph(refreshed).nodes) == set(fixer.fix_graph(roadmap).nodes)
@@ -0,0 +1,84 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+import networkx as nx
+
+from benchmarks.fakes import FakeSerperTransport
+from src import RoadmapGen as rmg
+
+class GatedSerperTransport(FakeSerperTransport):
+    """Holds the first request until `gate` is set, keeping the prefetch worker busy."""
+
+    def __init__(self):
+        super().__init__()
+        self.gate = threading.Event()
+        self.held = threading.Event()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if not self.held.is_set():
+            self.held.set()
+            assert self.gate.wait(timeout=5)
+        return super().handle_request(request)
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+def ranked_graph(titles: int) -> nx.DiGraph:
+    graph = nx.DiGraph()
+    for index in range(titles):
+        graph.add_node(f"Topic {index}", title=f"Topic {index}", pagerank=1.0 - index / titles)
+    return graph
+
+def prefetcher_for(transport: FakeSerperTransport, cache: rmg.ResourceCache) -> rmg.ResourcePrefetcher:
+    @contextmanager
+    def finder(SERPER_API_KEY: str):
+        with transport.client() as http_client:
+            yield rmg.ResourceFinder(SERPER_API_KEY=SERPER_API_KEY, cache=cache, http_client=http_client)
+    return rmg.ResourcePrefetcher(finder=finder, max_workers=1, topics_per_request=4)
+
+def test_opening_a_queued_title_pulls_its_chunk_forward():
+    transport = GatedSerperTransport()
+    cache = rmg.ResourceCache()
+    prefetcher = prefetcher_for(transport, cache)
+    assert prefetcher.schedule(ranked_graph(12), "offline") == 12
+    wait_for(transport.held.is_set)
+
+    # Topic 9 is in the third chunk, still queued behind the held first one
+    resources = prefetcher.get("Topic 9", "offline")
+    assert resources["recommend_books"]
+    assert all(cache.get(f"Topic {index}") is not None for index in range(8, 12))
+
+    transport.gate.set()
+    wait_for(lambda: prefetcher.stats()["queued"] == 0)
+    # Three chunks, three requests: opening the title cost nothing extra
+    assert transport.requests == 3
+    assert prefetcher.stats()["promoted"] == 1
+    assert prefetcher.stats()["on_demand"] == 0
+    prefetcher.shutdown()
+
+def test_opening_a_title_being_fetched_waits_for_its_chunk():
+    transport = GatedSerperTransport()
+    prefetcher = prefetcher_for(transport, rmg.ResourceCache())
+    prefetcher.schedule(ranked_graph(8), "offline")
+    wait_for(transport.held.is_set)
+
+    threading.Timer(0.05, transport.gate.set).start()
+    assert prefetcher.get("Topic 1", "offline")["recommend_books"]
+
+    wait_for(lambda: prefetcher.stats()["queued"] == 0)
+    assert transport.requests == 2
+    assert prefetcher.stats()["waited"] == 1
+    prefetcher.shutdown()
+
+def test_titles_beyond_the_prefetch_are_fetched_alone():
+    transport = FakeSerperTransport()
+    prefetcher = prefetcher_for(transport, rmg.ResourceCache())
+    prefetcher.get("Never scheduled", "offline")
+    assert transport.requests == 1
+    assert prefetcher.stats()["on_demand"] == 1
+    prefetcher.shutdown()
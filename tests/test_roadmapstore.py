@@ -0,0 +1,120 @@
+import random
+
+import networkx as nx
+import pytest
+
+from benchmarks.fakes import FakeLLMClient
+from src import RoadmapGen as rmg
+
+def generated_graph(seed: int = 0) -> nx.DiGraph:
+    llm = FakeLLMClient(fan_out=3, vocabulary=40, seed=seed)
+    return rmg.Generator(client=llm, max_workers=4).generate_roadmap(prompt=f"Learn Store {seed}", depth=3, retries=2)
+
+def edited(graph: nx.DiGraph, rng: random.Random, step: int) -> nx.DiGraph:
+    # A small follow-up operation: a new leaf, a changed description, sometimes a removed leaf
+    graph = graph.copy()
+    nodes = list(graph.nodes)
+    parent = rng.choice(nodes)
+    graph.add_edge(parent, f"Step {step} topic", weight=step)
+    graph.nodes[f"Step {step} topic"]['description'] = f"Added by step {step}"
+    graph.nodes[rng.choice(nodes)]['description'] = f"Rewritten at step {step}"
+    leaves = [node for node in nodes if graph.out_degree(node) == 0 and graph.in_degree(node) > 0]
+    if step % 3 == 0 and leaves:
+        graph.remove_node(rng.choice(leaves))
+    if step % 4 == 0:
+        graph.graph['partial'] = step
+    return graph
+
+def assert_same_graph(expected: nx.DiGraph, actual: nx.DiGraph) -> None:
+    assert list(actual.nodes) == list(expected.nodes)
+    assert set(actual.edges) == set(expected.edges)
+    assert actual.graph == expected.graph
+    for node in expected.nodes:
+        assert actual.nodes[node] == expected.nodes[node]
+    for source, target in expected.edges:
+        assert actual.edges[source, target] == expected.edges[source, target]
+
+@pytest.fixture
+def store_path(tmp_path):
+    return str(tmp_path / "roadmaps.sqlite3")
+
+def test_apply_of_diff_rebuilds_the_new_graph():
+    store = rmg.RoadmapStore(path=":memory:")
+    rng = random.Random(0)
+    old = generated_graph()
+    for step in range(1, 13):
+        new = edited(old, rng, step)
+        assert_same_graph(new, store.apply(old.copy(), store.diff(old, new)))
+        old = new
+
+def test_diff_records_a_changed_node_order():
+    store = rmg.RoadmapStore(path=":memory:")
+    old = nx.DiGraph([("a", "b"), ("a", "c")])
+    new = nx.DiGraph()
+    new.add_nodes_from(["c", "a", "b"])
+    new.add_edges_from(old.edges)
+    assert_same_graph(new, store.apply(old.copy(), store.diff(old, new)))
+
+def test_every_version_materializes_from_disk(store_path):
+    rng = random.Random(1)
+    store = rmg.RoadmapStore(path=store_path, snapshot_every=4)
+    graph = generated_graph(1)
+    roadmap_id, version = store.create(graph, meta={"prompt": "Learn Store 1"})
+    committed = {version: graph}
+    for step in range(1, 11):
+        graph = edited(graph, rng, step)
+        committed[store.commit(roadmap_id, graph, operation="edit")] = graph
+    store.close()
+
+    # A fresh store has nothing in memory, so every version is replayed from SQLite
+    reopened = rmg.RoadmapStore(path=store_path, snapshot_every=4)
+    for version in sorted(committed, reverse=True):
+        loaded, loaded_version = reopened.get(roadmap_id, version)
+        assert loaded_version == version
+        assert_same_graph(committed[version], loaded)
+    assert reopened.memory_hits == 0
+    assert reopened.meta(roadmap_id) == {"prompt": "Learn Store 1"}
+
+    versions = reopened.versions(roadmap_id)
+    assert [entry["version"] for entry in versions] == sorted(committed)
+    # Diff chains are cut by a snapshot every `snapshot_every` links
+    assert [entry["snapshot"] for entry in versions] == [True, False, False, False, True, False, False, False, True, False, False]
+
+def test_commit_on_an_older_version_branches_from_it(store_path):
+    store = rmg.RoadmapStore(path=store_path)
+    rng = random.Random(2)
+    base = generated_graph(2)
+    roadmap_id, _ = store.create(base)
+    store.commit(roadmap_id, edited(base, rng, 1))
+    branch = edited(base, rng, 2)
+    version = store.commit(roadmap_id, branch, base_version=1)
+
+    reopened = rmg.RoadmapStore(path=store_path)
+    assert version == 3
+    assert reopened.versions(roadmap_id)[-1]["base_version"] == 1
+    assert_same_graph(branch, reopened.get(roadmap_id)[0])
+
+def test_a_rewrite_of_most_nodes_is_stored_as_a_snapshot(store_path):
+    store = rmg.RoadmapStore(path=store_path)
+    graph = generated_graph(3)
+    roadmap_id, _ = store.create(graph)
+    store.commit(roadmap_id, rmg.GraphFixer().fix_graph(graph), operation="tree")
+    assert store.versions(roadmap_id)[-1]["snapshot"]
+
+def test_get_returns_a_copy(store_path):
+    store = rmg.RoadmapStore(path=store_path)
+    roadmap_id, _ = store.create(generated_graph(4))
+    graph, _ = store.get(roadmap_id)
+    graph.add_node("Not stored")
+    assert "Not stored" not in store.get(roadmap_id)[0]
+
+def test_unknown_roadmaps_and_versions_raise_roadmap_not_found(store_path):
+    store = rmg.RoadmapStore(path=store_path)
+    roadmap_id, _ = store.create(generated_graph(5))
+    with pytest.raises(rmg.RoadmapNotFound):
+        store.get("missing")
+    with pytest.raises(rmg.RoadmapNotFound):
+        store.get(roadmap_id, 2)
+    store.delete(roadmap_id)
+    with pytest.raises(rmg.RoadmapNotFound):
+        store.get(roadmap_id, 1)
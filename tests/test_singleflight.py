@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+
+from src import RoadmapGen as rmg
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+class Computation:
+    """A generation stand-in that counts its runs and can be held until released."""
+
+    def __init__(self, result="roadmap"):
+        self.result = result
+        self.runs = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.runs += 1
+        self.started.set()
+        assert self.release.wait(timeout=5)
+        return self.result
+
+def test_concurrent_do_calls_run_once():
+    flights = rmg.SingleFlight(ttl=0)
+    compute = Computation()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do("key", compute))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_for(lambda: flights.stats()["followers"] == 3)
+    compute.release.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == ["roadmap"] * 4
+    assert compute.runs == 1
+    assert flights.stats()["in_flight"] == 0
+
+def test_failures_are_shared_but_not_cached():
+    flights = rmg.SingleFlight(ttl=30)
+    def fail():
+        raise ValueError("provider down")
+    with pytest.raises(ValueError):
+        flights.do("key", fail)
+    assert flights.do("key", lambda: "roadmap") == "roadmap"
+    # The success is cached for the ttl
+    assert flights.do("key", lambda: "other") == "roadmap"
+
+def test_submit_followers_share_the_pooled_leader():
+    runner = rmg.JobRunner(max_workers=2, max_queue=4)
+    flights = rmg.SingleFlight(ttl=0)
+    compute = Computation()
+    first = flights.submit("key", lambda: runner.submit(compute))
+    second = flights.submit("key", lambda: runner.submit(compute))
+    compute.release.set()
+
+    assert first is second
+    assert first.result(timeout=5) == "roadmap"
+    assert compute.runs == 1
+    runner.shutdown()
+
+def test_jobs_on_a_saturated_pool_take_over_a_queued_leader():
+    # The deadlock this guards against: jobs take every worker and wait, with do(), for a
+    # leader submitted by an endpoint that is still queued behind them
+    runner = rmg.JobRunner(max_workers=2, max_queue=8)
+    flights = rmg.SingleFlight(ttl=0)
+    blockers = [Computation("blocker") for _ in range(2)]
+    for blocker in blockers:
+        runner.submit(blocker)
+    wait_for(lambda: all(blocker.started.is_set() for blocker in blockers))
+
+    compute = Computation()
+    jobs = [runner.submit_job("full", lambda: flights.do("key", compute)) for _ in range(2)]
+    endpoint = flights.submit("key", lambda: runner.submit(compute))
+    for blocker in blockers:
+        blocker.release.set()
+
+    wait_for(lambda: compute.started.is_set())
+    compute.release.set()
+    try:
+        assert endpoint.result(timeout=5) == "roadmap"
+        assert [job.future.result(timeout=5) for job in jobs] == ["roadmap", "roadmap"]
+        assert [job.status for job in jobs] == ["succeeded", "succeeded"]
+        assert compute.runs == 1
+        assert flights.stats()["takeovers"] == 1
+        assert flights.stats()["in_flight"] == 0
+    finally:
+        compute.release.set()
+        runner.shutdown()
+
+def test_a_job_follows_a_pooled_leader_that_has_started():
+    runner = rmg.JobRunner(max_workers=2, max_queue=4)
+    flights = rmg.SingleFlight(ttl=0)
+    compute = Computation()
+    endpoint = flights.submit("key", lambda: runner.submit(compute))
+    wait_for(lambda: compute.started.is_set())
+    job = runner.submit_job("full", lambda: flights.do("key", compute))
+    wait_for(lambda: flights.stats()["followers"] == 1)
+    compute.release.set()
+
+    assert endpoint.result(timeout=5) == "roadmap"
+    assert job.future.result(timeout=5) == "roadmap"
+    assert compute.runs == 1
+    assert flights.stats()["takeovers"] == 0
+    runner.shutdown()
@@ -0,0 +1,85 @@
+import gzip
+import json
+
+import networkx as nx
+import pytest
+
+from benchmarks.fakes import FakeLLMClient, FakeSerperTransport
+from src import RoadmapGen as rmg
+
+def enriched_tree(seed: int = 0) -> nx.DiGraph:
+    llm = FakeLLMClient(fan_out=3, vocabulary=30, seed=seed)
+    graph = rmg.Generator(client=llm, max_workers=4).generate_roadmap(prompt=f"Learn Wire {seed}", depth=3, retries=2)
+    with FakeSerperTransport().client() as http_client:
+        graph = rmg.ResourceFinder(SERPER_API_KEY="offline", http_client=http_client).serp_recommendation_graph(graph, SERPER_API_KEY="offline")
+    graph = rmg.ranker().get_page_rank(graph=graph)
+    return rmg.sortpgscore().graphsortattribute(rmg.GraphFixer().fix_graph(graph))
+
+def assert_same_graph(expected: nx.DiGraph, actual: nx.DiGraph) -> None:
+    assert list(actual.nodes) == list(expected.nodes)
+    assert set(actual.edges) == set(expected.edges)
+    for node in expected.nodes:
+        assert actual.nodes[node] == expected.nodes[node]
+
+@pytest.mark.parametrize("media_type", rmg.GraphCodec().media_types())
+@pytest.mark.parametrize("encoding", [None, "gzip", "zstd"])
+def test_encode_then_read_graph_round_trips(media_type, encoding):
+    codec = rmg.GraphCodec(compress_min_size=0)
+    if encoding is not None and encoding not in codec.encodings():
+        pytest.skip(f"{encoding} is not installed")
+    graph = enriched_tree()
+
+    body, applied = codec.encode(codec.to_data(graph, prompt="Learn Wire 0"), media_type, encoding)
+    assert applied == encoding
+    assert_same_graph(graph, codec.read_graph(body))
+
+def test_compact_form_stores_shared_resources_once():
+    codec = rmg.GraphCodec()
+    graph = enriched_tree()
+    data = codec.to_data(graph)
+    compact = codec.compact(data)
+
+    stored = [json.dumps(entry, sort_keys=True) for entry in compact["resources"]]
+    assert len(stored) == len(set(stored))
+    assert len(codec.dumps(compact)) < len(codec.dumps(data))
+    assert_same_graph(graph, codec.from_data(compact))
+
+def test_negotiate_prefers_msgpack_then_compact_json():
+    codec = rmg.GraphCodec()
+    assert codec.negotiate(None, None) == (codec.JSON, None)
+    assert codec.negotiate(f"{codec.COMPACT_JSON}, {codec.JSON};q=0.5", "gzip")[0] == codec.COMPACT_JSON
+    assert codec.negotiate(codec.JSON, "br, gzip;q=0") == (codec.JSON, None)
+    if codec.MSGPACK in codec.media_types():
+        assert codec.negotiate(f"{codec.MSGPACK}, {codec.COMPACT_JSON}", None)[0] == codec.MSGPACK
+
+@pytest.mark.parametrize("body", [
+    b"[]",
+    b"5",
+    b"null",
+    b"not a roadmap",
+    b"{\"nodes\": 5, \"links\": []}",
+    b"{\"nodes\": [\"a\"], \"links\": []}",
+    b"{\"nodes\": [{\"title\": \"a\"}], \"links\": []}",
+    b"{\"nodes\": [{\"id\": [\"a\"]}], \"links\": []}",
+    b"{\"nodes\": [{\"id\": \"a\"}], \"links\": [{\"source\": \"a\"}]}",
+    b"{\"nodes\": [{\"id\": \"a\"}], \"links\": [\"ab\"]}",
+    b"{\"format\": \"rmg-compact\", \"version\": 2}",
+    b"{\"format\": \"rmg-compact\", \"version\": 1}",
+    b"{\"format\": \"rmg-compact\", \"version\": 1, \"resources\": [], \"resource_fields\": [\"r\"], \"nodes\": [{\"id\": \"a\", \"r\": [3]}], \"links\": []}",
+    b"{\"format\": \"rmg-compact\", \"version\": 1, \"resources\": [], \"resource_fields\": [], \"nodes\": [{\"id\": \"a\"}], \"links\": [[0, 1]]}",
+    b"\x1f\x8bnot gzip",
+])
+def test_malformed_uploads_raise_wire_format_error(body):
+    with pytest.raises(rmg.WireFormatError):
+        rmg.GraphCodec().read_graph(body)
+
+def test_msgpack_upload_that_is_not_a_map_is_rejected():
+    msgpack = pytest.importorskip("msgpack")
+    with pytest.raises(rmg.WireFormatError):
+        rmg.GraphCodec().read_graph(msgpack.packb([1, 2, 3]))
+
+def test_decompressed_size_is_limited():
+    codec = rmg.GraphCodec(max_upload_size=1024)
+    body = gzip.compress(json.dumps({"nodes": [{"id": "a", "description": "x" * 4096}], "links": []}).encode("utf-8"))
+    with pytest.raises(rmg.WireFormatError):
+        codec.read_graph(body)